@@ -0,0 +1,292 @@
+"""
+PropStats API Benchmark
+Seeds a synthetic league into SQLite and load-tests both API versions
+
+Each app runs under uvicorn in its own process with its own database, and upstream
+calls go to the local stats.nba.com stand-in (upstream_server.py). Results are printed
+and written as JSON so runs can be compared across commits.
+
+Usage:
+  python benchmark.py --players 500 --seasons 2 --requests 200 --concurrency 8
+  python benchmark.py --apps main_v2 --output bench.json --compare baseline.json
+"""
+
+import argparse
+import importlib
+import json
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List
+
+import requests
+
+import upstream_server
+from roster import get_roster
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Season each app treats as current
+APP_SEASONS = {"main": "2025-26", "main_v2": "2024-25"}
+
+
+def season_before(season: str, n: int = 1) -> str:
+    start = int(season[:4]) - n
+    return f"{start}-{(start + 1) % 100:02d}"
+
+
+def init_app_db(app: str, db_path: str):
+    """Create the app's tables by importing it against db_path"""
+    os.environ["DATABASE_PATH"] = db_path
+    module = importlib.import_module(app)
+    if module.DB_PATH != db_path:
+        module.DB_PATH = db_path
+        module.init_db()
+    return module
+
+
+def seed_league(app: str, db_path: str, player_ids: List[str], seasons: int) -> int:
+    """Store `seasons` synthetic 82-game seasons per player in the app's schema"""
+    module = init_app_db(app, db_path)
+    roster = get_roster()
+    current = APP_SEASONS[app]
+    season_list = [season_before(current, n) for n in range(seasons)]
+
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    total = 0
+    for player_id in player_ids:
+        record = roster.get(player_id)
+        team = upstream_server.player_team(int(player_id))
+        if app == "main_v2":
+            cursor.execute("""
+                INSERT OR REPLACE INTO players
+                (player_id, full_name, first_name, last_name, team_abbreviation, position, is_active)
+                VALUES (?, ?, ?, ?, ?, ?, 1)
+            """, (player_id, record.full_name, record.first_name, record.last_name, team, "G"))
+        else:
+            cursor.execute("""
+                INSERT OR REPLACE INTO players (player_id, full_name, team_abbreviation)
+                VALUES (?, ?, ?)
+            """, (player_id, record.full_name, team))
+
+        for season in season_list:
+            payload = upstream_server.synthetic_game_log(int(player_id), season)
+            if app == "main_v2":
+                rows = module.parse_game_logs(player_id, season, payload)
+                module.store_game_logs(cursor, rows)
+            else:
+                result = payload["resultSets"][0]
+                rows = [dict(zip(result["headers"], row)) for row in result["rowSet"]]
+                cursor.executemany("""
+                    INSERT OR REPLACE INTO game_logs
+                    (player_id, game_id, game_date, opponent_abbreviation, is_home, game_result, minutes_played,
+                     points, rebounds, assists, steals, blocks, fg3m, turnovers, season, fetched_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, datetime('now'))
+                """, [
+                    (player_id, g["Game_ID"], g["GAME_DATE"], g["MATCHUP"].split()[-1],
+                     1 if "vs." in g["MATCHUP"] else 0, g["WL"], g["MIN"], g["PTS"], g["REB"],
+                     g["AST"], g["STL"], g["BLK"], g["FG3M"], g["TOV"], season)
+                    for g in rows
+                ])
+            total += len(rows)
+    conn.commit()
+    conn.close()
+    return total
+
+
+def start_app(app: str, db_path: str, port: int, upstream_url: str, upstream_interval: float) -> subprocess.Popen:
+    env = dict(os.environ)
+    env.update({
+        "DATABASE_PATH": db_path,
+        "NBA_STATS_BASE_URL": upstream_url,
+        "UPSTREAM_MIN_INTERVAL": str(upstream_interval),
+        "SNAPSHOT_PATH": db_path + ".col",
+    })
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", f"{app}:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            if requests.get(f"http://127.0.0.1:{port}/health", timeout=2).status_code == 200:
+                return process
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"{app} did not start on port {port}")
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[k]
+
+
+def run_scenario(base_url: str, paths: List[str], concurrency: int) -> Dict:
+    """Issue every path once at the given concurrency; latencies in ms"""
+    local = threading.local()
+    latencies = []
+    statuses: Dict[int, int] = {}
+    lock = threading.Lock()
+
+    def call(path: str):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        started = time.perf_counter()
+        try:
+            status = session.get(base_url + path, timeout=120).status_code
+        except requests.RequestException:
+            status = 0
+        elapsed = (time.perf_counter() - started) * 1000
+        with lock:
+            latencies.append(elapsed)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(call, paths))
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    errors = sum(n for status, n in statuses.items() if status != 200)
+    return {
+        "requests": len(paths),
+        "errors": errors,
+        "statuses": {str(k): v for k, v in sorted(statuses.items())},
+        "throughput_rps": round(len(paths) / wall, 2) if wall else 0,
+        "mean_ms": round(sum(latencies) / len(latencies), 2) if latencies else 0,
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+    }
+
+
+def scenarios(warm_ids: List[str], cold_ids: List[str], n: int, rng: random.Random) -> Dict[str, Callable[[], List[str]]]:
+    roster = get_roster()
+    fragments = [roster.get(pid).last_name[:4].lower() for pid in warm_ids if len(roster.get(pid).last_name) >= 4]
+    stats = ["points", "rebounds", "assists", "pra", "threes"]
+
+    def analysis(ids):
+        return [f"/players/{rng.choice(ids)}/analysis?stat={rng.choice(stats)}&line={rng.randint(3, 30) + 0.5}"
+                for _ in range(n)]
+
+    return {
+        "health": lambda: ["/health"] * n,
+        "search": lambda: [f"/players/search?q={rng.choice(fragments)}" for _ in range(n)],
+        "analysis_warm": lambda: analysis(warm_ids),
+        # Each cold player is requested once so every call goes upstream
+        "analysis_cold": lambda: [
+            f"/players/{pid}/analysis?stat=points&line=15.5" for pid in cold_ids[:n]
+        ],
+        "usage_check": lambda: [f"/usage/check?ip=10.0.{rng.randint(0, 255)}.{rng.randint(0, 255)}" for _ in range(n)],
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(results: List[Dict], baseline_path: str):
+    with open(baseline_path) as f:
+        baseline = {(r["app"], r["scenario"]): r for r in json.load(f)["results"]}
+    print()
+    print(f"Compared with {baseline_path}:")
+    for r in results:
+        old = baseline.get((r["app"], r["scenario"]))
+        if not old or r.get("skipped") or old.get("skipped"):
+            continue
+        d_rps = (r["throughput_rps"] - old["throughput_rps"]) / old["throughput_rps"] * 100 if old["throughput_rps"] else 0
+        d_p95 = (r["p95_ms"] - old["p95_ms"]) / old["p95_ms"] * 100 if old["p95_ms"] else 0
+        print(f"  {r['app']:<8} {r['scenario']:<14} rps {d_rps:+6.1f}%   p95 {d_p95:+6.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the PropStats API")
+    parser.add_argument("--apps", default="main,main_v2", help="Comma-separated app modules")
+    parser.add_argument("--players", type=int, default=500)
+    parser.add_argument("--seasons", type=int, default=2)
+    parser.add_argument("--requests", type=int, default=200, help="Requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--scenarios", default="health,search,analysis_warm,analysis_cold,usage_check")
+    parser.add_argument("--upstream-latency", type=float, default=0.2, help="Stand-in response latency (s)")
+    parser.add_argument("--upstream-interval", type=float, default=0.6, help="Upstream rate limit interval (s)")
+    parser.add_argument("--port", type=int, default=8901)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", help="Earlier results file to diff against")
+    args = parser.parse_args()
+
+    stand_in = upstream_server.start_in_background(port=0, synthetic=True, latency=args.upstream_latency)
+    roster_ids = [r.id for r in get_roster().records]
+    warm_ids = roster_ids[:args.players]
+    cold_ids = roster_ids[args.players:]
+    workdir = tempfile.mkdtemp(prefix="propstats-bench-")
+
+    results = []
+    for i, app in enumerate(a.strip() for a in args.apps.split(",")):
+        db_path = os.path.join(workdir, f"{app}.db")
+        started = time.perf_counter()
+        games = seed_league(app, db_path, warm_ids, args.seasons)
+        print(f"🌱 {app}: seeded {len(warm_ids)} players, {games} games in {time.perf_counter() - started:.1f}s")
+
+        port = args.port + i
+        process = start_app(app, db_path, port, stand_in.base_url, args.upstream_interval)
+        try:
+            rng = random.Random(args.seed)
+            base_url = f"http://127.0.0.1:{port}"
+            for name, make_paths in scenarios(warm_ids, cold_ids, args.requests, rng).items():
+                if name not in args.scenarios.split(","):
+                    continue
+                paths = make_paths()
+                if not paths:
+                    continue
+                # Cold players must stay cold, so only probe the route on other scenarios
+                probe_path = "/health" if name == "analysis_cold" else paths[0]
+                if requests.get(base_url + probe_path, timeout=120).status_code == 404:
+                    results.append({"app": app, "scenario": name, "skipped": "endpoint not available"})
+                    print(f"   {name:<14} skipped (404)")
+                    continue
+                result = {"app": app, "scenario": name, "concurrency": args.concurrency}
+                result.update(run_scenario(base_url, paths, args.concurrency))
+                results.append(result)
+                print(f"   {name:<14} {result['throughput_rps']:>8.1f} rps   p50 {result['p50_ms']:>8.1f} ms   "
+                      f"p95 {result['p95_ms']:>8.1f} ms   p99 {result['p99_ms']:>8.1f} ms   errors {result['errors']}")
+        finally:
+            process.terminate()
+            process.wait(timeout=10)
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "config": vars(args),
+        "upstream": stand_in.RequestHandlerClass.config.counts,
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"📄 Results written to {args.output}")
+
+    if args.compare:
+        compare(results, args.compare)
+    stand_in.shutdown()
+
+
+if __name__ == "__main__":
+    main()
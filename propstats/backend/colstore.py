@@ -0,0 +1,315 @@
+"""
+PropStats Columnar Snapshot
+Compact, memory-mapped copy of game_logs shared by every API worker
+
+File layout:
+    MAGIC (8 bytes) | header length (uint32) | JSON header | padding
+    column blocks, each 64-byte aligned, rows sorted by player then date (newest first)
+
+Workers open the file read-only with np.memmap, so every process shares the
+same page cache and reads are zero-copy NumPy views. The exporter writes to a
+temp file and os.replace()s it, so readers never see a half-written snapshot.
+
+The header records the highest game_logs id exported. Every write gets a new
+AUTOINCREMENT id, so a player whose stored games have the same count and no id
+above it reads exactly what the snapshot holds (see is_current).
+"""
+
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from datetime import date, datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH", "game_logs.col")
+RECHECK_SECONDS = 5  # How often workers look for a newer snapshot
+
+MAGIC = b"PSCOL001"
+ALIGN = 64
+EPOCH = date(2000, 1, 1)
+
+# Snapshot column -> (dtype, source columns in preference order).
+# main.py, main_v2.py and populate_data.py name some game_logs columns differently.
+COLUMNS = {
+    "game_date": ("int16", ["game_day", "game_date"]),
+    "season": ("int16", ["season"]),
+    "opponent": ("int16", ["opponent_abbreviation", "opponent"]),
+    "is_home": ("int16", ["is_home"]),
+    "win": ("int16", ["game_result", "result"]),
+    "minutes": ("float32", ["minutes_played", "minutes"]),
+    "points": ("int16", ["points"]),
+    "rebounds": ("int16", ["rebounds", "total_rebounds"]),
+    "assists": ("int16", ["assists"]),
+    "steals": ("int16", ["steals"]),
+    "blocks": ("int16", ["blocks"]),
+    "fg3m": ("int16", ["fg3m"]),
+    "turnovers": ("int16", ["turnovers"]),
+}
+
+# Same stats as the analysis endpoint's SQL stat_map
+STAT_COLUMNS = {
+    "points": ("points",),
+    "rebounds": ("rebounds",),
+    "assists": ("assists",),
+    "threes": ("fg3m",),
+    "steals": ("steals",),
+    "blocks": ("blocks",),
+    "turnovers": ("turnovers",),
+    "pra": ("points", "rebounds", "assists"),
+    "pr": ("points", "rebounds"),
+    "pa": ("points", "assists"),
+    "ra": ("rebounds", "assists"),
+}
+DOUBLE_DOUBLE_COLUMNS = ("points", "rebounds", "assists", "steals", "blocks")
+
+
+def parse_game_date(value) -> Optional[date]:
+    """nba_api dates look like 'APR 14, 2024'; older rows use ISO dates"""
+    if not value:
+        return None
+    value = str(value)
+    try:
+        if ", " in value:
+            return datetime.strptime(value.title(), "%b %d, %Y").date()
+        return datetime.strptime(value[:10], "%Y-%m-%d").date()
+    except ValueError:
+        return None
+
+
+def format_game_date(days: int) -> str:
+    return date.fromordinal(EPOCH.toordinal() + int(days)).strftime("%b %d, %Y").upper()
+
+
+def format_season(start_year: int) -> str:
+    return f"{start_year}-{(start_year + 1) % 100:02d}"
+
+
+def _aligned(n: int) -> int:
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+
+def export_snapshot(db_path: str, out_path: str = SNAPSHOT_PATH) -> Dict:
+    """Write every game_logs row into a columnar snapshot and atomically swap it in"""
+    started = time.perf_counter()
+
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    # table_xinfo also lists generated columns such as game_day
+    available = {row[1] for row in conn.execute("PRAGMA table_xinfo(game_logs)")}
+    select = []
+    for name, (dtype, candidates) in COLUMNS.items():
+        source = next((c for c in candidates if c in available), None)
+        select.append(source or "NULL")
+    # One read transaction, so max_id describes exactly the rows read
+    conn.execute("BEGIN")
+    # Newest id first: the stable sort below then breaks same-day ties the way the SQL index does
+    rows = conn.execute(
+        f"SELECT CAST(player_id AS INTEGER), {', '.join(select)} FROM game_logs ORDER BY id DESC"
+    ).fetchall()
+    max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM game_logs").fetchone()[0]
+    conn.execute("COMMIT")
+    conn.close()
+
+    n = len(rows)
+    player_col = np.fromiter((r[0] or 0 for r in rows), dtype=np.int32, count=n)
+
+    date_cache = {}
+    teams: Dict[str, int] = {}
+    raw = {name: [] for name in COLUMNS}
+    names = list(COLUMNS)
+    for r in rows:
+        for i, name in enumerate(names, start=1):
+            raw[name].append(r[i])
+
+    def to_days(v):
+        if v not in date_cache:
+            d = parse_game_date(v)
+            date_cache[v] = (d - EPOCH).days if d else 0
+        return date_cache[v]
+
+    data = {
+        "game_date": np.array([to_days(v) for v in raw["game_date"]], dtype=np.int16),
+        "season": np.array([int(str(v)[:4]) if v else 0 for v in raw["season"]], dtype=np.int16),
+        "opponent": np.array([teams.setdefault(v or "", len(teams)) for v in raw["opponent"]], dtype=np.int16),
+        "win": np.array([1 if v == "W" else 0 if v == "L" else -1 for v in raw["win"]], dtype=np.int16),
+        "minutes": np.array([v or 0 for v in raw["minutes"]], dtype=np.float32),
+    }
+    for name, (dtype, _) in COLUMNS.items():
+        if name not in data:
+            data[name] = np.array([v or 0 for v in raw[name]], dtype=dtype)
+
+    # Player ascending, newest game first within each player
+    order = np.lexsort((-data["game_date"].astype(np.int32), player_col))
+    player_col = player_col[order]
+    for name in data:
+        data[name] = data[name][order]
+
+    player_ids, starts = np.unique(player_col, return_index=True)
+    offsets = np.append(starts, n).astype(np.int32)
+
+    blocks = [("player_ids", player_ids.astype(np.int32)), ("offsets", offsets)]
+    blocks += [(name, data[name]) for name in COLUMNS]
+
+    layout = {}
+    cursor = 0
+    for name, arr in blocks:
+        layout[name] = {"dtype": arr.dtype.str, "offset": cursor, "length": int(arr.shape[0])}
+        cursor = _aligned(cursor + arr.nbytes)
+
+    header = json.dumps({
+        "rows": n,
+        "players": int(player_ids.shape[0]),
+        "teams": sorted(teams, key=teams.get),
+        "max_id": max_id,
+        "generated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "columns": layout,
+    }).encode()
+    data_start = _aligned(len(MAGIC) + 4 + len(header))
+
+    tmp_path = f"{out_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(np.uint32(len(header)).tobytes())
+        f.write(header)
+        for name, arr in blocks:
+            f.seek(data_start + layout[name]["offset"])
+            f.write(arr.tobytes())
+        f.truncate(data_start + cursor)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, out_path)
+
+    size = data_start + cursor
+    elapsed = time.perf_counter() - started
+    print(f"✅ Snapshot: {n} games, {player_ids.shape[0]} players -> {out_path} "
+          f"({size / 1024:.1f} KB, {elapsed:.2f}s)")
+    return {"rows": n, "players": int(player_ids.shape[0]), "max_id": max_id, "bytes": size,
+            "seconds": round(elapsed, 3)}
+
+
+def source_version(conn) -> tuple:
+    """(highest id, row count) of game_logs; any insert, replace or delete changes it"""
+    return tuple(conn.execute("SELECT COALESCE(MAX(id), 0), COUNT(*) FROM game_logs").fetchone())
+
+
+class ColumnarSnapshot:
+    """Read-only, memory-mapped view over an exported snapshot"""
+
+    def __init__(self, path: str):
+        self.path = path
+        st = os.stat(path)
+        self.file_id = (st.st_ino, st.st_mtime_ns)
+
+        buf = np.memmap(path, dtype=np.uint8, mode="r")
+        if bytes(buf[:len(MAGIC)]) != MAGIC:
+            raise ValueError(f"{path} is not a PropStats snapshot")
+        header_len = int(buf[len(MAGIC):len(MAGIC) + 4].view(np.uint32)[0])
+        header_start = len(MAGIC) + 4
+        self.header = json.loads(bytes(buf[header_start:header_start + header_len]))
+        data_start = _aligned(header_start + header_len)
+
+        self.columns: Dict[str, np.ndarray] = {}
+        for name, spec in self.header["columns"].items():
+            dtype = np.dtype(spec["dtype"])
+            start = data_start + spec["offset"]
+            self.columns[name] = buf[start:start + spec["length"] * dtype.itemsize].view(dtype)
+
+        self.player_ids = self.columns.pop("player_ids")
+        self.offsets = self.columns.pop("offsets")
+        self.teams: List[str] = self.header["teams"]
+
+    def __len__(self) -> int:
+        return self.header["rows"]
+
+    def player_range(self, player_id) -> Optional[slice]:
+        pid = int(player_id)
+        i = int(np.searchsorted(self.player_ids, pid))
+        if i >= len(self.player_ids) or self.player_ids[i] != pid:
+            return None
+        return slice(int(self.offsets[i]), int(self.offsets[i + 1]))
+
+    def player_games(self, player_id) -> Optional[Dict[str, np.ndarray]]:
+        """Zero-copy column views for one player's games, newest first"""
+        rng = self.player_range(player_id)
+        if rng is None:
+            return None
+        return {name: col[rng] for name, col in self.columns.items()}
+
+    def is_current(self, games: Dict[str, np.ndarray], stored_count: int, stored_max_id: Optional[int]) -> bool:
+        """Whether one player's snapshot games match game_logs: same count, nothing written since export"""
+        # Snapshots from before max_id was recorded are never trusted
+        exported_max_id = self.header.get("max_id", -1)
+        return len(games["season"]) == stored_count and (stored_max_id or 0) <= exported_max_id
+
+    def analysis_rows(self, games: Dict[str, np.ndarray], stat: str, limit: int = 50) -> List[tuple]:
+        """Rows shaped like the analysis endpoint's SQL result"""
+        games = {name: col[:limit] for name, col in games.items()}
+        if stat == "double_double":
+            value = sum((games[c] >= 10).astype(np.int16) for c in DOUBLE_DOUBLE_COLUMNS)
+        else:
+            value = sum(games[c].astype(np.int32) for c in STAT_COLUMNS[stat])
+
+        results = {1: "W", 0: "L", -1: ""}
+        return list(zip(
+            [format_game_date(d) for d in games["game_date"].tolist()],
+            [self.teams[i] for i in games["opponent"].tolist()],
+            value.tolist(),
+            games["is_home"].tolist(),
+            [results[w] for w in games["win"].tolist()],
+            games["minutes"].tolist(),
+            games["points"].tolist(),
+            games["rebounds"].tolist(),
+            games["assists"].tolist(),
+            games["fg3m"].tolist(),
+            games["steals"].tolist(),
+            games["blocks"].tolist(),
+            games["turnovers"].tolist(),
+            [format_season(s) for s in games["season"].tolist()],
+        ))
+
+    def stats(self) -> Dict:
+        return {
+            "path": self.path,
+            "rows": self.header["rows"],
+            "players": self.header["players"],
+            "max_id": self.header.get("max_id"),
+            "generated_at": self.header["generated_at"],
+        }
+
+
+_snapshot: Optional[ColumnarSnapshot] = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def get_snapshot(path: str = SNAPSHOT_PATH) -> Optional[ColumnarSnapshot]:
+    """This worker's mapping of the latest snapshot, or None if none was exported"""
+    global _snapshot, _checked_at
+    now = time.monotonic()
+    if _snapshot is not None and now - _checked_at < RECHECK_SECONDS:
+        return _snapshot
+
+    with _lock:
+        _checked_at = now
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            _snapshot = None
+            return None
+        if _snapshot is None or _snapshot.file_id != (st.st_ino, st.st_mtime_ns):
+            try:
+                _snapshot = ColumnarSnapshot(path)
+            except (OSError, ValueError) as e:
+                print(f"❌ Could not open snapshot {path}: {e}")
+                _snapshot = None
+        return _snapshot
+
+
+if __name__ == "__main__":
+    db = sys.argv[1] if len(sys.argv) > 1 else os.getenv("DATABASE_PATH", "nba_props.db")
+    out = sys.argv[2] if len(sys.argv) > 2 else SNAPSHOT_PATH
+    export_snapshot(db, out)
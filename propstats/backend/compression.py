@@ -0,0 +1,213 @@
+"""
+PropStats Response Compression
+br/gzip negotiation for JSON and text responses above a size threshold
+
+Responses that carry an ETag are immutable for that tag, so their compressed bytes are
+kept (keyed by encoding and ETag) and reused instead of compressing the same body on every
+request; those are compressed once at the highest level. Streaming bodies (NDJSON exports)
+and responses that already have a Content-Encoding pass through untouched.
+
+Brotli comes from the `brotli` package (requirements.txt); without it only gzip is offered.
+
+Usage:
+  python compression.py [--iterations 500]   # bytes on the wire and CPU per payload/encoding
+"""
+
+import argparse
+import gzip
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+
+import metrics
+
+try:
+    import brotli
+except ImportError:  # br is optional; gzip is always available
+    brotli = None
+
+MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+CACHE_SIZE = int(os.getenv("COMPRESS_CACHE_SIZE", "64"))
+
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "image/svg+xml")
+
+COMPRESS_BYTES = metrics.register(metrics.Counter(
+    "propstats_compress_bytes_total", "Response bytes before (in) and after (out) compression", ("encoding", "direction")
+))
+COMPRESS_SECONDS = metrics.register(metrics.Histogram(
+    "propstats_compress_seconds", "CPU time spent compressing one response body", ("encoding",),
+    buckets=(0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025),
+))
+COMPRESS_CACHE = metrics.register(metrics.Counter(
+    "propstats_compress_cache_total", "Compressed bodies of ETagged responses reused (hit) or built (miss)", ("result",)
+))
+
+
+def _gzip(body: bytes, best: bool = False) -> bytes:
+    return gzip.compress(body, compresslevel=9 if best else GZIP_LEVEL, mtime=0)
+
+
+def _brotli(body: bytes, best: bool = False) -> bytes:
+    return brotli.compress(body, quality=11 if best else BROTLI_QUALITY)
+
+
+ENCODERS: Dict[str, Callable[..., bytes]] = {"gzip": _gzip}
+if brotli is not None:
+    ENCODERS = {"br": _brotli, **ENCODERS}  # preferred when the client accepts both
+
+
+def negotiate(accept_encoding: str, supported: Iterable[str] = None) -> Optional[str]:
+    """Best of `supported` (default: every encoder, br before gzip) the client accepts with q > 0"""
+    accepted = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip()] = q
+    for encoding in ENCODERS if supported is None else supported:
+        if accepted.get(encoding, accepted.get("*", 0)) > 0:
+            return encoding
+    return None
+
+
+class _CompressedCache:
+    """Small LRU of compressed bodies keyed by (encoding, ETag)"""
+
+    def __init__(self, size: int):
+        self.size = size
+        self._items: "OrderedDict[Tuple[str, str], bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple[str, str]) -> Optional[bytes]:
+        with self._lock:
+            body = self._items.get(key)
+            if body is not None:
+                self._items.move_to_end(key)
+            return body
+
+    def put(self, key: Tuple[str, str], body: bytes):
+        with self._lock:
+            self._items[key] = body
+            self._items.move_to_end(key)
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+
+
+compressed_cache = _CompressedCache(CACHE_SIZE)
+
+
+def compress(body: bytes, encoding: str, etag: Optional[str] = None) -> bytes:
+    """Compress a body, reusing the stored bytes for an ETagged (immutable) response"""
+    if etag:
+        cached = compressed_cache.get((encoding, etag))
+        COMPRESS_CACHE.inc("miss" if cached is None else "hit")
+        if cached is not None:
+            return cached
+    started = time.perf_counter()
+    compressed = ENCODERS[encoding](body, best=bool(etag))
+    COMPRESS_SECONDS.observe(time.perf_counter() - started, encoding)
+    if etag:
+        compressed_cache.put((encoding, etag), compressed)
+    return compressed
+
+
+class CompressionMiddleware:
+    """ASGI middleware: compress complete JSON/text bodies of at least MIN_BYTES"""
+
+    def __init__(self, app, minimum_size: int = MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            return await self.app(scope, receive, send)
+
+        pending = []  # the http.response.start message, held until the body is known
+
+        async def send_compressed(message):
+            if message["type"] == "http.response.start":
+                pending.append(message)
+                return
+            if not pending:
+                return await send(message)  # later chunks of a streamed body
+            start = pending.pop()
+            headers = MutableHeaders(raw=list(start["headers"]))
+            body = message.get("body", b"")
+            if (message.get("more_body", False)
+                    or "content-encoding" in headers
+                    or len(body) < self.minimum_size
+                    or not headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)):
+                await send(start)
+                return await send(message)
+
+            compressed = compress(body, encoding, headers.get("etag"))
+            COMPRESS_BYTES.inc(encoding, "in", amount=len(body))
+            COMPRESS_BYTES.inc(encoding, "out", amount=len(compressed))
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(compressed))
+            headers.add_vary_header("Accept-Encoding")
+            await send(dict(start, headers=headers.raw))
+            await send(dict(message, body=compressed))
+
+        await self.app(scope, receive, send_compressed)
+
+
+def install(app):
+    """Add the middleware; call before metrics.install so compression time is in the request timings"""
+    app.add_middleware(CompressionMiddleware)
+
+
+def main():
+    import orjson
+
+    import payloads
+
+    parser = argparse.ArgumentParser(description="Bytes on the wire and compression CPU per response")
+    parser.add_argument("--iterations", type=int, default=500)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    analysis = payloads.sample_payload(30, rng)
+    bodies = {
+        "analysis (30 games)": orjson.dumps(analysis),
+        "analysis columnar": orjson.dumps(dict(analysis, games=payloads.columnar(analysis["games"]))),
+        "search (15 players)": orjson.dumps({"players": [
+            {"id": str(2544 + i), "name": f"Player {i}", "team": "LAL", "team_name": "Lakers",
+             "position": "F", "jersey": str(i),
+             "headshot": f"https://cdn.nba.com/headshots/nba/latest/1040x760/{2544 + i}.png",
+             "team_logo": "https://cdn.nba.com/logos/nba/1610612747/primary/L/logo.svg"}
+            for i in range(15)
+        ]}),
+        "search (1 player)": orjson.dumps({"players": [{"id": "2544", "name": "LeBron James", "team": "LAL"}]}),
+    }
+    levels = [("gzip", False), ("gzip", True)] + ([("br", False), ("br", True)] if brotli else [])
+
+    print(f"🗜️  threshold {MIN_BYTES} bytes, gzip level {GZIP_LEVEL}"
+          + (f", br quality {BROTLI_QUALITY}" if brotli else " (brotli not installed)"))
+    for name, body in bodies.items():
+        print(f"  {name}: {len(body)} bytes")
+        for encoding, best in levels:
+            started = time.perf_counter()
+            for _ in range(args.iterations):
+                compressed = ENCODERS[encoding](body, best=best)
+            micros = (time.perf_counter() - started) / args.iterations * 1e6
+            label = f"{encoding} {'best' if best else 'default'}"
+            print(f"    {label:<14} {len(compressed):6d} bytes ({len(compressed) / len(body):5.1%})  {micros:7.1f} µs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""
+PropStats Dataset Export/Import
+Dump players and game_logs to partitioned Parquet and bulk-load them back into SQLite
+
+player_projections travels with them, read in the same transaction as game_logs, so an
+import only replays the states that do not match the loaded games (none, for a fresh
+database) instead of every player-season.
+
+Usage:
+  python dataset.py export <dir> [--db nba_props.db]   # players.parquet + game_logs/season=.../team=...
+  python dataset.py import <dir> [--db nba_props.db]   # bulk load, then rebuild indexes
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import time
+from typing import Dict, List
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+import db
+import migrations
+import projections
+
+TABLES = ("players", "game_logs", "player_projections")
+PARTITION_COLUMNS = ("season", "team_abbreviation")  # game_logs, when present
+EXCLUDED_COLUMNS = {"id"}  # AUTOINCREMENT keys are reassigned on import
+BATCH_SIZE = 50_000
+ANALYZE_ROWS = 1000  # Rows ANALYZE samples per index (PRAGMA analysis_limit)
+SCHEMA_METADATA_KEY = b"propstats.sqlite_schema"
+
+
+def _arrow_type(declared: str) -> pa.DataType:
+    declared = (declared or "").upper()
+    if "INT" in declared:
+        return pa.int64()
+    if "REAL" in declared or "FLOA" in declared or "DOUB" in declared:
+        return pa.float64()
+    return pa.string()
+
+
+def _table_schema(conn: sqlite3.Connection, table: str) -> Dict:
+    """Columns plus the DDL needed to recreate the table and its indexes"""
+    columns = [
+        (row[1], row[2]) for row in conn.execute(f"PRAGMA table_info({table})")
+        if row[1] not in EXCLUDED_COLUMNS
+    ]
+    ddl = [row[0] for row in conn.execute(
+        "SELECT sql FROM sqlite_master WHERE tbl_name = ? AND sql IS NOT NULL "
+        "ORDER BY type = 'index'", (table,)
+    )]
+    return {"columns": columns, "ddl": ddl}
+
+
+def _read_batches(conn: sqlite3.Connection, table: str, schema: pa.Schema):
+    names = ", ".join(schema.names)
+    cursor = conn.execute(f"SELECT {names} FROM {table}")
+    while True:
+        rows = cursor.fetchmany(BATCH_SIZE)
+        if not rows:
+            break
+        columns = list(zip(*rows))
+        yield pa.RecordBatch.from_arrays(
+            [pa.array(col, type=field.type) for col, field in zip(columns, schema)],
+            schema=schema
+        )
+
+
+def _column_values(column: pa.Array) -> list:
+    """Python values of one Arrow column, through numpy where that is lossless"""
+    # Nulls in a numeric column would come back from numpy as NaN
+    if column.null_count and not pa.types.is_string(column.type):
+        return column.to_pylist()
+    return column.to_numpy(zero_copy_only=False).tolist()
+
+
+def export_dataset(db_path: str, out_dir: str) -> Dict[str, int]:
+    """Write players.parquet and a season/team partitioned game_logs dataset"""
+    started = time.perf_counter()
+    os.makedirs(out_dir, exist_ok=True)
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    # One read transaction, so the projection states match the exported games
+    conn.execute("BEGIN")
+    counts = {}
+
+    for table in TABLES:
+        table_schema = _table_schema(conn, table)
+        if not table_schema["columns"]:
+            print(f"⚠️  {table} not found in {db_path}, skipping")
+            continue
+
+        schema = pa.schema(
+            [(name, _arrow_type(declared)) for name, declared in table_schema["columns"]],
+            metadata={SCHEMA_METADATA_KEY: json.dumps(table_schema["ddl"]).encode()}
+        )
+        data = pa.Table.from_batches(list(_read_batches(conn, table, schema)), schema=schema)
+        counts[table] = data.num_rows
+
+        if table == "game_logs":
+            partition_cols = [c for c in PARTITION_COLUMNS if c in schema.names]
+            ds.write_dataset(
+                data,
+                os.path.join(out_dir, table),
+                format="parquet",
+                partitioning=ds.partitioning(
+                    pa.schema([schema.field(c) for c in partition_cols]), flavor="hive"
+                ),
+                existing_data_behavior="delete_matching",
+            )
+            # Partition values leave the files, so keep the full schema alongside them
+            pq.write_metadata(schema, os.path.join(out_dir, table, "_common_metadata"))
+        else:
+            pq.write_table(data, os.path.join(out_dir, f"{table}.parquet"))
+
+    conn.execute("COMMIT")
+    conn.close()
+    elapsed = time.perf_counter() - started
+    print(f"✅ Exported {counts} to {out_dir} ({elapsed:.2f}s)")
+    return counts
+
+
+def _load_table(out_dir: str, table: str) -> pa.Table:
+    if table == "game_logs":
+        path = os.path.join(out_dir, table)
+        schema = pq.read_schema(os.path.join(path, "_common_metadata"))
+        partition_cols = [c for c in PARTITION_COLUMNS if c in schema.names]
+        dataset = ds.dataset(
+            path,
+            schema=schema,
+            format="parquet",
+            partitioning=ds.partitioning(
+                pa.schema([schema.field(c) for c in partition_cols]), flavor="hive"
+            ),
+            exclude_invalid_files=True,
+        )
+        return dataset.to_table().replace_schema_metadata(schema.metadata)
+    return pq.read_table(os.path.join(out_dir, f"{table}.parquet"))
+
+
+def import_dataset(db_path: str, out_dir: str) -> Dict[str, int]:
+    """Bulk load an exported dataset into SQLite, rebuilding indexes afterwards"""
+    started = time.perf_counter()
+    migrations.migrate(db_path)
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    counts = {}
+
+    for table in TABLES:
+        try:
+            data = _load_table(out_dir, table)
+        except FileNotFoundError:
+            print(f"⚠️  No {table} export in {out_dir}, skipping")
+            continue
+
+        ddl: List[str] = json.loads(data.schema.metadata[SCHEMA_METADATA_KEY])
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+        ).fetchone()
+        if not exists:
+            conn.execute(ddl[0])
+
+        # Exports taken before the schemas were unified use the legacy column names
+        aliases = migrations.COLUMN_ALIASES.get(table, {})
+        data = data.rename_columns([aliases.get(c, c) for c in data.column_names])
+        existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        columns = [c for c in data.column_names if c in existing]
+        data = data.select(columns)
+
+        # Drop secondary indexes for the load and recreate them in one pass afterwards
+        indexes = conn.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+            (table,)
+        ).fetchall()
+        index_sql = [sql for _, sql in indexes] or [sql for sql in ddl[1:]]
+
+        insert = (
+            f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}) "
+            f"VALUES ({', '.join('?' * len(columns))})"
+        )
+        with conn:
+            for name, _ in indexes:
+                conn.execute(f"DROP INDEX {name}")
+            for batch in data.to_batches(max_chunksize=BATCH_SIZE):
+                conn.executemany(insert, zip(*(_column_values(col) for col in batch.columns)))
+            for sql in index_sql:
+                conn.execute(sql.replace("CREATE INDEX ", "CREATE INDEX IF NOT EXISTS ", 1))
+        counts[table] = data.num_rows
+
+    conn.execute(f"PRAGMA analysis_limit = {ANALYZE_ROWS}")
+    conn.execute("ANALYZE")
+    # Exports without player_projections, or merged into existing games, replay what is missing
+    replayed = projections.reconcile(conn) if "game_logs" in counts else 0
+    conn.close()
+    elapsed = time.perf_counter() - started
+    print(f"✅ Imported {counts} into {db_path}, {replayed} projection states replayed ({elapsed:.2f}s)")
+    db.checkpoint(db_path, truncate=True)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export or import PropStats data as Parquet")
+    parser.add_argument("command", choices=["export", "import"])
+    parser.add_argument("dir", help="Dataset directory")
+    parser.add_argument("--db", default=os.getenv("DATABASE_PATH", "nba_props.db"), help="SQLite database path")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export_dataset(args.db, args.dir)
+    else:
+        import_dataset(args.db, args.dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+PropStats Database Connections
+Single place where the API opens SQLite connections
+
+Databases run in WAL mode (SQLITE_JOURNAL_MODE, applied by migrations.migrate), so a
+reader keeps one consistent snapshot for its whole transaction while an ingest deletes and
+reinserts, and a long read (an NDJSON export) never holds up a writer. SQLite's
+automatic checkpoints are passive and give up while readers are active, so bulk writers and
+the ingest worker call checkpoint() to keep the WAL file bounded.
+"""
+
+import os
+import sqlite3
+from typing import Dict
+
+import metrics
+from metrics import span
+
+JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "wal").lower()
+WAL_TRUNCATE_PAGES = int(os.getenv("SQLITE_WAL_TRUNCATE_PAGES", "10000"))  # ~40 MB of 4 KB pages
+CHECKPOINT_TIMEOUT = float(os.getenv("SQLITE_CHECKPOINT_TIMEOUT", "2"))  # Seconds a TRUNCATE waits for readers
+
+CHECKPOINTS = metrics.register(metrics.Counter(
+    "propstats_sqlite_checkpoints_total", "WAL checkpoints by mode and result", ("mode", "result")
+))
+WAL_PAGES = metrics.register(metrics.Gauge(
+    "propstats_sqlite_wal_pages", "Frames left in the WAL after the last checkpoint"
+))
+
+
+def connect(db_path: str, **kwargs) -> sqlite3.Connection:
+    """Open a connection, timed as the db_connect stage"""
+    with span("db_connect"):
+        conn = sqlite3.connect(db_path, **kwargs)
+        if JOURNAL_MODE == "wal":
+            # Durable at checkpoints rather than every commit; WAL cannot be corrupted by this
+            conn.execute("PRAGMA synchronous = NORMAL")
+        return conn
+
+
+def set_journal_mode(db_path: str) -> str:
+    """Persist JOURNAL_MODE on the database file; returns the mode in effect"""
+    conn = sqlite3.connect(db_path, timeout=60)
+    try:
+        return conn.execute(f"PRAGMA journal_mode = {JOURNAL_MODE}").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def checkpoint(db_path: str, truncate: bool = False) -> Dict[str, int]:
+    """Copy WAL frames back into the database file.
+
+    A PASSIVE checkpoint never waits. With `truncate`, or once readers have let the WAL grow
+    past WAL_TRUNCATE_PAGES, a TRUNCATE checkpoint waits up to CHECKPOINT_TIMEOUT for them
+    and resets the WAL to zero bytes.
+    """
+    conn = sqlite3.connect(db_path, timeout=CHECKPOINT_TIMEOUT)
+    try:
+        if conn.execute("PRAGMA journal_mode").fetchone()[0] != "wal":
+            return {"busy": 0, "wal_pages": 0, "checkpointed": 0}
+        mode = "TRUNCATE" if truncate else "PASSIVE"
+        busy, wal_pages, done = conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+        if mode == "PASSIVE" and wal_pages > WAL_TRUNCATE_PAGES:
+            mode = "TRUNCATE"
+            busy, wal_pages, done = conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+    finally:
+        conn.close()
+    CHECKPOINTS.inc(mode.lower(), "busy" if busy else "ok")
+    WAL_PAGES.set(max(wal_pages - done, 0))
+    return {"busy": busy, "wal_pages": wal_pages, "checkpointed": done}
@@ -0,0 +1,176 @@
+"""
+PropStats Opponent Defense
+Per-opponent, per-position "allowed" averages and league ranks, precomputed from game_logs
+
+Averages are per player-game: how much a guard (forward, center, any position) scores,
+rebounds, ... against each opponent. Rank 1 is the opponent that allows the least. The
+whole table is rebuilt with one grouped INSERT ... SELECT, so analysis requests read a
+single row by primary key instead of aggregating the league's logs.
+
+Usage:
+  python defense.py [--db nba_props.db] [--season 2024-25]   # by hand; ingest_worker.py runs it after jobs
+"""
+
+import argparse
+import os
+import sqlite3
+import time
+from typing import Any, Dict, List, Optional
+
+import migrations
+
+ALL_POSITIONS = "ALL"
+
+# Stat name -> expression over game_logs, in opponent_defense column order
+STATS = {
+    "points": "points",
+    "rebounds": "rebounds",
+    "assists": "assists",
+    "threes": "fg3m",
+    "steals": "steals",
+    "blocks": "blocks",
+    "turnovers": "turnovers",
+    "pra": "points + rebounds + assists",
+    "pr": "points + rebounds",
+    "pa": "points + assists",
+    "ra": "rebounds + assists",
+}
+
+# 'Guard', 'Guard-Forward', 'G-F' -> G; 'Center-Forward' -> C; unknown positions only count toward ALL
+POSITION_GROUP_SQL = """
+    CASE UPPER(SUBSTR(COALESCE(p.position, ''), 1, 1))
+        WHEN 'G' THEN 'G' WHEN 'F' THEN 'F' WHEN 'C' THEN 'C'
+    END
+"""
+
+
+def position_group(position: Optional[str]) -> str:
+    first = (position or "")[:1].upper()
+    return first if first in ("G", "F", "C") else ALL_POSITIONS
+
+
+def rebuild(conn: sqlite3.Connection, season: str) -> int:
+    """Recompute one season's rows in a single transaction; returns the row count"""
+    stat_values = ",\n".join(f"({expr}) AS {name}" for name, expr in STATS.items())
+    averages = ", ".join(f"AVG({name}) AS {name}" for name in STATS)
+    ranked = ",\n".join(
+        f"{name}, RANK() OVER (PARTITION BY position ORDER BY {name}) AS {name}_rank" for name in STATS
+    )
+    columns = ", ".join(f"{name}, {name}_rank" for name in STATS)
+
+    with conn:
+        conn.execute("DELETE FROM opponent_defense WHERE season = ?", (season,))
+        before = conn.total_changes
+        conn.execute(f"""
+            WITH per_game AS (
+                SELECT g.opponent_abbreviation AS opponent, {POSITION_GROUP_SQL} AS position,
+                       {stat_values}
+                FROM game_logs g
+                LEFT JOIN players p ON p.player_id = g.player_id
+                WHERE g.season = ? AND g.opponent_abbreviation IS NOT NULL AND g.opponent_abbreviation != ''
+            ),
+            grouped AS (
+                SELECT opponent, position, COUNT(*) AS games, {averages}
+                FROM per_game WHERE position IS NOT NULL
+                GROUP BY opponent, position
+                UNION ALL
+                SELECT opponent, '{ALL_POSITIONS}', COUNT(*), {averages}
+                FROM per_game
+                GROUP BY opponent
+            )
+            INSERT INTO opponent_defense (season, opponent, position, games, opponents, {columns})
+            SELECT ?, opponent, position, games, COUNT(*) OVER (PARTITION BY position),
+                   {ranked}
+            FROM grouped
+        """, (season, season))
+        # cursor.rowcount is -1 for statements that start with WITH
+        return conn.total_changes - before
+
+
+def lookup(cursor: sqlite3.Cursor, season: str, opponent: str, position: str, stat: str) -> Optional[Dict[str, Any]]:
+    """One opponent's allowed average and rank for a stat, by primary key"""
+    if stat not in STATS:
+        return None
+    cursor.execute(f"""
+        SELECT position, games, opponents, {stat}, {stat}_rank FROM opponent_defense
+        WHERE season = ? AND opponent = ? AND position = ?
+    """, (season, opponent, position))
+    row = cursor.fetchone()
+    if row is None and position != ALL_POSITIONS:
+        return lookup(cursor, season, opponent, ALL_POSITIONS, stat)
+    if row is None:
+        return None
+    return {
+        "position": row[0],
+        "games": row[1],
+        "allowed": round(row[3], 1) if row[3] is not None else None,
+        "rank": row[4],
+        "of": row[2],
+    }
+
+
+def opponent_history(cursor: sqlite3.Cursor, player_id: str, opponent: str, stat_expr: str,
+                     line: float, limit: int = 20) -> List[Dict[str, Any]]:
+    """A player's most recent games against one opponent, across all stored seasons"""
+    cursor.execute(f"""
+        SELECT game_date, season, {stat_expr} AS value, is_home, game_result, minutes_played
+        FROM game_logs
+        WHERE player_id = ? AND opponent_abbreviation = ?
+        ORDER BY game_day DESC
+        LIMIT ?
+    """, (player_id, opponent, limit))
+    games = []
+    for row in cursor.fetchall():
+        value = row[2] if row[2] is not None else 0
+        games.append({
+            "date": row[0],
+            "season": row[1],
+            "value": value,
+            "hit": value > line,
+            "is_home": row[3] == 1,
+            "result": row[4],
+            "minutes": round(row[5], 1) if row[5] else 0,
+        })
+    return games
+
+
+def matchup(cursor: sqlite3.Cursor, player_id: str, opponent: str, season: str, stat: str,
+            stat_expr: str, line: float) -> Dict[str, Any]:
+    """`vs` block of the analysis response: history against the opponent plus its defense"""
+    cursor.execute("SELECT position FROM players WHERE player_id = ?", (player_id,))
+    row = cursor.fetchone()
+    games = opponent_history(cursor, player_id, opponent, stat_expr, line)
+    values = [g["value"] for g in games]
+    hits = sum(1 for g in games if g["hit"])
+    return {
+        "opponent": opponent,
+        "games": games,
+        "average": round(sum(values) / len(values), 1) if values else 0,
+        "hit_rate": {"hits": hits, "total": len(games), "pct": round(hits / len(games) * 100, 1) if games else 0},
+        "defense": lookup(cursor, season, opponent, position_group(row[0] if row else None), stat),
+    }
+
+
+def rebuild_seasons(db_path: str, seasons: List[str] = None) -> Dict[str, int]:
+    """Rebuild the given seasons (default: every season in game_logs)"""
+    started = time.perf_counter()
+    migrations.migrate(db_path)
+    conn = sqlite3.connect(db_path)
+    if not seasons:
+        seasons = [row[0] for row in conn.execute("SELECT DISTINCT season FROM game_logs ORDER BY season")]
+    counts = {season: rebuild(conn, season) for season in seasons}
+    conn.close()
+    print(f"✅ Opponent defense rebuilt: {counts} ({time.perf_counter() - started:.2f}s)")
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild per-opponent defensive splits")
+    parser.add_argument("--db", default=os.getenv("DATABASE_PATH", "nba_props.db"), help="SQLite database path")
+    parser.add_argument("--season", action="append", help="Season to rebuild (repeatable; default all)")
+    args = parser.parse_args()
+    rebuild_seasons(args.db, args.season)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+PropStats Exports
+Streaming NDJSON of stored game logs: one JSON object per line, read straight off a SQLite cursor
+
+Rows are fetched in batches of EXPORT_BATCH_ROWS and written as they are read, so memory
+stays flat whether the export is one player-season or the whole league. Rows come out in
+(player_id, game_id) order, which the UNIQUE(player_id, game_id) index serves without a sort.
+"""
+
+import os
+import re
+import zlib
+from typing import Iterator, List, Optional
+
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+
+import compression
+import db
+import migrations
+from payloads import dumps_line
+
+EXPORT_BATCH_ROWS = int(os.getenv("EXPORT_BATCH_ROWS", "500"))
+
+# Every canonical game_logs column except the surrogate key
+EXPORT_COLUMNS = [name for name, _ in migrations.canonical_columns("game_logs") if name != "id"]
+
+ISO_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+
+def parse_columns(requested: Optional[str]) -> List[str]:
+    """Comma-separated column names (default all); raises ValueError on unknown ones"""
+    if not requested:
+        return list(EXPORT_COLUMNS)
+    names = [name.strip() for name in requested.split(",") if name.strip()]
+    unknown = [name for name in names if name not in EXPORT_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown column(s): {', '.join(unknown)}. Choose from {', '.join(EXPORT_COLUMNS)}")
+    return names
+
+
+def _ndjson_lines(conn, cursor, columns: List[str]) -> Iterator[bytes]:
+    try:
+        while True:
+            rows = cursor.fetchmany(EXPORT_BATCH_ROWS)
+            if not rows:
+                break
+            yield b"".join(dumps_line(dict(zip(columns, row))) for row in rows)
+    finally:
+        conn.close()
+
+
+def _gzipped(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31: gzip container
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def stream_games(
+    db_path: str,
+    accept_encoding: str,
+    player_id: Optional[str] = None,
+    season: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    columns: Optional[str] = None,
+) -> StreamingResponse:
+    """NDJSON response of the matching game logs; raises ValueError on bad filters.
+
+    The query runs before the response starts, so filter errors surface as a status code
+    instead of a truncated body. Dates are ISO (YYYY-MM-DD) and inclusive.
+    """
+    selected = parse_columns(columns)
+    for value in (date_from, date_to):
+        if value is not None and not ISO_DATE.match(value):
+            raise ValueError(f"Dates must be YYYY-MM-DD, got {value!r}")
+
+    where, params = [], []
+    if player_id is not None:
+        where.append("player_id = ?")
+        params.append(player_id)
+    if season is not None:
+        where.append("season = ?")
+        params.append(season)
+    if date_from is not None:
+        where.append("game_day >= ?")
+        params.append(date_from)
+    if date_to is not None:
+        where.append("game_day <= ?")
+        params.append(date_to)
+
+    # The body is produced from the threadpool, one batch per thread hop
+    conn = db.connect(db_path, check_same_thread=False)
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT {', '.join(selected)} FROM game_logs
+            WHERE {' AND '.join(where) or '1'}
+            ORDER BY player_id, game_id
+        """, params)
+    except Exception:
+        conn.close()
+        raise
+
+    body = _ndjson_lines(conn, cursor, selected)
+    headers = {"Vary": "Accept-Encoding"}
+    if compression.negotiate(accept_encoding, ("gzip",)):
+        body = _gzipped(body)
+        headers["Content-Encoding"] = "gzip"
+    # A client that disconnects before the first chunk never starts the generator, so its
+    # finally never runs; the background task closes the connection either way
+    return StreamingResponse(body, media_type="application/x-ndjson", headers=headers,
+                             background=BackgroundTask(conn.close))
@@ -0,0 +1,366 @@
+"""
+PropStats Freshness
+Schedule-driven refresh decisions: stored games go stale when the player's team finishes a game
+
+A fixed TTL re-fetches players who have not played (road breaks, injuries, the off-season)
+and keeps players who just played waiting for it to run out. The oracle instead keeps the
+league schedule in the `schedule` table, downloaded from stats.nba.com once every
+FRESHNESS_SCHEDULE_HOURS. Requests only read that table: the download runs in a background
+thread, or in ingest_worker.py when the app runs with INGEST_MODE=queue. The oracle holds one sorted array of completion times per team, where a
+game counts as final FRESHNESS_FINAL_AFTER_MINUTES after tip-off. A player's season is stale
+only if one of their teams (last logged and current roster team) has a completion time
+between the last sync and now. That check is one binary search.
+
+A fetch that comes back empty (a rookie who has not played, a two-way or injured player) or
+fails leaves a negative entry in `fetch_misses`, so the next request does not fetch again.
+Each consecutive miss doubles the wait, starting at NEGATIVE_EMPTY_SECONDS for an empty
+result and NEGATIVE_ERROR_SECONDS for an error, up to NEGATIVE_MAX_SECONDS. An empty
+entry also ends early once the player's team finishes a game.
+
+The app's old rule still runs next to the oracle: it decides on its own when the schedule
+is unavailable or the team is unknown, and every decision where the two disagree is counted,
+so /admin/freshness reports the upstream calls the schedule saved.
+"""
+
+import os
+import threading
+import time
+from calendar import timegm
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+import db
+import metrics
+import upstream
+
+SCHEDULE_HOURS = float(os.getenv("FRESHNESS_SCHEDULE_HOURS", "12"))  # Re-download the schedule after this
+RETRY_SECONDS = float(os.getenv("FRESHNESS_RETRY_SECONDS", "600"))  # After a failed download
+FINAL_AFTER_MINUTES = float(os.getenv("FRESHNESS_FINAL_AFTER_MINUTES", "180"))  # Tip-off to box score published
+
+EMPTY_SECONDS = float(os.getenv("NEGATIVE_EMPTY_SECONDS", "1800"))  # First wait after an empty fetch
+ERROR_SECONDS = float(os.getenv("NEGATIVE_ERROR_SECONDS", "60"))  # First wait after a failed fetch
+MAX_BACKOFF_SECONDS = float(os.getenv("NEGATIVE_MAX_SECONDS", "21600"))
+
+SCHEDULE_ENDPOINT = "scheduleleaguev2"
+REGULAR_SEASON = "002"  # game_id prefix; only regular season games reach game_logs
+
+DECISIONS = metrics.register(metrics.Counter(
+    "propstats_freshness_decisions_total", "Refresh decisions by outcome and the rule that made them", ("decision", "reason")
+))
+AVOIDED_CALLS = metrics.register(metrics.Counter(
+    "propstats_freshness_avoided_calls_total", "Upstream calls skipped where the fixed TTL would have refreshed"
+))
+EARLY_REFRESHES = metrics.register(metrics.Counter(
+    "propstats_freshness_early_refreshes_total", "Refreshes for a finished game that the fixed TTL would have delayed"
+))
+MISSES = metrics.register(metrics.Counter(
+    "propstats_freshness_misses_total", "Fetches recorded in the negative cache", ("kind",)
+))
+SCHEDULE_LOADS = metrics.register(metrics.Counter(
+    "propstats_freshness_schedule_loads_total", "Schedule loads by source", ("source",)
+))
+
+
+def parse_timestamp(value: Optional[str]) -> Optional[float]:
+    """SQLite datetime('now') / CURRENT_TIMESTAMP text (UTC) to unix seconds"""
+    if not value:
+        return None
+    try:
+        return timegm(datetime.strptime(value[:19], "%Y-%m-%d %H:%M:%S").timetuple())
+    except ValueError:
+        return None
+
+
+def parse_schedule(season: str, payload: dict) -> List[Tuple[str, str, float, str, str]]:
+    """scheduleleaguev2 payload to (game_id, season, starts_at, home_team, away_team) rows"""
+    rows = []
+    for day in payload.get("leagueSchedule", {}).get("gameDates", []):
+        for game in day.get("games", []):
+            game_id = game.get("gameId", "")
+            home = (game.get("homeTeam") or {}).get("teamTricode")
+            away = (game.get("awayTeam") or {}).get("teamTricode")
+            starts = game.get("gameDateTimeUTC")
+            if not game_id.startswith(REGULAR_SEASON) or not home or not away or not starts:
+                continue
+            starts_at = timegm(datetime.strptime(starts[:19], "%Y-%m-%dT%H:%M:%S").timetuple())
+            rows.append((game_id, season, float(starts_at), home, away))
+    return rows
+
+
+def season_over(season: str) -> float:
+    """Unix time by which a past regular season is certainly complete (July 1 of its second year)"""
+    return timegm((int(season[:4]) + 1, 7, 1, 0, 0, 0))
+
+
+def player_state(cursor, player_id: str, season: str) -> Tuple[int, Optional[float], Optional[str]]:
+    """(stored games, last sync time, team of the latest stored game) for one player-season"""
+    # A lone MAX() makes SQLite return team_abbreviation from the row that holds it
+    cursor.execute("""
+        SELECT COUNT(*), MAX(game_id), team_abbreviation FROM game_logs
+        WHERE player_id = ? AND season = ?
+    """, (player_id, season))
+    games, _, team = cursor.fetchone()
+    cursor.execute("""
+        SELECT MAX(fetched_at) FROM game_logs
+        WHERE player_id = ? AND season = ?
+    """, (player_id, season))
+    return games, parse_timestamp(cursor.fetchone()[0]), team
+
+
+class Miss(NamedTuple):
+    kind: str  # "empty" or "error"
+    misses: int  # Consecutive misses of this kind
+    recorded_at: float
+    retry_at: float
+
+
+def load_miss(cursor, player_id: str, season: str) -> Optional[Miss]:
+    cursor.execute("""
+        SELECT kind, misses, recorded_at, retry_at FROM fetch_misses
+        WHERE player_id = ? AND season = ?
+    """, (player_id, season))
+    row = cursor.fetchone()
+    return Miss(*row) if row else None
+
+
+def record_miss(cursor, player_id: str, season: str, error: Optional[str] = None,
+                now: Optional[float] = None) -> float:
+    """Remember an empty (error=None) or failed fetch; returns when the player-season may be fetched again"""
+    now = time.time() if now is None else now
+    kind = "error" if error else "empty"
+    previous = load_miss(cursor, player_id, season)
+    misses = previous.misses + 1 if previous and previous.kind == kind else 1
+    base = ERROR_SECONDS if error else EMPTY_SECONDS
+    retry_at = now + min(base * 2 ** (misses - 1), MAX_BACKOFF_SECONDS)
+    cursor.execute("""
+        INSERT OR REPLACE INTO fetch_misses (player_id, season, kind, misses, recorded_at, retry_at, error)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, (player_id, season, kind, misses, now, retry_at, error))
+    MISSES.inc(kind)
+    return retry_at
+
+
+def clear_miss(cursor, player_id: str, season: str):
+    """Forget the negative entry after a fetch that stored games"""
+    cursor.execute("DELETE FROM fetch_misses WHERE player_id = ? AND season = ?", (player_id, season))
+
+
+def note_fetch(db_path: str, player_id: str, season: str, games: int, error: Optional[str] = None):
+    """record_miss or clear_miss in their own transaction, for fetches that stored nothing"""
+    conn = db.connect(db_path)
+    try:
+        with conn:
+            if error or not games:
+                record_miss(conn.cursor(), player_id, season, error)
+            else:
+                clear_miss(conn.cursor(), player_id, season)
+    finally:
+        conn.close()
+
+
+def miss_stats(db_path: str, now: Optional[float] = None) -> Dict[str, int]:
+    """Negative entries still holding off a fetch, by kind, plus expired ones awaiting a retry"""
+    now = time.time() if now is None else now
+    conn = db.connect(db_path)
+    try:
+        counts = {"empty": 0, "error": 0, "expired": 0}
+        for kind, active, total in conn.execute("""
+            SELECT kind, SUM(retry_at > ?), COUNT(*) FROM fetch_misses GROUP BY kind
+        """, (now,)):
+            counts[kind] = active
+            counts["expired"] += total - active
+        return counts
+    finally:
+        conn.close()
+
+
+def download_schedule(db_path: str, season: str, now: Optional[float] = None) -> bool:
+    """Download the season's schedule into the schedule table unless the stored copy is recent; False on failure"""
+    now = time.time() if now is None else now
+    state_key = f"schedule:{season}"
+    conn = db.connect(db_path)
+    try:
+        row = conn.execute("SELECT value FROM sync_state WHERE key = ?", (state_key,)).fetchone()
+        if row and now - float(row[0]) < SCHEDULE_HOURS * 3600:
+            return True
+        try:
+            with metrics.span("schedule_fetch"):
+                rows = parse_schedule(season, upstream.fetch(
+                    SCHEDULE_ENDPOINT, {"LeagueID": "00", "Season": season}
+                ))
+        except Exception as e:
+            SCHEDULE_LOADS.inc("error")
+            print(f"❌ Error fetching the {season} schedule: {e}")
+            return False
+        if not rows:
+            return False
+        with conn:
+            conn.execute("DELETE FROM schedule WHERE season = ?", (season,))
+            conn.executemany("INSERT OR REPLACE INTO schedule VALUES (?, ?, ?, ?, ?)", rows)
+            conn.execute("""
+                INSERT OR REPLACE INTO sync_state (key, value, updated_at)
+                VALUES (?, ?, datetime('now'))
+            """, (state_key, str(now)))
+        SCHEDULE_LOADS.inc("upstream")
+        return True
+    finally:
+        conn.close()
+
+
+class ScheduleOracle:
+    """Completion times per team for one season, reloaded from the schedule table every SCHEDULE_HOURS
+
+    With `download` (the default) a schedule missing or older than SCHEDULE_HOURS is downloaded
+    in a background thread; without it, something else (the ingest worker) keeps the table current.
+    """
+
+    def __init__(self, season: str, download: bool = True):
+        self.season = season
+        self.download = download
+        self.finals: Dict[str, np.ndarray] = {}
+        self.starts: Dict[str, np.ndarray] = {}
+        self.games = 0
+        self.fetched_at: Optional[float] = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+        self._downloader: Optional[threading.Thread] = None
+        self._counts_lock = threading.Lock()
+        self.decisions: Dict[Tuple[str, str], int] = {}
+        self.avoided_calls = 0
+        self.early_refreshes = 0
+
+    def ensure(self, db_path: str, now: Optional[float] = None):
+        """Reload the schedule table if it is due; one caller loads while the rest keep the current arrays.
+
+        Never downloads in the calling thread, so a request only ever pays for the table read.
+        """
+        now = time.time() if now is None else now
+        if now < self._next_check or not self._lock.acquire(blocking=False):
+            return
+        try:
+            if now >= self._next_check:
+                fresh = self.load(db_path, now)
+                # Due again when the stored copy ages out, which is when a downloader replaces it
+                self._next_check = self.fetched_at + SCHEDULE_HOURS * 3600 if fresh else now + RETRY_SECONDS
+                if not fresh and self.download:
+                    self._download_in_background(db_path)
+        finally:
+            self._lock.release()
+
+    def _download_in_background(self, db_path: str):
+        if self._downloader is not None and self._downloader.is_alive():
+            return
+
+        def download():
+            if download_schedule(db_path, self.season):
+                self.reset()  # The next ensure() picks the new rows up from the table
+
+        self._downloader = threading.Thread(target=download, name=f"schedule-{self.season}", daemon=True)
+        self._downloader.start()
+
+    def load(self, db_path: str, now: float) -> bool:
+        """Build the arrays from the schedule table; False if it is empty or older than SCHEDULE_HOURS"""
+        conn = db.connect(db_path)
+        try:
+            row = conn.execute("SELECT value FROM sync_state WHERE key = ?", (f"schedule:{self.season}",)).fetchone()
+            fetched_at = float(row[0]) if row else None
+            rows = conn.execute("""
+                SELECT starts_at, home_team, away_team FROM schedule WHERE season = ?
+            """, (self.season,)).fetchall()
+        finally:
+            conn.close()
+        if not rows:
+            return False
+        SCHEDULE_LOADS.inc("table")
+        self._build(rows, fetched_at)
+        return fetched_at is not None and now - fetched_at < SCHEDULE_HOURS * 3600
+
+    def _build(self, rows: List[Tuple[float, str, str]], fetched_at: Optional[float]):
+        by_team: Dict[str, List[float]] = {}
+        for starts_at, home, away in rows:
+            by_team.setdefault(home, []).append(starts_at)
+            by_team.setdefault(away, []).append(starts_at)
+        starts = {team: np.sort(np.array(times, dtype=np.float64)) for team, times in by_team.items()}
+        # Swapped in whole, so readers see the old arrays or the new ones
+        self.starts = starts
+        self.finals = {team: times + FINAL_AFTER_MINUTES * 60 for team, times in starts.items()}
+        self.games = len(rows)
+        self.fetched_at = fetched_at
+
+    def last_final(self, team: str, now: float) -> Optional[float]:
+        """Completion time of the team's most recent finished game"""
+        finals = self.finals.get(team)
+        if finals is None:
+            return None
+        i = int(np.searchsorted(finals, now, side="right"))
+        return float(finals[i - 1]) if i else None
+
+    def next_start(self, team: str, now: float) -> Optional[float]:
+        starts = self.starts.get(team)
+        if starts is None:
+            return None
+        i = int(np.searchsorted(starts, now, side="right"))
+        return float(starts[i]) if i < len(starts) else None
+
+    def decide(self, teams: Iterable[Optional[str]], season: str, last_sync: Optional[float],
+               ttl_stale: bool, calls: int = 1, miss: Optional[Miss] = None,
+               now: Optional[float] = None) -> Tuple[bool, str]:
+        """(whether to refresh, the rule that decided); `ttl_stale` is the app's old rule and `calls` what a refresh costs upstream"""
+        now = time.time() if now is None else now
+        known = [team for team in dict.fromkeys(teams) if team in self.finals]
+        if miss is not None and now < miss.retry_at and not (
+            miss.kind == "empty" and season == self.season
+            and any((self.last_final(team, now) or 0.0) > miss.recorded_at for team in known)
+        ):
+            stale, reason = False, f"backoff_{miss.kind}"
+        elif last_sync is None:
+            stale, reason = True, "empty"
+        elif season < self.season:
+            stale, reason = last_sync < season_over(season), "season_over"
+        elif season != self.season or not known:
+            stale, reason = ttl_stale, "ttl"
+        else:
+            finished = max((self.last_final(team, now) or 0.0) for team in known)
+            stale, reason = (True, "game_final") if finished > last_sync else (False, "no_game")
+        self._count(stale, reason, ttl_stale, calls)
+        return stale, reason
+
+    def _count(self, stale: bool, reason: str, ttl_stale: bool, calls: int):
+        decision = "refresh" if stale else "fresh"
+        DECISIONS.inc(decision, reason)
+        with self._counts_lock:
+            self.decisions[(decision, reason)] = self.decisions.get((decision, reason), 0) + 1
+            if ttl_stale and not stale:
+                self.avoided_calls += calls
+                AVOIDED_CALLS.inc(amount=calls)
+            elif stale and not ttl_stale and reason == "game_final":
+                self.early_refreshes += 1
+                EARLY_REFRESHES.inc()
+
+    def team_report(self, team: str, now: Optional[float] = None) -> Dict[str, Any]:
+        now = time.time() if now is None else now
+        last, upcoming = self.last_final(team, now), self.next_start(team, now)
+        as_iso = lambda t: datetime.utcfromtimestamp(t).strftime("%Y-%m-%dT%H:%M:%SZ") if t else None
+        return {"team": team, "last_final": as_iso(last), "next_game": as_iso(upcoming)}
+
+    def report(self, now: Optional[float] = None) -> Dict[str, Any]:
+        now = time.time() if now is None else now
+        with self._counts_lock:
+            decisions = {f"{d}:{r}": n for (d, r), n in sorted(self.decisions.items())}
+            avoided, early = self.avoided_calls, self.early_refreshes
+        return {
+            "season": self.season,
+            "schedule_games": self.games,
+            "schedule_teams": len(self.finals),
+            "schedule_age_hours": round((now - self.fetched_at) / 3600, 2) if self.fetched_at else None,
+            "final_after_minutes": FINAL_AFTER_MINUTES,
+            "decisions": decisions,
+            "avoided_calls": avoided,
+            "early_refreshes": early,
+        }
+
+    def reset(self):
+        """Forget the loaded schedule so the next ensure() reloads it"""
+        self._next_check = 0.0
@@ -0,0 +1,239 @@
+"""
+PropStats Ingest Queue
+Durable SQLite queue of player refresh jobs, consumed by ingest_worker.py
+
+INGEST_MODE=inline (the default) keeps the old behaviour: a stale player is fetched from
+stats.nba.com and written inside the request. With INGEST_MODE=queue the web apps only
+enqueue and read:
+  - a stale player gets a background job and is served from what is stored;
+  - a player with nothing stored gets a priority job, and the request waits up to
+    INGEST_WAIT_SECONDS for a worker to finish it.
+There is at most one queued or running job per player and season list, so a burst of
+requests for the same player adds one job.
+
+Workers claim jobs under a lease. If a worker dies, its job is requeued once the lease
+runs out, and marked failed after INGEST_MAX_ATTEMPTS claims. SharedRateLimiter spaces
+upstream calls across every worker process through a next-slot row in the same database.
+"""
+
+import os
+import sqlite3
+import time
+from typing import Any, Dict, List, Optional
+
+import db
+import metrics
+
+MODE = os.getenv("INGEST_MODE", "inline")
+if MODE not in ("inline", "queue"):
+    raise ValueError(f"Unknown INGEST_MODE: {MODE}")
+QUEUED = MODE == "queue"
+
+WAIT_SECONDS = float(os.getenv("INGEST_WAIT_SECONDS", "15"))  # Longest a request waits for a priority job
+POLL_SECONDS = float(os.getenv("INGEST_POLL_SECONDS", "0.05"))
+LEASE_SECONDS = float(os.getenv("INGEST_LEASE_SECONDS", "300"))
+MAX_ATTEMPTS = int(os.getenv("INGEST_MAX_ATTEMPTS", "3"))
+KEEP_SECONDS = float(os.getenv("INGEST_KEEP_SECONDS", "86400"))  # Finished jobs are pruned after this
+BUSY_TIMEOUT = 30
+
+PRIORITY_BACKGROUND = 0
+PRIORITY_WAITING = 1
+
+QUEUE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0)
+
+ENQUEUED = metrics.register(metrics.Counter(
+    "propstats_ingest_enqueued_total", "Refresh jobs requested, new or merged into an active job", ("priority", "result")
+))
+WAITED = metrics.register(metrics.Histogram(
+    "propstats_ingest_wait_seconds", "Time requests waited for a priority job", ("outcome",), buckets=QUEUE_BUCKETS
+))
+JOBS = metrics.register(metrics.Counter(
+    "propstats_ingest_jobs_total", "Jobs finished by workers", ("status",)
+))
+QUEUE_SECONDS = metrics.register(metrics.Histogram(
+    "propstats_ingest_queue_seconds", "Time from enqueue to claim", ("priority",), buckets=QUEUE_BUCKETS
+))
+RUN_SECONDS = metrics.register(metrics.Histogram(
+    "propstats_ingest_run_seconds", "Time to fetch and store one job", buckets=QUEUE_BUCKETS
+))
+QUEUE_DEPTH = metrics.register(metrics.Gauge(
+    "propstats_ingest_queue_depth", "Jobs queued or running, as last seen by a worker", ("status",)
+))
+
+PRIORITY_LABELS = {PRIORITY_BACKGROUND: "background", PRIORITY_WAITING: "waiting"}
+
+JOB_COLUMNS = ("id", "player_id", "seasons", "include_details", "priority", "attempts", "enqueued_at", "started_at")
+
+
+def _connect(db_path: str) -> sqlite3.Connection:
+    return db.connect(db_path, timeout=BUSY_TIMEOUT)
+
+
+def enqueue(db_path: str, player_id: str, seasons: List[str], include_details: bool = True,
+            priority: int = PRIORITY_BACKGROUND) -> int:
+    """Queue a refresh, or return the player's active job for the same seasons; returns the job id"""
+    season_key = ",".join(seasons)
+    conn = _connect(db_path)
+    try:
+        with conn:
+            cursor = conn.execute("""
+                INSERT OR IGNORE INTO ingest_jobs (player_id, seasons, include_details, priority, enqueued_at)
+                VALUES (?, ?, ?, ?, ?)
+            """, (player_id, season_key, int(include_details), priority, time.time()))
+            created = cursor.rowcount == 1
+            if not created:
+                # A waiting request promotes the background job it merged into
+                conn.execute("""
+                    UPDATE ingest_jobs SET priority = MAX(priority, ?), include_details = MAX(include_details, ?)
+                    WHERE player_id = ? AND seasons = ? AND status IN ('queued', 'running')
+                """, (priority, int(include_details), player_id, season_key))
+            job_id = conn.execute("""
+                SELECT id FROM ingest_jobs
+                WHERE player_id = ? AND seasons = ? AND status IN ('queued', 'running')
+            """, (player_id, season_key)).fetchone()[0]
+    finally:
+        conn.close()
+    ENQUEUED.inc(PRIORITY_LABELS.get(priority, priority), "new" if created else "merged")
+    return job_id
+
+
+def wait_for(db_path: str, job_id: int, timeout: float = WAIT_SECONDS) -> str:
+    """Block until the job is done or failed, or `timeout` passes; returns its last status"""
+    started = time.perf_counter()
+    conn = _connect(db_path)
+    try:
+        with metrics.span("ingest_wait"):
+            while True:
+                row = conn.execute("SELECT status FROM ingest_jobs WHERE id = ?", (job_id,)).fetchone()
+                status = row[0] if row else "missing"
+                if status not in ("queued", "running"):
+                    break
+                if time.perf_counter() - started >= timeout:
+                    status = "timeout"
+                    break
+                time.sleep(POLL_SECONDS)
+    finally:
+        conn.close()
+    WAITED.observe(time.perf_counter() - started, status)
+    return status
+
+
+def claim(conn: sqlite3.Connection, worker: str) -> Optional[Dict[str, Any]]:
+    """Lease the highest-priority, oldest queued job to `worker`; None if the queue is empty"""
+    now = time.time()
+    with conn:
+        row = conn.execute(f"""
+            UPDATE ingest_jobs
+            SET status = 'running', started_at = ?, lease_until = ?, worker = ?, attempts = attempts + 1
+            WHERE id = (
+                SELECT id FROM ingest_jobs WHERE status = 'queued'
+                ORDER BY priority DESC, id
+                LIMIT 1
+            )
+            RETURNING {', '.join(JOB_COLUMNS)}
+        """, (now, now + LEASE_SECONDS, worker)).fetchone()
+    if row is None:
+        return None
+    job = dict(zip(JOB_COLUMNS, row))
+    job["seasons"] = job["seasons"].split(",") if job["seasons"] else []
+    job["include_details"] = bool(job["include_details"])
+    QUEUE_SECONDS.observe(job["started_at"] - job["enqueued_at"], PRIORITY_LABELS.get(job["priority"], job["priority"]))
+    return job
+
+
+def finish(conn: sqlite3.Connection, job: Dict[str, Any], games: Optional[int] = None,
+           error: Optional[str] = None) -> str:
+    """Record a job's outcome; a failed job is requeued until it has used MAX_ATTEMPTS claims"""
+    if error is None:
+        status = "done"
+    else:
+        status = "failed" if job["attempts"] >= MAX_ATTEMPTS else "queued"
+    with conn:
+        conn.execute("""
+            UPDATE ingest_jobs SET status = ?, finished_at = ?, lease_until = NULL, games = ?, error = ?
+            WHERE id = ?
+        """, (status, time.time(), games, error, job["id"]))
+    JOBS.inc("retried" if status == "queued" else status)
+    return status
+
+
+def housekeeping(conn: sqlite3.Connection) -> Dict[str, int]:
+    """Requeue jobs whose lease ran out, prune old finished jobs and refresh the depth gauge"""
+    now = time.time()
+    with conn:
+        expired = conn.execute("""
+            UPDATE ingest_jobs
+            SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END,
+                lease_until = NULL, error = 'lease expired'
+            WHERE status = 'running' AND lease_until < ?
+        """, (MAX_ATTEMPTS, now)).rowcount
+        pruned = conn.execute("""
+            DELETE FROM ingest_jobs WHERE status IN ('done', 'failed') AND finished_at < ?
+        """, (now - KEEP_SECONDS,)).rowcount
+    for status in ("queued", "running"):
+        depth = conn.execute("SELECT COUNT(*) FROM ingest_jobs WHERE status = ?", (status,)).fetchone()[0]
+        QUEUE_DEPTH.set(depth, status)
+    return {"expired": expired, "pruned": pruned}
+
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(q * len(values)))], 3)
+
+
+def queue_stats(db_path: str, window_seconds: float = 3600) -> Dict[str, Any]:
+    """Queue depth plus throughput and latency of jobs finished in the last `window_seconds`"""
+    now = time.time()
+    conn = _connect(db_path)
+    try:
+        counts = {status: 0 for status in ("queued", "running", "done", "failed")}
+        counts.update(conn.execute("SELECT status, COUNT(*) FROM ingest_jobs GROUP BY status").fetchall())
+        oldest = conn.execute("SELECT MIN(enqueued_at) FROM ingest_jobs WHERE status = 'queued'").fetchone()[0]
+        recent = conn.execute("""
+            SELECT started_at - enqueued_at, finished_at - started_at FROM ingest_jobs
+            WHERE status = 'done' AND finished_at >= ?
+        """, (now - window_seconds,)).fetchall()
+    finally:
+        conn.close()
+    queue_times = [row[0] for row in recent]
+    run_times = [row[1] for row in recent]
+    return {
+        "mode": MODE,
+        "jobs": counts,
+        "oldest_queued_seconds": round(now - oldest, 1) if oldest else None,
+        "window_seconds": window_seconds,
+        "completed": len(recent),
+        "jobs_per_minute": round(len(recent) / (window_seconds / 60), 2),
+        "queue_seconds": {"p50": _percentile(queue_times, 0.5), "p95": _percentile(queue_times, 0.95)},
+        "run_seconds": {"p50": _percentile(run_times, 0.5), "p95": _percentile(run_times, 0.95)},
+    }
+
+
+class SharedRateLimiter:
+    """upstream.RateLimiter across processes: the next free slot lives in the upstream_rate table"""
+
+    def __init__(self, db_path: str, interval: float, name: str = "stats.nba.com"):
+        self.db_path = db_path
+        self.interval = interval
+        self.name = name
+
+    def wait(self, max_wait: float = None) -> bool:
+        conn = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT, isolation_level=None)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            row = conn.execute("SELECT next_slot FROM upstream_rate WHERE name = ?", (self.name,)).fetchone()
+            slot = max(now, row[0] if row else 0.0)
+            if max_wait is not None and slot - now > max_wait:
+                conn.execute("ROLLBACK")
+                return False
+            conn.execute("INSERT OR REPLACE INTO upstream_rate (name, next_slot) VALUES (?, ?)",
+                         (self.name, slot + self.interval))
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        if slot > now:
+            time.sleep(slot - now)
+        return True
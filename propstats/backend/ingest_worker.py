@@ -0,0 +1,188 @@
+"""
+PropStats Ingest Worker
+Consumes the ingest_jobs queue, so upstream fetches and game_logs writes stay out of the web process
+
+Run it next to an app started with INGEST_MODE=queue, against the same database. Each job
+is handed to the app module's run_ingest_job(), so the worker fetches and stores exactly
+as the in-request refresh did. Several worker processes can share one database: claims
+are atomic and all of them draw upstream slots from one shared rate limiter. Between jobs
+the worker also rebuilds what is derived from game_logs once jobs have written to it
+(opponent defense, missing projection state, the columnar snapshot), and keeps the app's schedule table current so requests never wait on
+that download.
+
+Usage:
+  python ingest_worker.py --app main_v2 --workers 4 [--db nba_props.db] [--metrics-port 9101]
+  python ingest_worker.py --app main --drain      # work through the queue, then exit
+"""
+
+import argparse
+import importlib
+import os
+import signal
+import socket
+import sqlite3
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import colstore
+import db
+import defense
+import freshness
+import ingest
+import metrics
+import projections
+import upstream
+
+IDLE_SECONDS = float(os.getenv("INGEST_IDLE_SECONDS", "0.5"))  # Sleep between polls of an empty queue
+HOUSEKEEPING_SECONDS = float(os.getenv("INGEST_HOUSEKEEPING_SECONDS", "5"))
+CHECKPOINT_SECONDS = float(os.getenv("SQLITE_CHECKPOINT_SECONDS", "60"))  # The worker is the main writer
+DERIVED_SECONDS = float(os.getenv("INGEST_DERIVED_SECONDS", "10"))  # How often to look for new game logs
+
+
+def work(app, db_path: str, name: str, stop: threading.Event, drain: bool):
+    """Claim and run jobs until stopped (or, with `drain`, until the queue is empty)"""
+    conn = sqlite3.connect(db_path, timeout=ingest.BUSY_TIMEOUT)
+    try:
+        while not stop.is_set():
+            job = ingest.claim(conn, name)
+            if job is None:
+                if drain:
+                    return
+                stop.wait(IDLE_SECONDS)
+                continue
+            started = time.perf_counter()
+            try:
+                games = app.run_ingest_job(job["player_id"], job["seasons"], job["include_details"])
+                status = ingest.finish(conn, job, games=games)
+            except Exception as e:
+                status = ingest.finish(conn, job, error=f"{type(e).__name__}: {e}")
+            elapsed = time.perf_counter() - started
+            ingest.RUN_SECONDS.observe(elapsed)
+            print(f"{'✅' if status == 'done' else '❌'} {name}: job {job['id']} player {job['player_id']} "
+                  f"{','.join(job['seasons'])} -> {status} ({elapsed:.2f}s)")
+    finally:
+        conn.close()
+
+
+def refresh_derived(db_path: str, built_from) -> tuple:
+    """Rebuild what is derived from game_logs if it changed since `built_from`; returns the new version
+
+    Versions are colstore.source_version() tuples, (highest id, row count).
+    """
+    conn = sqlite3.connect(db_path, timeout=ingest.BUSY_TIMEOUT)
+    try:
+        version = colstore.source_version(conn)
+        if version == built_from:
+            return version
+        since_id = built_from[0] if built_from else 0
+        seasons = [row[0] for row in conn.execute("SELECT DISTINCT season FROM game_logs WHERE id > ?", (since_id,))]
+        if not seasons:
+            # Only deletes since the last build, which can touch any season
+            seasons = [row[0] for row in conn.execute("SELECT DISTINCT season FROM game_logs")]
+        started = time.perf_counter()
+        for season in seasons:
+            defense.rebuild(conn, season)
+        backfilled = projections.backfill(conn, since_id)
+        print(f"✅ Opponent defense rebuilt for {', '.join(seasons) or 'no seasons'}, "
+              f"{backfilled} projection states backfilled ({time.perf_counter() - started:.2f}s)")
+        # Written to a temp file and swapped in, so the apps never map a partial snapshot
+        colstore.export_snapshot(db_path)
+    except (OSError, sqlite3.Error) as e:
+        print(f"❌ Rebuilding derived data failed: {e}")
+        return built_from
+    finally:
+        conn.close()
+    return version
+
+
+def refresh_schedule(db_path: str, season: str) -> float:
+    """Download the schedule if the stored copy has aged out; returns when to check again (monotonic)"""
+    ok = freshness.download_schedule(db_path, season)
+    return time.monotonic() + (HOUSEKEEPING_SECONDS if ok else freshness.RETRY_SECONDS)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve_metrics(port: int) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("0.0.0.0", port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run ingest jobs queued by the web apps")
+    parser.add_argument("--app", default=os.getenv("INGEST_APP", "main"), choices=["main", "main_v2"],
+                        help="App whose fetch and store code runs the jobs")
+    parser.add_argument("--db", default=os.getenv("DATABASE_PATH", "nba_props.db"), help="SQLite database path")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("INGEST_WORKERS", "2")),
+                        help="Concurrent jobs in this process")
+    parser.add_argument("--metrics-port", type=int, default=int(os.getenv("INGEST_METRICS_PORT", "0")),
+                        help="Serve /metrics on this port (0 disables)")
+    parser.add_argument("--drain", action="store_true", help="Exit once the queue is empty")
+    args = parser.parse_args()
+
+    # Apps read DATABASE_PATH and run their migrations at import time
+    os.environ["DATABASE_PATH"] = args.db
+    app = importlib.import_module(args.app)
+    upstream.set_limiter(ingest.SharedRateLimiter(args.db, upstream.MIN_INTERVAL))
+    if args.metrics_port:
+        serve_metrics(args.metrics_port)
+
+    stop = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stop.set())
+
+    prefix = f"{socket.gethostname()}:{os.getpid()}"
+    threads = [
+        threading.Thread(target=work, args=(app, args.db, f"{prefix}/{i}", stop, args.drain), name=f"ingest-{i}")
+        for i in range(args.workers)
+    ]
+    conn = sqlite3.connect(args.db, timeout=ingest.BUSY_TIMEOUT)
+    ingest.housekeeping(conn)
+    for thread in threads:
+        thread.start()
+    print(f"🚚 Ingest worker {prefix}: {args.workers} workers for {args.app} on {args.db}")
+
+    # Housekeeping runs here; on a signal the threads finish their current job, then exit
+    last_housekeeping = last_checkpoint = last_derived = time.monotonic()
+    derived_version = refresh_derived(args.db, None)
+    schedule_due = refresh_schedule(args.db, app.FRESHNESS.season)
+    while any(thread.is_alive() for thread in threads):
+        stop.wait(IDLE_SECONDS)
+        if time.monotonic() - last_housekeeping >= HOUSEKEEPING_SECONDS:
+            last_housekeeping = time.monotonic()
+            result = ingest.housekeeping(conn)
+            if result["expired"]:
+                print(f"⚠️  Requeued {result['expired']} jobs whose lease ran out")
+        # Checked often, but only downloads once the stored schedule is FRESHNESS_SCHEDULE_HOURS old
+        if time.monotonic() >= schedule_due:
+            schedule_due = refresh_schedule(args.db, app.FRESHNESS.season)
+        if time.monotonic() - last_derived >= DERIVED_SECONDS:
+            last_derived = time.monotonic()
+            derived_version = refresh_derived(args.db, derived_version)
+        if time.monotonic() - last_checkpoint >= CHECKPOINT_SECONDS:
+            last_checkpoint = time.monotonic()
+            db.checkpoint(args.db)
+    conn.close()
+    refresh_derived(args.db, derived_version)
+    db.checkpoint(args.db)
+    print(f"✅ Ingest worker {prefix} stopped")
+
+
+if __name__ == "__main__":
+    main()
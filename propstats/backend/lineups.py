@@ -0,0 +1,201 @@
+"""
+PropStats Lineup Index
+Sorted game-id arrays per player-season and team-season, for with/without-teammate splits
+
+Every stored game log contributes its game id (as an int64) to its player's array, with a
+parallel array of team codes, and to its team's array. "How does A do when B sits" is then
+set algebra on sorted arrays:
+  with     A's games where B played for the same team
+  without  A's games for B's team, inside B's first..last game with that team, that B missed
+so trades and mid-season signings only count the stretch the two were teammates.
+
+The index is built once per process and kept current incrementally: game_logs ids are
+AUTOINCREMENT, so rows written since the last refresh are `id > max_id` (a rowid range),
+and only those players' arrays are reloaded. When another process empties game_logs
+(clear-cache swaps it aside), the table's generation moves and the index starts over.
+"""
+
+import threading
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+import migrations
+
+EMPTY = np.zeros(0, dtype=np.int64)
+
+
+def game_number(game_id) -> Optional[int]:
+    try:
+        return int(game_id)
+    except (TypeError, ValueError):
+        return None
+
+
+class LineupIndex:
+    """game ids per (player_id, season) and per (team, season), as sorted int64 arrays"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clear()
+
+    def _clear(self):
+        self.generation = 0
+        self.max_id = 0
+        self.teams: List[str] = []
+        self._team_codes: Dict[str, int] = {}
+        # (player_id, season) -> (sorted game ids, team code per game)
+        self.player_games: Dict[Tuple[str, str], Tuple[np.ndarray, np.ndarray]] = {}
+        self.team_games: Dict[Tuple[str, str], np.ndarray] = {}
+        self._team_members: Dict[Tuple[str, str], Set[str]] = {}
+
+    def _team_code(self, team: Optional[str]) -> int:
+        team = team or ""
+        if team not in self._team_codes:
+            self._team_codes[team] = len(self.teams)
+            self.teams.append(team)
+        return self._team_codes[team]
+
+    def refresh(self, cursor) -> int:
+        """Load rows written since the last refresh; returns the number of players reloaded"""
+        cursor.execute("SELECT MAX(id) FROM game_logs")
+        max_id = cursor.fetchone()[0] or 0
+        generation = migrations.generation(cursor.connection, "game_logs")
+        if (generation, max_id) == (self.generation, self.max_id):
+            return 0
+        with self._lock:
+            if (generation, max_id) == (self.generation, self.max_id):
+                return 0
+            if generation != self.generation:
+                self._clear()
+                self.generation = generation
+            cursor.execute("SELECT player_id FROM game_logs WHERE id > ?", (self.max_id,))
+            players = list(dict.fromkeys(row[0] for row in cursor.fetchall()))
+            for start in range(0, len(players), 500):
+                self._load_players(cursor, players[start:start + 500])
+            self.max_id = max_id
+            return len(players)
+
+    def _load_players(self, cursor, players: List[str]):
+        reloaded = set(players)
+        cursor.execute(f"""
+            SELECT player_id, season, game_id, team_abbreviation FROM game_logs
+            WHERE player_id IN ({', '.join('?' * len(players))})
+        """, players)
+        loaded: Dict[Tuple[str, str], List[Tuple[int, int]]] = {}
+        for player_id, season, game_id, team in cursor.fetchall():
+            number = game_number(game_id)
+            if number is not None:
+                loaded.setdefault((player_id, season), []).append((number, self._team_code(team)))
+
+        touched: Set[Tuple[str, str]] = set()
+        for key in [k for k in self.player_games if k[0] in reloaded]:
+            touched |= self._teams_of(key)
+            del self.player_games[key]
+        new_teams = {}
+        for key, games in loaded.items():
+            games.sort()
+            self.player_games[key] = (
+                np.fromiter((g for g, _ in games), dtype=np.int64, count=len(games)),
+                np.fromiter((t for _, t in games), dtype=np.int32, count=len(games)),
+            )
+            new_teams[key] = self._teams_of(key)
+            touched |= new_teams[key]
+
+        # Re-derive membership and the game array of every team these players played for
+        for team_key in touched:
+            self._team_members[team_key] = {p for p in self._team_members.get(team_key, ()) if p not in reloaded}
+        for (player_id, _), teams in new_teams.items():
+            for team_key in teams:
+                self._team_members[team_key].add(player_id)
+        for team, season in touched:
+            self.team_games[(team, season)] = self._team_array(team, season, self._team_members[(team, season)])
+
+    def _teams_of(self, key: Tuple[str, str]) -> Set[Tuple[str, str]]:
+        entry = self.player_games.get(key)
+        if entry is None:
+            return set()
+        return {(self.teams[code], key[1]) for code in np.unique(entry[1]).tolist() if self.teams[code]}
+
+    def _team_array(self, team: str, season: str, members: Set[str]) -> np.ndarray:
+        code = self._team_codes[team]
+        parts = [ids[codes == code] for ids, codes in (self.player_games[(p, season)] for p in members)]
+        return np.unique(np.concatenate(parts)) if parts else EMPTY
+
+    def games(self, player_id: str, season: str) -> Tuple[np.ndarray, np.ndarray]:
+        return self.player_games.get((player_id, season), (EMPTY, EMPTY))
+
+    def with_without(self, player_id: str, teammate_id: str, season: str) -> Dict[str, Any]:
+        """Game-id sets for the player with and without the teammate, plus team games the teammate missed"""
+        ids, codes = self.games(player_id, season)
+        mate_ids, mate_codes = self.games(teammate_id, season)
+
+        with_ids, without_parts, missed = [], [], 0
+        for code in np.unique(mate_codes).tolist():
+            team = self.teams[code]
+            if not team:
+                continue
+            stint = mate_ids[mate_codes == code]
+            first, last = stint[0], stint[-1]
+            mine = ids[codes == code]
+            with_ids.append(np.intersect1d(mine, stint, assume_unique=True))
+            window = mine[(mine >= first) & (mine <= last)]
+            without_parts.append(np.setdiff1d(window, stint, assume_unique=True))
+            team_window = self.team_games.get((team, season), EMPTY)
+            team_window = team_window[(team_window >= first) & (team_window <= last)]
+            missed += len(np.setdiff1d(team_window, stint, assume_unique=True))
+
+        return {
+            "with": np.concatenate(with_ids) if with_ids else EMPTY,
+            "without": np.concatenate(without_parts) if without_parts else EMPTY,
+            "teammate_games": len(mate_ids),
+            "teammate_missed": missed,
+        }
+
+    def stats(self) -> Dict[str, int]:
+        return {"players": len({p for p, _ in self.player_games}), "teams": len(self.team_games), "max_id": self.max_id}
+
+    def reset(self):
+        with self._lock:
+            self._clear()
+
+
+lineup_index = LineupIndex()
+
+
+def _summary(values: np.ndarray, line: float) -> Dict[str, Any]:
+    if not len(values):
+        return {"games": 0, "average": 0, "hits": 0, "pct": 0}
+    hits = int((values > line).sum())
+    return {
+        "games": len(values),
+        "average": round(float(values.mean()), 1),
+        "hits": hits,
+        "pct": round(hits / len(values) * 100, 1),
+    }
+
+
+def teammate_split(cursor, player_id: str, teammate_id: str, season: str, stat_expr: str,
+                   line: float) -> Dict[str, Any]:
+    """`without` block of the analysis response"""
+    lineup_index.refresh(cursor)
+    sets = lineup_index.with_without(player_id, teammate_id, season)
+
+    cursor.execute(f"""
+        SELECT game_id, COALESCE({stat_expr}, 0) FROM game_logs
+        WHERE player_id = ? AND season = ?
+    """, (player_id, season))
+    rows = [(game_number(g), v) for g, v in cursor.fetchall()]
+    ids = np.array([g for g, _ in rows if g is not None], dtype=np.int64)
+    values = np.array([v for g, v in rows if g is not None], dtype=np.float64)
+
+    cursor.execute("SELECT full_name FROM players WHERE player_id = ?", (teammate_id,))
+    name = cursor.fetchone()
+    return {
+        "teammate": {"id": teammate_id, "name": name[0] if name else None},
+        "teammates": bool(len(sets["with"]) or len(sets["without"])),
+        "teammate_games": sets["teammate_games"],
+        "teammate_missed": sets["teammate_missed"],
+        "with": _summary(values[np.isin(ids, sets["with"], assume_unique=True)], line),
+        "without": _summary(values[np.isin(ids, sets["without"], assume_unique=True)], line),
+    }
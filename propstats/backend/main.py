@@ -3,16 +3,31 @@ PropStats API v3.0 - NBA Props Research
 2025-26 Season - Auto-refreshing data
 """
 
-from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi import BackgroundTasks, FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-import sqlite3
+from fastapi.responses import JSONResponse, PlainTextResponse
 import os
-from datetime import datetime, timedelta
 import time
+from typing import Optional, Tuple
 
-# NBA API imports
-from nba_api.stats.static import players
-from nba_api.stats.endpoints import playergamelog, commonplayerinfo
+import compression
+import db
+import defense
+import exports
+import freshness
+import ingest
+import lineups
+import metrics
+import migrations
+import payloads
+import probability
+import profiler
+import projections
+import storage
+import upstream
+from metrics import span
+from roster import FREE_AGENT, get_roster, refresh_roster
+from splits import compute_splits, parse_dimensions
 
 app = FastAPI(title="PropStats API", version="3.0.0")
 
@@ -24,9 +39,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+compression.install(app)
+metrics.install(app)
+
 DB_PATH = os.getenv("DATABASE_PATH", "propstats.db")
 CURRENT_SEASON = "2025-26"  # Current NBA season (Oct 2025 - June 2026)
-REFRESH_HOURS = 6  # Refresh data if older than this
+REFRESH_HOURS = 6  # Fallback TTL when the schedule is unavailable or the team is unknown
 
 TEAM_INFO = {
     "ATL": {"name": "Hawks", "color": "#E03A3E"},
@@ -62,86 +80,61 @@ TEAM_INFO = {
 }
 
 def init_db():
-    """Initialize database tables"""
-    conn = sqlite3.connect(DB_PATH)
+    """Create or upgrade the shared database schema"""
+    migrations.migrate(DB_PATH)
+
+init_db()
+
+# Replicas sharing one dataset pull each other's ingests from STORAGE_URL (storage.py)
+STORAGE = storage.from_env(DB_PATH)
+if STORAGE.shared:
+    storage.start_sync(STORAGE, DB_PATH)
+
+def load_roster_teams() -> dict:
+    """Known team assignments to overlay on the static roster"""
+    conn = db.connect(DB_PATH)
     c = conn.cursor()
-    
     c.execute("""
-        CREATE TABLE IF NOT EXISTS players (
-            player_id TEXT PRIMARY KEY,
-            full_name TEXT NOT NULL,
-            team TEXT,
-            position TEXT,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
+        SELECT player_id, team_abbreviation FROM players
+        WHERE team_abbreviation IS NOT NULL AND team_abbreviation != ''
     """)
-    
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS game_logs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            player_id TEXT NOT NULL,
-            game_id TEXT,
-            game_date TEXT,
-            opponent TEXT,
-            is_home INTEGER,
-            result TEXT,
-            minutes REAL,
-            points INTEGER,
-            rebounds INTEGER,
-            assists INTEGER,
-            steals INTEGER,
-            blocks INTEGER,
-            fg3m INTEGER,
-            turnovers INTEGER,
-            season TEXT,
-            fetched_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            UNIQUE(player_id, game_id)
-        )
-    """)
-    
-    c.execute("CREATE INDEX IF NOT EXISTS idx_player_season ON game_logs(player_id, season)")
-    conn.commit()
+    teams = dict(c.fetchall())
     conn.close()
+    return teams
 
-init_db()
+refresh_roster(load_roster_teams())
 
 def get_headshot(player_id: str) -> str:
     return f"https://cdn.nba.com/headshots/nba/latest/1040x760/{player_id}.png"
 
-def fetch_player_games(player_id: str) -> int:
-    """Fetch current season games from NBA API"""
+# Row layout built by fetch_player_games
+GAME_ROW_COLUMNS = (
+    "player_id", "game_id", "game_date", "team_abbreviation", "opponent_abbreviation", "is_home", "game_result",
+    "minutes_played", "points", "rebounds", "assists", "steals", "blocks", "fg3m", "turnovers", "season"
+)
+
+def fetch_player_games(player_id: str, raise_errors: bool = False) -> int:
+    """Fetch current season games from NBA API; a failed fetch returns 0 unless `raise_errors`"""
     try:
-        time.sleep(0.6)  # Rate limit
-        
-        gamelog = playergamelog.PlayerGameLog(
-            player_id=player_id,
-            season=CURRENT_SEASON,
-            season_type_all_star='Regular Season'
-        )
-        
-        data = gamelog.get_dict()
+        data = upstream.player_game_log(player_id, CURRENT_SEASON)
         
         if not data.get('resultSets') or not data['resultSets'][0].get('rowSet'):
             print(f"No games found for player {player_id} in {CURRENT_SEASON}")
+            freshness.note_fetch(DB_PATH, player_id, CURRENT_SEASON, 0)
             return 0
         
         headers = data['resultSets'][0]['headers']
         rows = data['resultSets'][0]['rowSet']
         
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        
-        # Clear old data for this player/season and re-fetch
-        c.execute("DELETE FROM game_logs WHERE player_id = ? AND season = ?", (player_id, CURRENT_SEASON))
-        
-        count = 0
+        games = []
         for row in rows:
             game = dict(zip(headers, row))
-            
+        
             matchup = game.get('MATCHUP', '')
             is_home = 1 if 'vs.' in matchup else 0
+            team = matchup.split()[0] if matchup else ''
             opponent = matchup.split()[-1] if matchup else ''
-            
+        
             # Parse minutes
             mins = 0
             min_str = str(game.get('MIN', '0'))
@@ -154,16 +147,12 @@ def fetch_player_games(player_id: str) -> int:
                         mins = float(min_str)
                     except:
                         mins = 0
-            
-            c.execute("""
-                INSERT OR REPLACE INTO game_logs 
-                (player_id, game_id, game_date, opponent, is_home, result, minutes,
-                 points, rebounds, assists, steals, blocks, fg3m, turnovers, season, fetched_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, datetime('now'))
-            """, (
+        
+            games.append((
                 player_id,
                 game.get('Game_ID', ''),
                 game.get('GAME_DATE', ''),
+                team,
                 opponent,
                 is_home,
                 game.get('WL', ''),
@@ -177,40 +166,89 @@ def fetch_player_games(player_id: str) -> int:
                 game.get('TOV', 0) or 0,
                 CURRENT_SEASON
             ))
-            count += 1
         
-        conn.commit()
-        conn.close()
+        # Parsed up front so the write transaction is only the delete and the inserts;
+        # readers keep seeing the previous rows until it commits
+        with span("db_write"):
+            conn = db.connect(DB_PATH)
+            try:
+                with conn:
+                    c = conn.cursor()
+                    c.execute("DELETE FROM game_logs WHERE player_id = ? AND season = ?", (player_id, CURRENT_SEASON))
+                    c.executemany(f"""
+                        INSERT OR REPLACE INTO game_logs ({', '.join(GAME_ROW_COLUMNS)}, fetched_at)
+                        VALUES ({', '.join('?' * len(GAME_ROW_COLUMNS))}, datetime('now'))
+                    """, games)
+                    projections.update(c, player_id, CURRENT_SEASON)
+                    freshness.clear_miss(c, player_id, CURRENT_SEASON)
+            finally:
+                conn.close()
+        if STORAGE.shared:
+            try:
+                with span("storage_write"):
+                    STORAGE.store_game_logs(GAME_ROW_COLUMNS, games, replace=(player_id, CURRENT_SEASON))
+            except Exception as e:
+                print(f"❌ Error writing games to the shared store: {e}")
+        count = len(games)
         print(f"✅ Fetched {count} games for player {player_id} ({CURRENT_SEASON})")
         return count
         
     except Exception as e:
         print(f"❌ Error fetching games: {e}")
+        # A call refused by the breaker or cut by the deadline says nothing about this player
+        if not isinstance(e, upstream.NOT_SENT):
+            freshness.note_fetch(DB_PATH, player_id, CURRENT_SEASON, 0, error=f"{type(e).__name__}: {e}")
+        if raise_errors:
+            raise
         return 0
 
-def needs_refresh(player_id: str) -> bool:
-    """Check if player data needs refreshing"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+def run_ingest_job(player_id: str, seasons: list, include_details: bool) -> int:
+    """ingest_worker entry point; v3 only stores the current season.
     
-    c.execute("""
-        SELECT fetched_at FROM game_logs 
-        WHERE player_id = ? AND season = ?
-        ORDER BY fetched_at DESC LIMIT 1
-    """, (player_id, CURRENT_SEASON))
+    Raises when the fetch failed, so the worker retries the job and counts it as failed.
+    """
+    with metrics.refreshing():
+        return fetch_player_games(player_id, raise_errors=True)
+
+def refresh_player_games(player_id: str):
+    """fetch_player_games in this request, or through the ingest worker when INGEST_MODE=queue.
+    
+    A queued refresh only waits (up to INGEST_WAIT_SECONDS) when nothing is stored yet;
+    otherwise the stored games are served while the worker catches up.
+    """
+    if not ingest.QUEUED:
+        with metrics.refreshing():
+            fetch_player_games(player_id)
+        return
     
-    row = c.fetchone()
+    conn = db.connect(DB_PATH)
+    c = conn.cursor()
+    c.execute("SELECT 1 FROM game_logs WHERE player_id = ? AND season = ? LIMIT 1", (player_id, CURRENT_SEASON))
+    cold = c.fetchone() is None
     conn.close()
     
-    if not row:
-        return True
+    priority = ingest.PRIORITY_WAITING if cold else ingest.PRIORITY_BACKGROUND
+    job_id = ingest.enqueue(DB_PATH, player_id, [CURRENT_SEASON], include_details=False, priority=priority)
+    if cold:
+        ingest.wait_for(DB_PATH, job_id)
+
+# Stored games go stale when the player's team finishes a game (freshness.py); in queue mode
+# the ingest worker downloads the schedule
+FRESHNESS = freshness.ScheduleOracle(CURRENT_SEASON, download=not ingest.QUEUED)
+
+def needs_refresh(player_id: str) -> Tuple[bool, str]:
+    """Check if player data needs refreshing; returns (stale, reason) from freshness.ScheduleOracle.decide"""
+    conn = db.connect(DB_PATH)
+    c = conn.cursor()
+    _, last_sync, team = freshness.player_state(c, player_id, CURRENT_SEASON)
+    miss = freshness.load_miss(c, player_id, CURRENT_SEASON)
+    conn.close()
     
-    try:
-        fetched = datetime.strptime(row[0], "%Y-%m-%d %H:%M:%S")
-        age_hours = (datetime.now() - fetched).total_seconds() / 3600
-        return age_hours > REFRESH_HOURS
-    except:
-        return True
+    ttl_stale = last_sync is None or time.time() - last_sync > REFRESH_HOURS * 3600
+    FRESHNESS.ensure(DB_PATH)
+    roster_match = get_roster().get(player_id)
+    return FRESHNESS.decide((team, roster_match.team if roster_match else None), CURRENT_SEASON,
+                            last_sync, ttl_stale, miss=miss)
 
 @app.get("/")
 def root():
@@ -218,40 +256,93 @@ def root():
 
 @app.get("/health")
 def health():
-    return {"status": "healthy", "season": CURRENT_SEASON, "refresh_hours": REFRESH_HOURS}
+    return {
+        "status": "healthy",
+        "season": CURRENT_SEASON,
+        "refresh_hours": REFRESH_HOURS,
+        "roster": get_roster().stats()
+    }
+
+@app.get("/ready")
+def ready():
+    """Readiness: 503 only if the database cannot be read; an open upstream breaker reports degraded"""
+    try:
+        conn = db.connect(DB_PATH)
+        conn.execute("SELECT 1 FROM game_logs LIMIT 1").fetchall()
+        conn.close()
+        database = "ok"
+    except Exception as e:
+        database = f"error: {e}"
+    breaker = upstream.breaker.status()
+    body = {
+        # Stored games are still served while stats.nba.com is down, so degraded stays in rotation
+        "status": "unavailable" if database != "ok" else "ready" if breaker["state"] == "closed" else "degraded",
+        "database": database,
+        "upstream": breaker,
+    }
+    return JSONResponse(status_code=200 if database == "ok" else 503, content=body)
 
 @app.get("/players/search")
 def search_players(q: str = Query(..., min_length=2)):
     """Search for players"""
-    all_players = players.get_active_players()
-    
-    matches = [p for p in all_players if q.lower() in p['full_name'].lower()][:15]
+    matches = get_roster().search(q, limit=15)
     
     return {
         "players": [
             {
-                "id": str(p['id']),
-                "name": p['full_name'],
-                "team": p.get('team_abbreviation', 'FA') or 'FA',
+                "id": p.id,
+                "name": p.full_name,
+                "team": p.team,
                 "position": "",
-                "headshot": get_headshot(p['id'])
+                "headshot": get_headshot(p.id)
             }
             for p in matches
         ]
     }
 
 @app.get("/players/{player_id}/analysis")
+@profiler.watch_slow
 def get_analysis(
     player_id: str,
     stat: str = Query(..., regex="^(points|rebounds|assists|threes|steals|blocks|pra)$"),
-    line: float = Query(..., ge=0)
+    line: float = Query(..., ge=0),
+    vs: Optional[str] = Query(None, description="Opponent abbreviation, e.g. BOS"),
+    splits: Optional[str] = Query(None, description="Comma-separated split dimensions (default all)"),
+    columnar: bool = Query(False, description="Return games as one list per field"),
+    model: str = Query("negbin", regex="^(negbin|empirical)$", description="Probability model"),
+    minutes: Optional[float] = Query(None, ge=0, le=48, description="Expected minutes for the projection"),
+    without: Optional[str] = Query(None, description="Teammate player id for with/without splits")
 ):
     """Get player analysis for a specific stat and line - 2025-26 season only"""
     
+    try:
+        split_dimensions = parse_dimensions(splits)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if without == player_id:
+        raise HTTPException(status_code=400, detail="without must be a different player")
+    
+    if vs is not None:
+        vs = vs.upper()
+        if vs not in TEAM_INFO:
+            raise HTTPException(status_code=400, detail=f"Unknown team: {vs}")
+    
     # Check if we need fresh data
-    if needs_refresh(player_id):
+    with span("needs_refresh"):
+        stale, freshness_reason = needs_refresh(player_id)
+    metrics.CACHE_REQUESTS.inc("miss" if stale else "hit")
+    stale_reason = None
+    if freshness_reason == "backoff_error":
+        # The last refresh failed and is backing off: what is stored is known to be behind
+        stale_reason = "upstream_backoff"
+        upstream.STALE_SERVED.inc(stale_reason)
+    if stale:
         print(f"🔄 Refreshing data for {player_id} ({CURRENT_SEASON})...")
-        fetch_player_games(player_id)
+        # Bounded by UPSTREAM_DEADLINE; on failure the stored games are served, flagged stale
+        with upstream.deadline() as budget:
+            refresh_player_games(player_id)
+        stale_reason = upstream.served_stale(budget) or stale_reason
     
     # Map stat to column
     stat_map = {
@@ -266,55 +357,82 @@ def get_analysis(
     
     stat_col = stat_map.get(stat, "points")
     
-    conn = sqlite3.connect(DB_PATH)
+    conn = db.connect(DB_PATH)
     c = conn.cursor()
     
     # Get games for 2025-26 season ONLY
-    c.execute(f"""
-        SELECT 
-            game_date,
-            opponent,
-            {stat_col} as value,
-            is_home,
-            result,
-            minutes,
-            points,
-            rebounds,
-            assists,
-            fg3m,
-            steals,
-            blocks
-        FROM game_logs
-        WHERE player_id = ? AND season = ?
-        ORDER BY game_date DESC
-        LIMIT 30
-    """, (player_id, CURRENT_SEASON))
-    
-    rows = c.fetchall()
+    with span("db_read"):
+        c.execute(f"""
+            SELECT 
+                game_date,
+                opponent_abbreviation,
+                {stat_col} as value,
+                is_home,
+                game_result,
+                minutes_played,
+                points,
+                rebounds,
+                assists,
+                fg3m,
+                steals,
+                blocks
+            FROM game_logs
+            WHERE player_id = ? AND season = ?
+            ORDER BY game_day DESC
+            LIMIT 30
+        """, (player_id, CURRENT_SEASON))
+        rows = c.fetchall()
+    
+    matchup = None
+    if vs:
+        with span("matchup"):
+            matchup = defense.matchup(c, player_id, vs, CURRENT_SEASON, stat, stat_col, line)
+    with span("splits"):
+        split_results = compute_splits(c, player_id, CURRENT_SEASON, stat_col, line, split_dimensions)
+    with span("probability"):
+        price = probability.price_line(c, player_id, CURRENT_SEASON, stat, line, model)
+    with span("projection"):
+        projection = projections.project(c, player_id, CURRENT_SEASON, stat, minutes)
+    teammate = None
+    if without:
+        with span("teammates"):
+            teammate = lineups.teammate_split(c, player_id, without, CURRENT_SEASON, stat_col, line)
     conn.close()
     
+    if not rows and stale_reason:
+        raise HTTPException(status_code=503, detail="stats.nba.com is unavailable and no games are stored",
+                            headers={"Retry-After": str(upstream.retry_after())})
+    
     if not rows:
-        return {
+        return payloads.json_response({
             "player_id": player_id,
             "stat": stat,
             "line": line,
             "season": CURRENT_SEASON,
             "games": [],
-            "message": f"No games found for {CURRENT_SEASON} season. Data refreshes every {REFRESH_HOURS} hours."
-        }
-    
-    games = []
-    for row in rows:
-        value = row[2] if row[2] is not None else 0
-        games.append({
-            "date": row[0],
-            "opponent": row[1],
-            "value": value,
-            "is_home": bool(row[3]),
-            "result": row[4],
-            "minutes": row[5],
-            "hit": value > line
-        })
+            "message": f"No games found for {CURRENT_SEASON} season. Data refreshes every {REFRESH_HOURS} hours.",
+            "vs": matchup,
+            "splits": split_results,
+            "probability": price,
+            "projection": projection,
+            "without": teammate,
+            "stale": stale_reason is not None,
+            "stale_reason": stale_reason
+        }, columnar)
+    
+    with span("aggregate"):
+        games = []
+        for row in rows:
+            value = row[2] if row[2] is not None else 0
+            games.append({
+                "date": row[0],
+                "opponent": row[1],
+                "value": value,
+                "is_home": bool(row[3]),
+                "result": row[4],
+                "minutes": row[5],
+                "hit": value > line
+            })
     
     # Calculate stats
     values = [g['value'] for g in games]
@@ -326,7 +444,7 @@ def get_analysis(
         hits = sum(1 for g in game_list if g['hit'])
         return {"hits": hits, "total": len(game_list), "pct": round(hits / len(game_list) * 100)}
     
-    return {
+    return payloads.json_response({
         "player_id": player_id,
         "stat": stat,
         "line": line,
@@ -343,8 +461,60 @@ def get_analysis(
             "l20": hit_rate(games[:20]),
             "home": hit_rate([g for g in games if g['is_home']]),
             "away": hit_rate([g for g in games if not g['is_home']])
-        }
-    }
+        },
+        "vs": matchup,
+        "splits": split_results,
+        "probability": price,
+        "projection": projection,
+        "without": teammate,
+        "stale": stale_reason is not None,
+        "stale_reason": stale_reason
+    }, columnar)
+
+@app.post("/slate")
+def price_slate(slate: probability.SlateRequest):
+    """P(over)/P(under) for many player-stat-line legs at once"""
+    try:
+        probability.validate_slate(slate)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    season = slate.season or CURRENT_SEASON
+    conn = db.connect(DB_PATH)
+    with span("probability"):
+        results = probability.price_slate(conn.cursor(), season, [leg.model_dump() for leg in slate.legs], slate.model)
+    conn.close()
+    return payloads.json_response({"season": season, "model": slate.model, "legs": results})
+
+@app.get("/games.ndjson")
+def export_games(
+    request: Request,
+    season: Optional[str] = None,
+    date_from: Optional[str] = Query(None, description="First game date, YYYY-MM-DD"),
+    date_to: Optional[str] = Query(None, description="Last game date, YYYY-MM-DD"),
+    columns: Optional[str] = Query(None, description="Comma-separated game_logs columns (default all)")
+):
+    """Every stored game log as NDJSON, streamed (gzip if accepted)"""
+    try:
+        return exports.stream_games(DB_PATH, request.headers.get("accept-encoding", ""),
+                                    season=season, date_from=date_from, date_to=date_to, columns=columns)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/players/{player_id}/games.ndjson")
+def export_player_games(
+    request: Request,
+    player_id: str,
+    season: Optional[str] = None,
+    date_from: Optional[str] = Query(None, description="First game date, YYYY-MM-DD"),
+    date_to: Optional[str] = Query(None, description="Last game date, YYYY-MM-DD"),
+    columns: Optional[str] = Query(None, description="Comma-separated game_logs columns (default all)")
+):
+    """A player's full stored game history as NDJSON, streamed (gzip if accepted)"""
+    try:
+        return exports.stream_games(DB_PATH, request.headers.get("accept-encoding", ""), player_id=player_id,
+                                    season=season, date_from=date_from, date_to=date_to, columns=columns)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @app.post("/admin/sync-players")
 def sync_players(secret: str = Query(...)):
@@ -352,17 +522,22 @@ def sync_players(secret: str = Query(...)):
     if secret != os.getenv("ADMIN_SECRET", "propstats2024"):
         raise HTTPException(status_code=403, detail="Invalid secret")
     
-    all_players = players.get_active_players()
+    roster = refresh_roster(load_roster_teams())
     
-    conn = sqlite3.connect(DB_PATH)
+    conn = db.connect(DB_PATH)
     c = conn.cursor()
     
     count = 0
-    for p in all_players:
+    for p in roster.records:
+        # The roster's FA placeholder means "team unknown", which must not overwrite a stored team
         c.execute("""
-            INSERT OR REPLACE INTO players (player_id, full_name, updated_at)
-            VALUES (?, ?, datetime('now'))
-        """, (str(p['id']), p['full_name']))
+            INSERT INTO players (player_id, full_name, team_abbreviation, updated_at)
+            VALUES (?, ?, ?, datetime('now'))
+            ON CONFLICT(player_id) DO UPDATE SET
+                full_name = excluded.full_name,
+                team_abbreviation = COALESCE(excluded.team_abbreviation, players.team_abbreviation),
+                updated_at = excluded.updated_at
+        """, (p.id, p.full_name, None if p.team == FREE_AGENT else p.team))
         count += 1
     
     conn.commit()
@@ -376,22 +551,107 @@ def refresh_player(player_id: str, secret: str = Query(...)):
     if secret != os.getenv("ADMIN_SECRET", "propstats2024"):
         raise HTTPException(status_code=403, detail="Invalid secret")
     
+    if ingest.QUEUED:
+        job_id = ingest.enqueue(DB_PATH, player_id, [CURRENT_SEASON], include_details=False)
+        return {"player_id": player_id, "job_id": job_id, "status": "queued", "season": CURRENT_SEASON}
+    
     count = fetch_player_games(player_id)
     return {"player_id": player_id, "games_fetched": count, "season": CURRENT_SEASON}
 
+@app.get("/admin/ingest")
+def admin_ingest(secret: str = Query(...), window: int = Query(3600, ge=60, le=86400)):
+    """Ingest queue depth, plus throughput and latency over the last `window` seconds"""
+    if secret != os.getenv("ADMIN_SECRET", "propstats2024"):
+        raise HTTPException(status_code=403, detail="Invalid secret")
+    
+    return ingest.queue_stats(DB_PATH, window)
+
+@app.get("/admin/freshness")
+def admin_freshness(secret: str = Query(...), team: Optional[str] = Query(None, description="Team abbreviation, e.g. BOS")):
+    """Refresh decisions, avoided upstream calls and negative cache entries; `team` adds its last and next game"""
+    if secret != os.getenv("ADMIN_SECRET", "propstats2024"):
+        raise HTTPException(status_code=403, detail="Invalid secret")
+    
+    FRESHNESS.ensure(DB_PATH)
+    report = FRESHNESS.report()
+    report["negative_cache"] = freshness.miss_stats(DB_PATH)
+    if team is not None:
+        team = team.upper()
+        if team not in TEAM_INFO:
+            raise HTTPException(status_code=400, detail=f"Unknown team: {team}")
+        report["team"] = FRESHNESS.team_report(team)
+    return report
+
+@app.post("/admin/rebuild-defense")
+def rebuild_defense(secret: str = Query(...)):
+    """Recompute per-opponent defensive splits for the current season"""
+    if secret != os.getenv("ADMIN_SECRET", "propstats2024"):
+        raise HTTPException(status_code=403, detail="Invalid secret")
+    
+    return defense.rebuild_seasons(DB_PATH, [CURRENT_SEASON])
+
 @app.delete("/admin/clear-cache")
-def clear_cache(secret: str = Query(...)):
-    """Clear all cached game data to force refresh"""
+def clear_cache(background_tasks: BackgroundTasks, secret: str = Query(...)):
+    """Clear all cached game data to force refresh.
+    
+    game_logs is swapped for an empty table in one short transaction instead of deleted
+    row by row; the old table is dropped after the response is sent.
+    """
     if secret != os.getenv("ADMIN_SECRET", "propstats2024"):
         raise HTTPException(status_code=403, detail="Invalid secret")
     
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("DELETE FROM game_logs")
-    conn.commit()
-    conn.close()
+    with span("db_write"):
+        conn = db.connect(DB_PATH, isolation_level=None)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                retired = migrations.swap_empty(conn, "game_logs")
+                conn.execute("DELETE FROM player_projections")
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        finally:
+            conn.close()
+    probability.fit_cache.clear()
+    lineups.lineup_index.reset()
+    background_tasks.add_task(drop_retired_tables)
     
-    return {"status": "cache_cleared", "season": CURRENT_SEASON}
+    return {"status": "cache_cleared", "season": CURRENT_SEASON, "retired": retired}
+
+def drop_retired_tables():
+    """Second half of clear-cache: free the swapped-out rows, then reset the WAL"""
+    dropped = migrations.drop_retired(DB_PATH)
+    db.checkpoint(DB_PATH, truncate=True)
+    print(f"🧹 Dropped {dropped} retired table(s)")
+
+@app.get("/admin/profile", response_class=PlainTextResponse)
+def admin_profile(
+    secret: str = Query(...),
+    seconds: float = Query(10, gt=0, le=profiler.MAX_SECONDS),
+    interval_ms: float = Query(5, ge=1, le=100),
+    idle: bool = False
+):
+    """Sample all worker threads for N seconds; returns collapsed stacks for flamegraph tools"""
+    if secret != os.getenv("ADMIN_SECRET", "propstats2024"):
+        raise HTTPException(status_code=403, detail="Invalid secret")
+    
+    try:
+        counts, rounds = profiler.profile(seconds, interval_ms / 1000, idle=idle)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return PlainTextResponse(profiler.render_collapsed(counts), headers={"X-Profile-Samples": str(rounds)})
+
+@app.get("/admin/slow-requests")
+def admin_slow_requests(secret: str = Query(...), limit: int = Query(20, ge=1, le=profiler.SLOW_LOG_SIZE)):
+    """Most recent analysis requests slower than SLOW_REQUEST_MS, with their stacks"""
+    if secret != os.getenv("ADMIN_SECRET", "propstats2024"):
+        raise HTTPException(status_code=403, detail="Invalid secret")
+    
+    return {
+        "threshold_ms": profiler.slow_requests.threshold_ms,
+        "requests": profiler.slow_requests.recent(limit)
+    }
 
 if __name__ == "__main__":
     import uvicorn
@@ -5,23 +5,43 @@ Uses nba_api for reliable real-time data
 
 from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 from pydantic import BaseModel
-import sqlite3
 import os
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timedelta
-import time
+import contextvars
 import json
+from concurrent.futures import ThreadPoolExecutor
 
 # NBA API imports
-from nba_api.stats.static import players, teams
+from nba_api.stats.static import teams
 from nba_api.stats.endpoints import (
-    playergamelog,
-    commonplayerinfo,
     playercareerstats,
     leaguegamefinder
 )
 
+import colstore
+import compression
+import db
+import defense
+import exports
+import freshness
+import ingest
+import lineups
+import metrics
+import migrations
+import payloads
+import probability
+import profiler
+import projections
+import storage
+import upstream
+from metrics import span
+from presentation import TeamDirectory, headshot_url
+from roster import get_roster, refresh_roster
+from splits import compute_splits, parse_dimensions
+
 app = FastAPI(title="PropStats API", version="2.0.0")
 
 app.add_middleware(
@@ -32,8 +52,17 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+compression.install(app)
+metrics.install(app)
+
 DB_PATH = os.getenv("DATABASE_PATH", "nba_props.db")
 
+# Column order of the player record returned by lookups and hydration
+PLAYER_FIELDS = (
+    "player_id", "full_name", "team_abbreviation", "team_name", "position",
+    "height", "weight", "jersey_number"
+)
+
 # Team info for logos and colors
 TEAM_INFO = {
     "ATL": {"id": 1610612737, "name": "Hawks", "city": "Atlanta", "color": "#E03A3E"},
@@ -68,110 +97,57 @@ TEAM_INFO = {
     "WAS": {"id": 1610612764, "name": "Wizards", "city": "Washington", "color": "#002B5C"},
 }
 
+# Display fields and the /teams body, derived once from TEAM_INFO
+TEAMS = TeamDirectory(TEAM_INFO)
+
+# Stored games go stale when the player's team finishes a game (freshness.py); in queue mode
+# the ingest worker downloads the schedule
+FRESHNESS = freshness.ScheduleOracle("2024-25", download=not ingest.QUEUED)
+
 def init_db():
-    """Create tables if they don't exist"""
-    conn = sqlite3.connect(DB_PATH)
+    """Create or upgrade the shared database schema"""
+    migrations.migrate(DB_PATH)
+
+init_db()
+
+# Replicas sharing one dataset pull each other's ingests from STORAGE_URL (storage.py)
+STORAGE = storage.from_env(DB_PATH)
+if STORAGE.shared:
+    storage.start_sync(STORAGE, DB_PATH)
+
+def load_roster_teams() -> Dict[str, str]:
+    """Known team assignments to overlay on the static roster"""
+    conn = db.connect(DB_PATH)
     cursor = conn.cursor()
-    
     cursor.execute("""
-        CREATE TABLE IF NOT EXISTS players (
-            player_id TEXT PRIMARY KEY,
-            full_name TEXT NOT NULL,
-            first_name TEXT,
-            last_name TEXT,
-            team_id TEXT,
-            team_abbreviation TEXT,
-            team_name TEXT,
-            position TEXT,
-            height TEXT,
-            weight TEXT,
-            jersey_number TEXT,
-            is_active INTEGER DEFAULT 1,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
+        SELECT player_id, team_abbreviation FROM players
+        WHERE team_abbreviation IS NOT NULL AND team_abbreviation != ''
     """)
-    
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS game_logs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            player_id TEXT NOT NULL,
-            game_id TEXT NOT NULL,
-            game_date DATE NOT NULL,
-            season TEXT NOT NULL,
-            team_abbreviation TEXT,
-            opponent_abbreviation TEXT,
-            is_home INTEGER,
-            game_result TEXT,
-            minutes_played REAL,
-            points INTEGER DEFAULT 0,
-            rebounds INTEGER DEFAULT 0,
-            offensive_rebounds INTEGER DEFAULT 0,
-            defensive_rebounds INTEGER DEFAULT 0,
-            assists INTEGER DEFAULT 0,
-            steals INTEGER DEFAULT 0,
-            blocks INTEGER DEFAULT 0,
-            fg3m INTEGER DEFAULT 0,
-            fg3a INTEGER DEFAULT 0,
-            fgm INTEGER DEFAULT 0,
-            fga INTEGER DEFAULT 0,
-            ftm INTEGER DEFAULT 0,
-            fta INTEGER DEFAULT 0,
-            turnovers INTEGER DEFAULT 0,
-            personal_fouls INTEGER DEFAULT 0,
-            plus_minus INTEGER DEFAULT 0,
-            UNIQUE(player_id, game_id)
-        )
-    """)
-    
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_player ON game_logs(player_id)")
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_date ON game_logs(game_date)")
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_season ON game_logs(season)")
-    
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS usage_tracking (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            ip_address TEXT NOT NULL,
-            player_id TEXT,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            action TEXT
-        )
-    """)
-    
-    conn.commit()
+    teams_by_player = dict(cursor.fetchall())
     conn.close()
+    return teams_by_player
 
-init_db()
-
-def get_player_headshot_url(player_id: str) -> str:
-    """Get NBA.com headshot URL for a player"""
-    return f"https://cdn.nba.com/headshots/nba/latest/1040x760/{player_id}.png"
-
-def get_team_logo_url(team_abbr: str) -> str:
-    """Get NBA.com team logo URL"""
-    team_info = TEAM_INFO.get(team_abbr)
-    if team_info:
-        return f"https://cdn.nba.com/logos/nba/{team_info['id']}/primary/L/logo.svg"
-    return ""
+refresh_roster(load_roster_teams())
 
 def sync_all_players():
     """Sync all active NBA players to database"""
     try:
-        all_players = players.get_active_players()
+        roster = refresh_roster(load_roster_teams())
         
-        conn = sqlite3.connect(DB_PATH)
+        conn = db.connect(DB_PATH)
         cursor = conn.cursor()
         
         count = 0
-        for player in all_players:
+        for player in roster.records:
             cursor.execute("""
                 INSERT OR REPLACE INTO players 
                 (player_id, full_name, first_name, last_name, is_active, updated_at)
                 VALUES (?, ?, ?, ?, 1, datetime('now'))
             """, (
-                str(player['id']),
-                player['full_name'],
-                player['first_name'],
-                player['last_name']
+                player.id,
+                player.full_name,
+                player.first_name,
+                player.last_name
             ))
             count += 1
         
@@ -183,46 +159,129 @@ def sync_all_players():
         print(f"❌ Error syncing players: {e}")
         return 0
 
+def previous_season(season: str) -> str:
+    """'2024-25' -> '2023-24'"""
+    start = int(season[:4]) - 1
+    return f"{start}-{(start + 1) % 100:02d}"
+
+def parse_player_details(data: dict) -> Optional[Dict[str, Any]]:
+    """Extract the player row from a commonplayerinfo payload"""
+    if data['resultSets'] and data['resultSets'][0]['rowSet']:
+        row = data['resultSets'][0]['rowSet'][0]
+        headers = data['resultSets'][0]['headers']
+        return dict(zip(headers, row))
+    return None
+
+def store_player_details(cursor, player_id: str, player_data: Dict[str, Any]):
+    """Write commonplayerinfo fields onto an existing player row"""
+    cursor.execute("""
+        UPDATE players SET
+            team_id = ?,
+            team_abbreviation = ?,
+            team_name = ?,
+            position = ?,
+            height = ?,
+            weight = ?,
+            jersey_number = ?,
+            updated_at = datetime('now')
+        WHERE player_id = ?
+    """, (
+        str(player_data.get('TEAM_ID', '')),
+        player_data.get('TEAM_ABBREVIATION', ''),
+        player_data.get('TEAM_NAME', ''),
+        player_data.get('POSITION', ''),
+        player_data.get('HEIGHT', ''),
+        player_data.get('WEIGHT', ''),
+        player_data.get('JERSEY', ''),
+        player_id
+    ))
+
+def parse_game_logs(player_id: str, season: str, data: dict) -> List[tuple]:
+    """Convert a playergamelog payload into game_logs rows"""
+    if not data['resultSets'] or not data['resultSets'][0]['rowSet']:
+        return []
+    
+    headers = data['resultSets'][0]['headers']
+    rows = []
+    for row in data['resultSets'][0]['rowSet']:
+        game = dict(zip(headers, row))
+        
+        matchup = game.get('MATCHUP', '')
+        is_home = 1 if 'vs.' in matchup else 0
+        parts = matchup.split()
+        opponent = parts[-1] if parts else ''
+        team = parts[0] if parts else ''
+        
+        # Parse minutes
+        minutes_str = str(game.get('MIN', '0'))
+        minutes = 0.0
+        if minutes_str and minutes_str != 'None':
+            if ':' in minutes_str:
+                m_parts = minutes_str.split(':')
+                minutes = float(m_parts[0]) + float(m_parts[1]) / 60.0
+            else:
+                try:
+                    minutes = float(minutes_str)
+                except:
+                    minutes = 0.0
+        
+        rows.append((
+            str(player_id),
+            game.get('Game_ID', ''),
+            game.get('GAME_DATE', ''),
+            season,
+            team,
+            opponent,
+            is_home,
+            game.get('WL', ''),
+            minutes,
+            game.get('PTS', 0) or 0,
+            game.get('REB', 0) or 0,
+            game.get('OREB', 0) or 0,
+            game.get('DREB', 0) or 0,
+            game.get('AST', 0) or 0,
+            game.get('STL', 0) or 0,
+            game.get('BLK', 0) or 0,
+            game.get('FG3M', 0) or 0,
+            game.get('FG3A', 0) or 0,
+            game.get('FGM', 0) or 0,
+            game.get('FGA', 0) or 0,
+            game.get('FTM', 0) or 0,
+            game.get('FTA', 0) or 0,
+            game.get('TOV', 0) or 0,
+            game.get('PF', 0) or 0,
+            game.get('PLUS_MINUS', 0) or 0
+        ))
+    return rows
+
+def store_game_logs(cursor, rows: List[tuple]):
+    """Upsert parsed game_logs rows (in storage.GAME_LOG_COLUMNS order)"""
+    cursor.executemany("""
+        INSERT OR REPLACE INTO game_logs 
+        (player_id, game_id, game_date, season, team_abbreviation, 
+         opponent_abbreviation, is_home, game_result, minutes_played,
+         points, rebounds, offensive_rebounds, defensive_rebounds,
+         assists, steals, blocks, fg3m, fg3a, fgm, fga, ftm, fta,
+         turnovers, personal_fouls, plus_minus)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, rows)
+    projections.update_rows(cursor, rows)
+
 def fetch_player_details(player_id: str):
     """Fetch detailed player info from NBA API"""
     try:
-        time.sleep(0.6)  # Rate limiting
-        info = commonplayerinfo.CommonPlayerInfo(player_id=player_id)
-        data = info.get_dict()
+        player_data = parse_player_details(upstream.player_info(player_id))
         
-        if data['resultSets'] and data['resultSets'][0]['rowSet']:
-            row = data['resultSets'][0]['rowSet'][0]
-            headers = data['resultSets'][0]['headers']
-            
-            player_data = dict(zip(headers, row))
-            
+        if player_data:
             # Update database
-            conn = sqlite3.connect(DB_PATH)
+            conn = db.connect(DB_PATH)
             cursor = conn.cursor()
-            cursor.execute("""
-                UPDATE players SET
-                    team_id = ?,
-                    team_abbreviation = ?,
-                    team_name = ?,
-                    position = ?,
-                    height = ?,
-                    weight = ?,
-                    jersey_number = ?,
-                    updated_at = datetime('now')
-                WHERE player_id = ?
-            """, (
-                str(player_data.get('TEAM_ID', '')),
-                player_data.get('TEAM_ABBREVIATION', ''),
-                player_data.get('TEAM_NAME', ''),
-                player_data.get('POSITION', ''),
-                player_data.get('HEIGHT', ''),
-                player_data.get('WEIGHT', ''),
-                player_data.get('JERSEY', ''),
-                player_id
-            ))
+            store_player_details(cursor, player_id, player_data)
             conn.commit()
             conn.close()
             
+            get_roster().set_team(player_id, player_data.get('TEAM_ABBREVIATION', ''))
+            
             return player_data
     except Exception as e:
         print(f"Error fetching player details: {e}")
@@ -231,119 +290,178 @@ def fetch_player_details(player_id: str):
 def fetch_player_game_logs(player_id: str, season: str = "2024-25"):
     """Fetch game logs for a player using nba_api"""
     try:
-        time.sleep(0.6)  # Rate limiting
-        
-        gamelog = playergamelog.PlayerGameLog(
-            player_id=player_id,
-            season=season,
-            season_type_all_star='Regular Season'
-        )
-        
-        data = gamelog.get_dict()
-        
-        if not data['resultSets'] or not data['resultSets'][0]['rowSet']:
+        rows = parse_game_logs(player_id, season, upstream.player_game_log(player_id, season))
+        if not rows:
             return 0
         
-        headers = data['resultSets'][0]['headers']
-        rows = data['resultSets'][0]['rowSet']
-        
-        conn = sqlite3.connect(DB_PATH)
+        conn = db.connect(DB_PATH)
         cursor = conn.cursor()
-        
-        games_stored = 0
-        for row in rows:
-            game = dict(zip(headers, row))
-            
-            matchup = game.get('MATCHUP', '')
-            is_home = 1 if 'vs.' in matchup else 0
-            parts = matchup.split()
-            opponent = parts[-1] if parts else ''
-            team = parts[0] if parts else ''
-            
-            # Parse minutes
-            minutes_str = str(game.get('MIN', '0'))
-            minutes = 0.0
-            if minutes_str and minutes_str != 'None':
-                if ':' in minutes_str:
-                    m_parts = minutes_str.split(':')
-                    minutes = float(m_parts[0]) + float(m_parts[1]) / 60.0
-                else:
-                    try:
-                        minutes = float(minutes_str)
-                    except:
-                        minutes = 0.0
-            
-            cursor.execute("""
-                INSERT OR REPLACE INTO game_logs 
-                (player_id, game_id, game_date, season, team_abbreviation, 
-                 opponent_abbreviation, is_home, game_result, minutes_played,
-                 points, rebounds, offensive_rebounds, defensive_rebounds,
-                 assists, steals, blocks, fg3m, fg3a, fgm, fga, ftm, fta,
-                 turnovers, personal_fouls, plus_minus)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                str(player_id),
-                game.get('Game_ID', ''),
-                game.get('GAME_DATE', ''),
-                season,
-                team,
-                opponent,
-                is_home,
-                game.get('WL', ''),
-                minutes,
-                game.get('PTS', 0) or 0,
-                game.get('REB', 0) or 0,
-                game.get('OREB', 0) or 0,
-                game.get('DREB', 0) or 0,
-                game.get('AST', 0) or 0,
-                game.get('STL', 0) or 0,
-                game.get('BLK', 0) or 0,
-                game.get('FG3M', 0) or 0,
-                game.get('FG3A', 0) or 0,
-                game.get('FGM', 0) or 0,
-                game.get('FGA', 0) or 0,
-                game.get('FTM', 0) or 0,
-                game.get('FTA', 0) or 0,
-                game.get('TOV', 0) or 0,
-                game.get('PF', 0) or 0,
-                game.get('PLUS_MINUS', 0) or 0
-            ))
-            games_stored += 1
-        
+        store_game_logs(cursor, rows)
         conn.commit()
         conn.close()
         
-        print(f"✅ Stored {games_stored} games for player {player_id}")
-        return games_stored
+        print(f"✅ Stored {len(rows)} games for player {player_id}")
+        return len(rows)
         
     except Exception as e:
         print(f"❌ Error fetching game logs for {player_id}: {e}")
         return 0
 
-def track_usage(ip: str, player_id: str, action: str):
-    """Track user actions"""
-    conn = sqlite3.connect(DB_PATH)
+def hydrate_player(player_id: str, seasons: List[str], include_details: bool = True,
+                   raise_errors: bool = False) -> Optional[Dict[str, Any]]:
+    """Fetch details and game logs concurrently, then store them in one transaction.
+    
+    Returns the hydrated player record, or None if the player is unknown. With
+    `raise_errors`, a failed game log fetch is re-raised once the other seasons are stored.
+    """
+    conn = db.connect(DB_PATH)
     cursor = conn.cursor()
     cursor.execute("""
-        INSERT INTO usage_tracking (ip_address, player_id, action)
-        VALUES (?, ?, ?)
-    """, (ip, player_id, action))
-    conn.commit()
+        SELECT player_id, full_name, team_abbreviation, team_name, position,
+               height, weight, jersey_number
+        FROM players WHERE player_id = ?
+    """, (player_id,))
+    row = cursor.fetchone()
     conn.close()
+    
+    roster_match = get_roster().get(player_id)
+    if not row and not roster_match:
+        return None
+    
+    # Each job runs in a copy of this context so its spans land on the current request
+    def submit(pool, fn, *args):
+        return pool.submit(contextvars.copy_context().run, fn, *args)
+    
+    with metrics.refreshing(), ThreadPoolExecutor(max_workers=len(seasons) + 1) as pool:
+        details_job = submit(pool, upstream.player_info, player_id) if include_details else None
+        log_jobs = [(s, submit(pool, upstream.player_game_log, player_id, s)) for s in seasons]
+    
+    player_data = None
+    if details_job is not None:
+        try:
+            player_data = parse_player_details(details_job.result())
+        except Exception as e:
+            print(f"Error fetching player details: {e}")
+    
+    games_by_season, errors, failures = {}, {}, []
+    for s, job in log_jobs:
+        try:
+            games_by_season[s] = parse_game_logs(player_id, s, job.result())
+        except Exception as e:
+            print(f"❌ Error fetching game logs for {player_id} ({s}): {e}")
+            games_by_season[s] = []
+            failures.append(e)
+            # A call refused by the breaker or cut by the deadline says nothing about this player
+            errors[s] = None if isinstance(e, upstream.NOT_SENT) else f"{type(e).__name__}: {e}"
+    
+    if row:
+        record = dict(zip(PLAYER_FIELDS, row))
+    else:
+        record = dict.fromkeys(PLAYER_FIELDS)
+        record["player_id"] = player_id
+        record["full_name"] = roster_match.full_name
+    
+    if player_data:
+        record.update({
+            "team_abbreviation": player_data.get('TEAM_ABBREVIATION', ''),
+            "team_name": player_data.get('TEAM_NAME', ''),
+            "position": player_data.get('POSITION', ''),
+            "height": player_data.get('HEIGHT', ''),
+            "weight": player_data.get('WEIGHT', ''),
+            "jersey_number": player_data.get('JERSEY', ''),
+        })
+    
+    with span("db_write"):
+        conn = db.connect(DB_PATH)
+        cursor = conn.cursor()
+        with conn:
+            if not row:
+                cursor.execute("""
+                    INSERT OR IGNORE INTO players (player_id, full_name, first_name, last_name, is_active)
+                    VALUES (?, ?, ?, ?, 1)
+                """, (player_id, roster_match.full_name, roster_match.first_name, roster_match.last_name))
+            if player_data:
+                store_player_details(cursor, player_id, player_data)
+            for s, season_rows in games_by_season.items():
+                store_game_logs(cursor, season_rows)
+                # Empty or failed seasons back off instead of being fetched on every request
+                if season_rows:
+                    freshness.clear_miss(cursor, player_id, s)
+                elif s not in errors or errors[s]:
+                    freshness.record_miss(cursor, player_id, s, errors.get(s))
+        conn.close()
+    if STORAGE.shared:
+        write_through(record, [r for season_rows in games_by_season.values() for r in season_rows])
+    
+    if player_data:
+        get_roster().set_team(player_id, record["team_abbreviation"])
+    
+    record["games_synced"] = {s: len(r) for s, r in games_by_season.items()}
+    print(f"✅ Hydrated player {player_id}: {record['games_synced']}")
+    if raise_errors and failures:
+        raise failures[0]
+    return record
 
-def get_usage_count(ip: str, hours: int = 24):
-    """Get usage count for IP in last N hours"""
-    conn = sqlite3.connect(DB_PATH)
+def write_through(record: Dict[str, Any], rows: List[tuple]):
+    """Copy a hydrated player and its game logs to the shared store; the local write already succeeded"""
+    try:
+        with span("storage_write"):
+            STORAGE.upsert_players(PLAYER_FIELDS, [tuple(record[f] for f in PLAYER_FIELDS)])
+            if rows:
+                STORAGE.store_game_logs(storage.GAME_LOG_COLUMNS, rows)
+    except Exception as e:
+        print(f"❌ Error writing player {record['player_id']} to the shared store: {e}")
+
+def run_ingest_job(player_id: str, seasons: List[str], include_details: bool) -> int:
+    """ingest_worker entry point: hydrate the player, returning the number of games stored.
+    
+    Raises when a game log fetch failed, so the worker retries the job and counts it as failed.
+    """
+    record = hydrate_player(player_id, seasons, include_details, raise_errors=True)
+    return sum(record["games_synced"].values()) if record else 0
+
+def load_player(player_id: str) -> Optional[Dict[str, Any]]:
+    """Stored player record, or None"""
+    conn = db.connect(DB_PATH)
     cursor = conn.cursor()
-    cursor.execute("""
-        SELECT COUNT(DISTINCT player_id) FROM usage_tracking
-        WHERE ip_address = ?
-        AND timestamp > datetime('now', '-' || ? || ' hours')
-        AND action = 'analysis'
-    """, (ip, hours))
-    count = cursor.fetchone()[0]
+    cursor.execute(f"SELECT {', '.join(PLAYER_FIELDS)} FROM players WHERE player_id = ?", (player_id,))
+    row = cursor.fetchone()
     conn.close()
-    return count
+    return dict(zip(PLAYER_FIELDS, row)) if row else None
+
+def refresh_player(player_id: str, seasons: List[str], include_details: bool = True,
+                   wait: bool = True) -> Optional[Dict[str, Any]]:
+    """hydrate_player in this request, or through the ingest worker when INGEST_MODE=queue.
+    
+    A queued refresh returns the stored record, after waiting up to INGEST_WAIT_SECONDS
+    for the job when `wait` is set. Returns None if the player is unknown.
+    """
+    if not ingest.QUEUED:
+        return hydrate_player(player_id, seasons, include_details)
+    
+    record = load_player(player_id)
+    roster_match = get_roster().get(player_id)
+    if record is None and not roster_match:
+        return None
+    
+    priority = ingest.PRIORITY_WAITING if wait else ingest.PRIORITY_BACKGROUND
+    job_id = ingest.enqueue(DB_PATH, player_id, seasons, include_details, priority)
+    if wait:
+        ingest.wait_for(DB_PATH, job_id)
+        record = load_player(player_id) or record
+    if record is None:
+        record = dict.fromkeys(PLAYER_FIELDS)
+        record["player_id"] = player_id
+        record["full_name"] = roster_match.full_name
+    return record
+
+def track_usage(ip: str, player_id: str, action: str):
+    """Track user actions (in the shared store, so limits hold across replicas)"""
+    STORAGE.track_usage(ip, player_id, action)
+
+def get_usage_count(ip: str, hours: int = 24):
+    """Get usage count for IP in last N hours"""
+    return STORAGE.usage_count(ip, hours)
 
 # =====================
 # API ENDPOINTS
@@ -367,7 +485,7 @@ def root():
 @app.get("/health")
 def health():
     """Health check endpoint"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = db.connect(DB_PATH)
     cursor = conn.cursor()
     
     cursor.execute("SELECT COUNT(*) FROM players WHERE is_active = 1")
@@ -389,10 +507,29 @@ def health():
         "version": "2.0.0"
     }
 
+@app.get("/ready")
+def ready():
+    """Readiness: 503 only if the database cannot be read; an open upstream breaker reports degraded"""
+    try:
+        conn = db.connect(DB_PATH)
+        conn.execute("SELECT 1 FROM game_logs LIMIT 1").fetchall()
+        conn.close()
+        database = "ok"
+    except Exception as e:
+        database = f"error: {e}"
+    breaker = upstream.breaker.status()
+    body = {
+        # Stored games are still served while stats.nba.com is down, so degraded stays in rotation
+        "status": "unavailable" if database != "ok" else "ready" if breaker["state"] == "closed" else "degraded",
+        "database": database,
+        "upstream": breaker,
+    }
+    return JSONResponse(status_code=200 if database == "ok" else 503, content=body)
+
 @app.get("/players/search")
 def search_players(q: str = Query(..., min_length=2)):
     """Search for players by name"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = db.connect(DB_PATH)
     cursor = conn.cursor()
     
     cursor.execute("""
@@ -407,18 +544,18 @@ def search_players(q: str = Query(..., min_length=2)):
     for row in cursor.fetchall():
         player_id = row[0]
         team_abbr = row[2] or "FA"
-        team_info = TEAM_INFO.get(team_abbr, {})
+        team = TEAMS.get(team_abbr)
         
         player_list.append({
             "id": player_id,
             "name": row[1],
             "team": team_abbr,
-            "team_name": team_info.get("name", "Free Agent"),
-            "team_color": team_info.get("color", "#666666"),
+            "team_name": team["team_name"],
+            "team_color": team["team_color"],
             "position": row[3] or "N/A",
             "jersey": row[4] or "",
-            "headshot": get_player_headshot_url(player_id),
-            "team_logo": get_team_logo_url(team_abbr) if team_abbr != "FA" else ""
+            "headshot": headshot_url(player_id),
+            "team_logo": team["team_logo"]
         })
     
     conn.close()
@@ -427,7 +564,7 @@ def search_players(q: str = Query(..., min_length=2)):
 @app.get("/players/{player_id}")
 def get_player_info(player_id: str):
     """Get detailed player information"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = db.connect(DB_PATH)
     cursor = conn.cursor()
     
     cursor.execute("""
@@ -439,56 +576,64 @@ def get_player_info(player_id: str):
     row = cursor.fetchone()
     conn.close()
     
-    if not row:
-        # Try to find in static data and sync
-        all_players = players.get_active_players()
-        player_match = next((p for p in all_players if str(p['id']) == player_id), None)
-        
-        if player_match:
-            # Sync this player
-            conn = sqlite3.connect(DB_PATH)
-            cursor = conn.cursor()
-            cursor.execute("""
-                INSERT OR REPLACE INTO players (player_id, full_name, first_name, last_name, is_active)
-                VALUES (?, ?, ?, ?, 1)
-            """, (player_id, player_match['full_name'], player_match['first_name'], player_match['last_name']))
-            conn.commit()
-            conn.close()
-            
-            # Fetch additional details
-            fetch_player_details(player_id)
-            
-            return get_player_info(player_id)
-        
-        raise HTTPException(status_code=404, detail="Player not found")
+    if row:
+        record = dict(zip(PLAYER_FIELDS, row))
+    else:
+        # Unknown locally - hydrate from the roster and NBA API in one pass
+        if not get_roster().get(player_id):
+            raise HTTPException(status_code=404, detail="Player not found")
+        season = "2024-25"
+        record = refresh_player(player_id, [season, previous_season(season)])
+        if not record:
+            raise HTTPException(status_code=404, detail="Player not found")
     
-    team_abbr = row[2] or "FA"
-    team_info = TEAM_INFO.get(team_abbr, {})
+    team_abbr = record["team_abbreviation"] or "FA"
+    team = TEAMS.get(team_abbr)
     
     return {
-        "id": row[0],
-        "name": row[1],
+        "id": record["player_id"],
+        "name": record["full_name"],
         "team": team_abbr,
-        "team_name": row[3] or team_info.get("name", "Free Agent"),
-        "team_color": team_info.get("color", "#666666"),
-        "position": row[4] or "N/A",
-        "height": row[5] or "",
-        "weight": row[6] or "",
-        "jersey": row[7] or "",
-        "headshot": get_player_headshot_url(player_id),
-        "team_logo": get_team_logo_url(team_abbr)
+        "team_name": record["team_name"] or team["team_name"],
+        "team_color": team["team_color"],
+        "position": record["position"] or "N/A",
+        "height": record["height"] or "",
+        "weight": record["weight"] or "",
+        "jersey": record["jersey_number"] or "",
+        "headshot": headshot_url(player_id),
+        "team_logo": team["team_logo"]
     }
 
 @app.get("/players/{player_id}/analysis")
+@profiler.watch_slow
 def get_player_analysis(
     request: Request,
     player_id: str,
     stat: str = Query(..., regex="^(points|rebounds|assists|threes|steals|blocks|pra|pr|pa|ra|turnovers|double_double)$"),
     line: float = Query(..., ge=0),
-    season: str = Query(default="2024-25")
+    season: str = Query(default="2024-25"),
+    vs: Optional[str] = Query(None, description="Opponent abbreviation, e.g. BOS"),
+    splits: Optional[str] = Query(None, description="Comma-separated split dimensions (default all)"),
+    columnar: bool = Query(False, description="Return games as one list per field"),
+    model: str = Query("negbin", regex="^(negbin|empirical)$", description="Probability model"),
+    minutes: Optional[float] = Query(None, ge=0, le=48, description="Expected minutes for the projection"),
+    without: Optional[str] = Query(None, description="Teammate player id for with/without splits")
 ):
     """Get player analysis with hit rates for a specific stat and line"""
     
+    try:
+        split_dimensions = parse_dimensions(splits)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if without == player_id:
+        raise HTTPException(status_code=400, detail="without must be a different player")
+    
+    if vs is not None:
+        vs = vs.upper()
+        if vs not in TEAM_INFO:
+            raise HTTPException(status_code=400, detail=f"Unknown team: {vs}")
+    
     # Map stat names to database columns / calculations
     stat_map = {
         "points": "points",
@@ -505,33 +650,36 @@ def get_player_analysis(
         "double_double": None  # Special handling
     }
     
-    conn = sqlite3.connect(DB_PATH)
+    conn = db.connect(DB_PATH)
     cursor = conn.cursor()
     
     # Check if we have recent data for this player
-    cursor.execute("""
-        SELECT COUNT(*), MAX(game_date) FROM game_logs 
-        WHERE player_id = ? AND season = ?
-    """, (player_id, season))
-    result = cursor.fetchone()
-    game_count = result[0]
-    last_game = result[1]
-    
-    # Fetch fresh data if needed (no data or data is old)
-    needs_refresh = False
-    if game_count == 0:
-        needs_refresh = True
-    elif last_game:
-        last_date = datetime.strptime(last_game, "%b %d, %Y") if ", " in last_game else datetime.strptime(last_game, "%Y-%m-%d")
-        if (datetime.now() - last_date).days > 1:
-            needs_refresh = True
-    
-    if needs_refresh:
-        print(f"📊 Fetching fresh data for player {player_id}...")
-        fetch_player_game_logs(player_id, season)
-        # Also try previous season for more data
-        prev_season = f"{int(season[:4])-1}-{int(season[:4])%100:02d}"
-        fetch_player_game_logs(player_id, prev_season)
+    with span("needs_refresh"):
+        cursor.execute("""
+            SELECT COUNT(*), MAX(game_day) FROM game_logs 
+            WHERE player_id = ? AND season = ?
+        """, (player_id, season))
+        result = cursor.fetchone()
+        game_count = result[0]
+        last_game = result[1]
+    
+        # The old rule (no data or last game over a day old) is the fallback and the baseline
+        ttl_stale = False
+        if game_count == 0:
+            ttl_stale = True
+        elif last_game:
+            last_date = datetime.strptime(last_game, "%Y-%m-%d")
+            if (datetime.now() - last_date).days > 1:
+                ttl_stale = True
+        
+        # Stale only once one of the player's teams has finished a game since the last sync
+        _, last_sync, logged_team = freshness.player_state(cursor, player_id, season)
+        miss = freshness.load_miss(cursor, player_id, season)
+        FRESHNESS.ensure(DB_PATH)
+        roster_match = get_roster().get(player_id)
+        needs_refresh, freshness_reason = FRESHNESS.decide((logged_team, roster_match.team if roster_match else None),
+                                                           season, last_sync, ttl_stale, calls=2, miss=miss)
+    metrics.CACHE_REQUESTS.inc("miss" if needs_refresh else "hit")
     
     # Get player info
     cursor.execute("""
@@ -540,20 +688,39 @@ def get_player_analysis(
     """, (player_id,))
     player_info = cursor.fetchone()
     
-    if not player_info:
-        # Try to sync player
-        all_players = players.get_active_players()
-        player_match = next((p for p in all_players if str(p['id']) == player_id), None)
-        if player_match:
-            cursor.execute("""
-                INSERT OR REPLACE INTO players (player_id, full_name, is_active)
-                VALUES (?, ?, 1)
-            """, (player_id, player_match['full_name']))
-            conn.commit()
-            player_info = (player_match['full_name'], 'FA', 'N/A', '')
-        else:
+    if not player_info and not get_roster().get(player_id):
+        conn.close()
+        raise HTTPException(status_code=404, detail="Player not found")
+    
+    stale_reason = None
+    if freshness_reason == "backoff_error":
+        # The last refresh failed and is backing off: what is stored is known to be behind
+        stale_reason = "upstream_backoff"
+        upstream.STALE_SERVED.inc(stale_reason)
+    if needs_refresh or not player_info:
+        print(f"📊 Fetching fresh data for player {player_id}...")
+        # Current + previous season for more data; details only for new players
+        seasons = [season, previous_season(season)] if needs_refresh else []
+        # Only a request with nothing stored to show waits on a queued refresh. The fetch is
+        # bounded by UPSTREAM_DEADLINE; on failure the stored games are served, flagged stale
+        with upstream.deadline() as budget:
+            record = refresh_player(player_id, seasons, include_details=not player_info,
+                                    wait=game_count == 0 or not player_info)
+        stale_reason = upstream.served_stale(budget) or stale_reason
+        # What the refresh managed to store, not what was there before it
+        cursor.execute("SELECT COUNT(*) FROM game_logs WHERE player_id = ? AND season = ?", (player_id, season))
+        game_count = cursor.fetchone()[0]
+        if stale_reason and game_count == 0:
             conn.close()
-            raise HTTPException(status_code=404, detail="Player not found")
+            raise HTTPException(status_code=503, detail="stats.nba.com is unavailable and no games are stored",
+                                headers={"Retry-After": str(upstream.retry_after())})
+        if not player_info:
+            player_info = (
+                record["full_name"],
+                record["team_abbreviation"],
+                record["position"],
+                record["jersey_number"]
+            )
     
     # Build query based on stat type
     if stat == "double_double":
@@ -569,59 +736,89 @@ def get_player_analysis(
     else:
         select_expr = stat_map[stat]
     
+    # Serve from the shared columnar snapshot when it is current for this player
+    rows = None
+    if not needs_refresh:
+        with span("snapshot_read"):
+            snapshot = colstore.get_snapshot()
+            snapshot_games = snapshot.player_games(player_id) if snapshot else None
+            if snapshot_games is not None:
+                # A corrected stat line keeps the count but is rewritten under a new id
+                cursor.execute("SELECT COUNT(*), MAX(id) FROM game_logs WHERE player_id = ?", (player_id,))
+                if snapshot.is_current(snapshot_games, *cursor.fetchone()):
+                    rows = snapshot.analysis_rows(snapshot_games, stat)
+    
     # Get all games for this player (current + previous season for more data)
-    cursor.execute(f"""
-        SELECT 
-            game_date,
-            opponent_abbreviation,
-            {select_expr} as stat_value,
-            is_home,
-            game_result,
-            minutes_played,
-            points,
-            rebounds,
-            assists,
-            fg3m,
-            steals,
-            blocks,
-            turnovers,
-            season
-        FROM game_logs
-        WHERE player_id = ?
-        ORDER BY game_date DESC
-        LIMIT 50
-    """, (player_id,))
+    if rows is None:
+        with span("db_read"):
+            cursor.execute(f"""
+                SELECT 
+                    game_date,
+                    opponent_abbreviation,
+                    {select_expr} as stat_value,
+                    is_home,
+                    game_result,
+                    minutes_played,
+                    points,
+                    rebounds,
+                    assists,
+                    fg3m,
+                    steals,
+                    blocks,
+                    turnovers,
+                    season
+                FROM game_logs
+                WHERE player_id = ?
+                ORDER BY game_day DESC
+                LIMIT 50
+            """, (player_id,))
+            rows = cursor.fetchall()
     
-    games = []
-    all_values = []
-    current_season_values = []
+    with span("aggregate"):
+        games = []
+        all_values = []
+        current_season_values = []
     
-    for row in cursor.fetchall():
-        value = row[2] if row[2] is not None else 0
-        all_values.append(value)
+        for row in rows:
+            value = row[2] if row[2] is not None else 0
+            all_values.append(value)
         
-        game_season = row[13]
-        if game_season == season:
-            current_season_values.append(value)
+            game_season = row[13]
+            if game_season == season:
+                current_season_values.append(value)
         
-        games.append({
-            "date": row[0],
-            "opponent": row[1],
-            "value": value,
-            "hit": value > line,
-            "is_home": row[3] == 1,
-            "result": row[4],
-            "minutes": round(row[5], 1) if row[5] else 0,
-            "pts": row[6] or 0,
-            "reb": row[7] or 0,
-            "ast": row[8] or 0,
-            "fg3m": row[9] or 0,
-            "stl": row[10] or 0,
-            "blk": row[11] or 0,
-            "tov": row[12] or 0,
-            "season": game_season
-        })
+            games.append({
+                "date": row[0],
+                "opponent": row[1],
+                "value": value,
+                "hit": value > line,
+                "is_home": row[3] == 1,
+                "result": row[4],
+                "minutes": round(row[5], 1) if row[5] else 0,
+                "pts": row[6] or 0,
+                "reb": row[7] or 0,
+                "ast": row[8] or 0,
+                "fg3m": row[9] or 0,
+                "stl": row[10] or 0,
+                "blk": row[11] or 0,
+                "tov": row[12] or 0,
+                "season": game_season
+            })
     
+    matchup = None
+    if vs:
+        with span("matchup"):
+            matchup = defense.matchup(cursor, player_id, vs, season, stat, select_expr, line)
+    with span("splits"):
+        split_results = compute_splits(cursor, player_id, season, select_expr, line, split_dimensions)
+    with span("probability"):
+        price = probability.price_line(cursor, player_id, season, stat, line, model)
+    with span("projection"):
+        projection = projections.project(cursor, player_id, season, stat, minutes)
+    teammate = None
+    if without:
+        with span("teammates"):
+            teammate = lineups.teammate_split(cursor, player_id, without, season, select_expr, line)
     conn.close()
     
     # Calculate hit rates
@@ -660,19 +857,19 @@ def get_player_analysis(
     track_usage(client_ip, player_id, "analysis")
     
     team_abbr = player_info[1] or "FA"
-    team_info = TEAM_INFO.get(team_abbr, {})
+    team = TEAMS.get(team_abbr)
     
-    return {
+    return payloads.json_response({
         "player": {
             "id": player_id,
             "name": player_info[0],
             "team": team_abbr,
-            "team_name": team_info.get("name", "Free Agent"),
-            "team_color": team_info.get("color", "#666666"),
+            "team_name": team["team_name"],
+            "team_color": team["team_color"],
             "position": player_info[2] or "N/A",
             "jersey": player_info[3] or "",
-            "headshot": get_player_headshot_url(player_id),
-            "team_logo": get_team_logo_url(team_abbr)
+            "headshot": headshot_url(player_id),
+            "team_logo": team["team_logo"]
         },
         "stat": stat,
         "line": line,
@@ -702,8 +899,15 @@ def get_player_analysis(
             season_avg, 
             line,
             consistency
-        )
-    }
+        ),
+        "vs": matchup,
+        "splits": split_results,
+        "probability": price,
+        "projection": projection,
+        "without": teammate,
+        "stale": stale_reason is not None,
+        "stale_reason": stale_reason
+    }, columnar)
 
 def get_recommendation(hit_rate: float, avg: float, line: float, consistency: float):
     """Generate recommendation based on hit rate, average, and consistency"""
@@ -749,21 +953,55 @@ def get_recommendation(hit_rate: float, avg: float, line: float, consistency: fl
             "color": "#6b7280"
         }
 
+@app.get("/games.ndjson")
+def export_games(
+    request: Request,
+    season: Optional[str] = None,
+    date_from: Optional[str] = Query(None, description="First game date, YYYY-MM-DD"),
+    date_to: Optional[str] = Query(None, description="Last game date, YYYY-MM-DD"),
+    columns: Optional[str] = Query(None, description="Comma-separated game_logs columns (default all)")
+):
+    """Every stored game log as NDJSON, streamed (gzip if accepted)"""
+    try:
+        return exports.stream_games(DB_PATH, request.headers.get("accept-encoding", ""),
+                                    season=season, date_from=date_from, date_to=date_to, columns=columns)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/players/{player_id}/games.ndjson")
+def export_player_games(
+    request: Request,
+    player_id: str,
+    season: Optional[str] = None,
+    date_from: Optional[str] = Query(None, description="First game date, YYYY-MM-DD"),
+    date_to: Optional[str] = Query(None, description="Last game date, YYYY-MM-DD"),
+    columns: Optional[str] = Query(None, description="Comma-separated game_logs columns (default all)")
+):
+    """A player's full stored game history as NDJSON, streamed (gzip if accepted)"""
+    try:
+        return exports.stream_games(DB_PATH, request.headers.get("accept-encoding", ""), player_id=player_id,
+                                    season=season, date_from=date_from, date_to=date_to, columns=columns)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/slate")
+def price_slate(slate: probability.SlateRequest):
+    """P(over)/P(under) for many player-stat-line legs at once"""
+    try:
+        probability.validate_slate(slate)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    season = slate.season or "2024-25"
+    conn = db.connect(DB_PATH)
+    with span("probability"):
+        results = probability.price_slate(conn.cursor(), season, [leg.model_dump() for leg in slate.legs], slate.model)
+    conn.close()
+    return payloads.json_response({"season": season, "model": slate.model, "legs": results})
+
 @app.get("/teams")
-def get_all_teams():
-    """Get all NBA teams with logos and colors"""
-    team_list = []
-    for abbr, info in TEAM_INFO.items():
-        team_list.append({
-            "abbreviation": abbr,
-            "id": info["id"],
-            "name": info["name"],
-            "city": info["city"],
-            "full_name": f"{info['city']} {info['name']}",
-            "color": info["color"],
-            "logo": get_team_logo_url(abbr)
-        })
-    return {"teams": sorted(team_list, key=lambda x: x["city"])}
+def get_all_teams(request: Request):
+    """Get all NBA teams with logos and colors (pre-serialized, revalidated by ETag)"""
+    return TEAMS.teams_response(request.headers.get("if-none-match"))
 
 @app.get("/usage/check")
 def check_usage(ip: str):
@@ -798,12 +1036,16 @@ def sync_single_player(player_id: str, secret: str = Query(...)):
     if secret != os.getenv("ADMIN_SECRET", "propstats2024"):
         raise HTTPException(status_code=403, detail="Unauthorized")
     
-    # Fetch player details
-    fetch_player_details(player_id)
+    if ingest.QUEUED:
+        job_id = ingest.enqueue(DB_PATH, player_id, ["2024-25", "2023-24"])
+        return {"success": True, "player_id": player_id, "job_id": job_id, "status": "queued"}
     
-    # Fetch game logs for current and previous season
-    games_current = fetch_player_game_logs(player_id, "2024-25")
-    games_prev = fetch_player_game_logs(player_id, "2023-24")
+    # Fetch player details and game logs for current and previous season
+    record = hydrate_player(player_id, ["2024-25", "2023-24"])
+    if not record:
+        raise HTTPException(status_code=404, detail="Player not found")
+    games_current = record["games_synced"]["2024-25"]
+    games_prev = record["games_synced"]["2023-24"]
     
     return {
         "success": games_current > 0 or games_prev > 0,
@@ -814,13 +1056,53 @@ def sync_single_player(player_id: str, secret: str = Query(...)):
         }
     }
 
+@app.get("/admin/ingest")
+def admin_ingest(secret: str = Query(...), window: int = Query(3600, ge=60, le=86400)):
+    """Ingest queue depth, plus throughput and latency over the last `window` seconds"""
+    if secret != os.getenv("ADMIN_SECRET", "propstats2024"):
+        raise HTTPException(status_code=403, detail="Unauthorized")
+    
+    return ingest.queue_stats(DB_PATH, window)
+
+@app.get("/admin/freshness")
+def admin_freshness(secret: str = Query(...), team: Optional[str] = Query(None, description="Team abbreviation, e.g. BOS")):
+    """Refresh decisions, avoided upstream calls and negative cache entries; `team` adds its last and next game"""
+    if secret != os.getenv("ADMIN_SECRET", "propstats2024"):
+        raise HTTPException(status_code=403, detail="Unauthorized")
+    
+    FRESHNESS.ensure(DB_PATH)
+    report = FRESHNESS.report()
+    report["negative_cache"] = freshness.miss_stats(DB_PATH)
+    if team is not None:
+        team = team.upper()
+        if team not in TEAM_INFO:
+            raise HTTPException(status_code=400, detail=f"Unknown team: {team}")
+        report["team"] = FRESHNESS.team_report(team)
+    return report
+
+@app.post("/admin/export-snapshot")
+def export_snapshot_endpoint(secret: str = Query(...)):
+    """Rebuild the memory-mapped game log snapshot shared by all workers"""
+    if secret != os.getenv("ADMIN_SECRET", "propstats2024"):
+        raise HTTPException(status_code=403, detail="Unauthorized")
+    
+    return colstore.export_snapshot(DB_PATH)
+
+@app.post("/admin/rebuild-defense")
+def rebuild_defense_endpoint(secret: str = Query(...), season: Optional[str] = None):
+    """Recompute per-opponent defensive splits from all stored game logs"""
+    if secret != os.getenv("ADMIN_SECRET", "propstats2024"):
+        raise HTTPException(status_code=403, detail="Unauthorized")
+    
+    return defense.rebuild_seasons(DB_PATH, [season] if season else None)
+
 @app.get("/admin/stats")
 def admin_stats(secret: str = Query(...)):
     """Get database stats"""
     if secret != os.getenv("ADMIN_SECRET", "propstats2024"):
         raise HTTPException(status_code=403, detail="Unauthorized")
     
-    conn = sqlite3.connect(DB_PATH)
+    conn = db.connect(DB_PATH)
     cursor = conn.cursor()
     
     cursor.execute("SELECT COUNT(*) FROM players WHERE is_active = 1")
@@ -851,7 +1133,36 @@ def admin_stats(secret: str = Query(...)):
         "players_with_data": players_with_data,
         "total_games": total_games,
         "daily_users": daily_users,
-        "daily_requests": daily_requests
+        "daily_requests": daily_requests,
+        "roster": get_roster().stats()
+    }
+
+@app.get("/admin/profile", response_class=PlainTextResponse)
+def admin_profile(
+    secret: str = Query(...),
+    seconds: float = Query(10, gt=0, le=profiler.MAX_SECONDS),
+    interval_ms: float = Query(5, ge=1, le=100),
+    idle: bool = False
+):
+    """Sample all worker threads for N seconds; returns collapsed stacks for flamegraph tools"""
+    if secret != os.getenv("ADMIN_SECRET", "propstats2024"):
+        raise HTTPException(status_code=403, detail="Unauthorized")
+    
+    try:
+        counts, rounds = profiler.profile(seconds, interval_ms / 1000, idle=idle)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return PlainTextResponse(profiler.render_collapsed(counts), headers={"X-Profile-Samples": str(rounds)})
+
+@app.get("/admin/slow-requests")
+def admin_slow_requests(secret: str = Query(...), limit: int = Query(20, ge=1, le=profiler.SLOW_LOG_SIZE)):
+    """Most recent analysis requests slower than SLOW_REQUEST_MS, with their stacks"""
+    if secret != os.getenv("ADMIN_SECRET", "propstats2024"):
+        raise HTTPException(status_code=403, detail="Unauthorized")
+    
+    return {
+        "threshold_ms": profiler.slow_requests.threshold_ms,
+        "requests": profiler.slow_requests.recent(limit)
     }
 
 if __name__ == "__main__":
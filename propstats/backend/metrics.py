@@ -0,0 +1,245 @@
+"""
+PropStats Metrics
+Stage timing spans, Prometheus-style /metrics and Server-Timing headers
+
+Set METRICS_ENABLED=0 to turn everything into no-ops.
+"""
+
+import contextvars
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Spans recorded during the current request, for the Server-Timing header
+_request_spans: contextvars.ContextVar[Optional[List[Tuple[str, float]]]] = contextvars.ContextVar(
+    "request_spans", default=None
+)
+
+
+def _label_str(labelnames: Tuple[str, ...], labels: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{v}"' for n, v in zip(labelnames, labels)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount: float = 1):
+        if not ENABLED:
+            return
+        key = tuple(str(l) for l in labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, *labels) -> float:
+        return self._values.get(tuple(str(l) for l in labels), 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_label_str(self.labelnames, key)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    def dec(self, *labels, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value: float, *labels):
+        if not ENABLED:
+            return
+        with self._lock:
+            self._values[tuple(str(l) for l in labels)] = value
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple[str, ...], list] = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        if not ENABLED:
+            return
+        key = tuple(str(l) for l in labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._series.items())
+        bounds = [f'le="{b}"' for b in self.buckets] + ['le="+Inf"']
+        for key, series in items:
+            cumulative = 0
+            for i, bound in enumerate(bounds):
+                cumulative = cumulative + series[i] if i < len(self.buckets) else series[-1]
+                lines.append(f"{self.name}_bucket{_label_str(self.labelnames, key, bound)} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_str(self.labelnames, key)} {series[-2]}")
+            lines.append(f"{self.name}_count{_label_str(self.labelnames, key)} {series[-1]}")
+        return lines
+
+
+REQUEST_SECONDS = Histogram("propstats_request_seconds", "HTTP request latency", ("handler", "status"))
+STAGE_SECONDS = Histogram("propstats_stage_seconds", "Time spent per hot-path stage", ("stage",))
+UPSTREAM_REQUESTS = Counter("propstats_upstream_requests_total", "Upstream calls by endpoint and status", ("endpoint", "status"))
+CACHE_REQUESTS = Counter("propstats_cache_requests_total", "Analysis requests served from stored data (hit) or refreshed (miss)", ("result",))
+REFRESH_IN_FLIGHT = Gauge("propstats_refresh_in_flight", "Player refreshes currently running")
+
+REGISTRY = [REQUEST_SECONDS, STAGE_SECONDS, UPSTREAM_REQUESTS, CACHE_REQUESTS, REFRESH_IN_FLIGHT]
+
+
+def register(metric):
+    """Add a metric defined elsewhere to the /metrics output"""
+    REGISTRY.append(metric)
+    return metric
+
+
+class _Span:
+    __slots__ = ("stage", "started")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.started
+        STAGE_SECONDS.observe(elapsed, self.stage)
+        spans = _request_spans.get()
+        if spans is not None:
+            spans.append((self.stage, elapsed))
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(stage: str):
+    """Time a block as one hot-path stage"""
+    if not ENABLED:
+        return _NULL_SPAN
+    return _Span(stage)
+
+
+class refreshing:
+    """Count a player refresh as in flight for the duration of the block"""
+
+    def __enter__(self):
+        REFRESH_IN_FLIGHT.inc()
+        return self
+
+    def __exit__(self, *exc):
+        REFRESH_IN_FLIGHT.dec()
+        return False
+
+
+def server_timing(spans: List[Tuple[str, float]], total: float) -> str:
+    """Server-Timing header value; repeated stages are summed"""
+    totals: Dict[str, List[float]] = {}
+    for stage, elapsed in spans:
+        entry = totals.setdefault(stage, [0.0, 0])
+        entry[0] += elapsed
+        entry[1] += 1
+    parts = [
+        f'{stage};dur={dur * 1000:.1f}' + (f';desc="x{n}"' if n > 1 else "")
+        for stage, (dur, n) in totals.items()
+    ]
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+def render() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """ASGI middleware: request histogram plus Server-Timing on every response"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        spans: List[Tuple[str, float]] = []
+        token = _request_spans.set(spans)
+        started = time.perf_counter()
+        status = [500]
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                header = server_timing(spans, time.perf_counter() - started)
+                message = dict(message)
+                message["headers"] = list(message.get("headers", [])) + [(b"server-timing", header.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_spans.reset(token)
+            endpoint = scope.get("endpoint")
+            handler = getattr(endpoint, "__name__", "unmatched")
+            REQUEST_SECONDS.observe(time.perf_counter() - started, handler, status[0])
+
+
+def install(app):
+    """Add the middleware and GET /metrics to a FastAPI app"""
+    from fastapi.responses import PlainTextResponse
+
+    if ENABLED:
+        app.add_middleware(MetricsMiddleware)
+
+    @app.get("/metrics", response_class=PlainTextResponse)
+    def metrics_endpoint():
+        """Prometheus text exposition of request, stage and upstream metrics"""
+        if not ENABLED:
+            return PlainTextResponse("# metrics disabled\n")
+        return PlainTextResponse(render(), media_type="text/plain; version=0.0.4")
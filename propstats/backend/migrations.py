@@ -0,0 +1,435 @@
+"""
+PropStats Schema Migrations
+Versioned, in-place upgrades of the SQLite database shared by main, main_v2 and populate_data
+
+Every app calls migrate() at startup instead of creating tables itself. Each migration runs
+in its own BEGIN IMMEDIATE transaction together with its schema_version row, so concurrent
+workers serialize on the write lock and a failed step leaves the database untouched.
+migrate() also puts the file in db.JOURNAL_MODE (WAL by default).
+
+Usage:
+  python migrations.py [--db nba_props.db]            # upgrade to the latest version
+  python migrations.py --status [--db nba_props.db]   # show applied versions
+"""
+
+import argparse
+import os
+import sqlite3
+import time
+from typing import Callable, Dict, List, Tuple
+
+import db
+from splits import GAME_DATE_ISO_SQL
+
+PLAYERS_DDL = """
+    CREATE TABLE IF NOT EXISTS players (
+        player_id TEXT PRIMARY KEY,
+        full_name TEXT NOT NULL,
+        first_name TEXT,
+        last_name TEXT,
+        team_id TEXT,
+        team_abbreviation TEXT,
+        team_name TEXT,
+        position TEXT,
+        height TEXT,
+        weight TEXT,
+        jersey_number TEXT,
+        is_active INTEGER DEFAULT 1,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+# game_date holds stats.nba.com's "APR 14, 2024" (or ISO) text; game_day is its sortable ISO form,
+# computed by SQLite on every write so no ingest path can leave it out
+GAME_DAY_SQL = " ".join(GAME_DATE_ISO_SQL.split())
+
+GAME_LOGS_DDL = f"""
+    CREATE TABLE IF NOT EXISTS game_logs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        player_id TEXT NOT NULL,
+        game_id TEXT NOT NULL,
+        game_date DATE NOT NULL,
+        season TEXT NOT NULL,
+        team_abbreviation TEXT,
+        opponent_abbreviation TEXT,
+        is_home INTEGER,
+        game_result TEXT,
+        minutes_played REAL,
+        points INTEGER DEFAULT 0,
+        rebounds INTEGER DEFAULT 0,
+        offensive_rebounds INTEGER DEFAULT 0,
+        defensive_rebounds INTEGER DEFAULT 0,
+        assists INTEGER DEFAULT 0,
+        steals INTEGER DEFAULT 0,
+        blocks INTEGER DEFAULT 0,
+        fg3m INTEGER DEFAULT 0,
+        fg3a INTEGER DEFAULT 0,
+        fgm INTEGER DEFAULT 0,
+        fga INTEGER DEFAULT 0,
+        ftm INTEGER DEFAULT 0,
+        fta INTEGER DEFAULT 0,
+        turnovers INTEGER DEFAULT 0,
+        personal_fouls INTEGER DEFAULT 0,
+        plus_minus INTEGER DEFAULT 0,
+        fetched_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        game_day TEXT GENERATED ALWAYS AS ({GAME_DAY_SQL}) VIRTUAL,
+        UNIQUE(player_id, game_id)
+    )
+"""
+
+USAGE_TRACKING_DDL = """
+    CREATE TABLE IF NOT EXISTS usage_tracking (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        ip_address TEXT NOT NULL,
+        player_id TEXT,
+        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        action TEXT
+    )
+"""
+
+GAME_DAY_INDEX = "CREATE INDEX IF NOT EXISTS idx_game_logs_player_day ON game_logs(player_id, game_day)"
+
+# Indexes as of migration 1, which has shipped; INDEXES is the current set
+V1_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_game_logs_player_date ON game_logs(player_id, game_date, season)",
+    "CREATE INDEX IF NOT EXISTS idx_game_logs_player_fetched ON game_logs(player_id, season, fetched_at)",
+    "CREATE INDEX IF NOT EXISTS idx_players_active_name ON players(is_active, full_name)",
+    "CREATE INDEX IF NOT EXISTS idx_usage_ip_action_time ON usage_tracking(ip_address, action, timestamp, player_id)",
+]
+
+INDEXES = [
+    GAME_DAY_INDEX,
+    "CREATE INDEX IF NOT EXISTS idx_game_logs_player_fetched ON game_logs(player_id, season, fetched_at)",
+    "CREATE INDEX IF NOT EXISTS idx_players_active_name ON players(is_active, full_name)",
+    "CREATE INDEX IF NOT EXISTS idx_usage_ip_action_time ON usage_tracking(ip_address, action, timestamp, player_id)",
+]
+
+# Legacy column names -> canonical ones (main.py and populate_data.py layouts)
+COLUMN_ALIASES: Dict[str, Dict[str, str]] = {
+    "players": {"team": "team_abbreviation"},
+    "game_logs": {
+        "opponent": "opponent_abbreviation",
+        "result": "game_result",
+        "minutes": "minutes_played",
+        "total_rebounds": "rebounds",
+    },
+    "usage_tracking": {},
+}
+
+TABLE_DDL = {
+    "players": PLAYERS_DDL,
+    "game_logs": GAME_LOGS_DDL,
+    "usage_tracking": USAGE_TRACKING_DDL,
+}
+
+
+def table_columns(conn: sqlite3.Connection, table: str) -> List[str]:
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+
+def canonical_columns(table: str) -> List[Tuple[str, bool]]:
+    """(name, NOT NULL without being the primary key) for the canonical layout"""
+    probe = sqlite3.connect(":memory:")
+    probe.execute(TABLE_DDL[table])
+    columns = [(row[1], bool(row[3]) and not row[5]) for row in probe.execute(f"PRAGMA table_info({table})")]
+    probe.close()
+    return columns
+
+
+def rebuild_table(conn: sqlite3.Connection, table: str) -> int:
+    """Bring one table to its canonical layout, copying rows with INSERT ... SELECT.
+
+    Returns the number of rows copied (0 when the table was created or already canonical).
+    """
+    existing = table_columns(conn, table)
+    if not existing:
+        conn.execute(TABLE_DDL[table])
+        return 0
+    canonical = canonical_columns(table)
+    names = {name for name, _ in canonical}
+    if set(existing) == names:
+        return 0
+
+    legacy = f"{table}_legacy"
+    conn.execute(f"ALTER TABLE {table} RENAME TO {legacy}")
+    conn.execute(TABLE_DDL[table])
+    aliases = COLUMN_ALIASES[table]
+    pairs = [(aliases.get(c, c), c) for c in existing if aliases.get(c, c) in names]
+    # Rows the canonical NOT NULL constraints would reject cannot be served anyway
+    not_null = {name for name, required in canonical if required}
+    required = [src for dst, src in pairs if dst in not_null]
+    where = " AND ".join(f"{src} IS NOT NULL" for src in required) or "1"
+    cursor = conn.execute(
+        f"INSERT OR REPLACE INTO {table} ({', '.join(dst for dst, _ in pairs)}) "
+        f"SELECT {', '.join(src for _, src in pairs)} FROM {legacy} WHERE {where}"
+    )
+    copied = cursor.rowcount
+    conn.execute(f"DROP TABLE {legacy}")
+    return copied
+
+
+def generation(conn: sqlite3.Connection, table: str) -> int:
+    """How many times swap_empty() has replaced `table`; caches keyed on ids add it to their key"""
+    row = conn.execute("SELECT value FROM sync_state WHERE key = ?", (f"generation:{table}",)).fetchone()
+    return int(row[0]) if row else 0
+
+
+def swap_empty(conn: sqlite3.Connection, table: str) -> str:
+    """Replace a table with an empty canonical copy by renaming it aside (no row deletes).
+
+    Returns the retired table's name, for drop_retired(). The AUTOINCREMENT sequence carries
+    over, so ids written after the swap stay above every id handed out before it. The table's
+    generation() goes up by one, which is how other processes learn their caches are stale.
+    """
+    retired = f"{table}_retired_{time.time_ns()}"
+    sequence = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (table,)).fetchone()
+    conn.execute(f"ALTER TABLE {table} RENAME TO {retired}")
+    # Named indexes move with the table; free their names for the new one
+    for (index,) in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL", (retired,)
+    ).fetchall():
+        conn.execute(f"DROP INDEX {index}")
+    conn.execute(TABLE_DDL[table])
+    for sql in INDEXES:
+        if f" ON {table}(" in sql:
+            conn.execute(sql)
+    if sequence:
+        conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", (table, sequence[0]))
+    conn.execute("""
+        INSERT OR REPLACE INTO sync_state (key, value, updated_at) VALUES (?, ?, datetime('now'))
+    """, (f"generation:{table}", str(generation(conn, table) + 1)))
+    return retired
+
+
+def drop_retired(db_path: str) -> int:
+    """Drop tables retired by swap_empty(), one short transaction each; returns how many"""
+    conn = sqlite3.connect(db_path, timeout=60)
+    try:
+        names = [row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB '*_retired_[0-9]*'"
+        )]
+        for name in names:
+            with conn:
+                conn.execute(f"DROP TABLE IF EXISTS {name}")
+    finally:
+        conn.close()
+    return len(names)
+
+
+def _unify_schemas(conn: sqlite3.Connection):
+    """One canonical layout for players, game_logs and usage_tracking (v2 columns plus fetched_at)"""
+    for name in ("idx_player", "idx_date", "idx_season", "idx_player_season"):
+        conn.execute(f"DROP INDEX IF EXISTS {name}")
+    for table in ("players", "game_logs", "usage_tracking"):
+        copied = rebuild_table(conn, table)
+        if copied:
+            print(f"   {table}: copied {copied} rows into the canonical layout")
+    for sql in V1_INDEXES:
+        conn.execute(sql)
+
+
+def _opponent_defense(conn: sqlite3.Connection):
+    """Per-opponent, per-position allowed averages and league ranks (filled by defense.py)"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS opponent_defense (
+            season TEXT NOT NULL,
+            opponent TEXT NOT NULL,
+            position TEXT NOT NULL,
+            games INTEGER NOT NULL,
+            opponents INTEGER NOT NULL,
+            points REAL, points_rank INTEGER,
+            rebounds REAL, rebounds_rank INTEGER,
+            assists REAL, assists_rank INTEGER,
+            threes REAL, threes_rank INTEGER,
+            steals REAL, steals_rank INTEGER,
+            blocks REAL, blocks_rank INTEGER,
+            turnovers REAL, turnovers_rank INTEGER,
+            pra REAL, pra_rank INTEGER,
+            pr REAL, pr_rank INTEGER,
+            pa REAL, pa_rank INTEGER,
+            ra REAL, ra_rank INTEGER,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (season, opponent, position)
+        ) WITHOUT ROWID
+    """)
+
+
+def _player_projections(conn: sqlite3.Connection):
+    """Running EWMA and per-36 state per player-season (maintained by projections.py)"""
+    stats = ("points", "rebounds", "assists", "threes", "steals", "blocks", "turnovers")
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS player_projections (
+            player_id TEXT NOT NULL,
+            season TEXT NOT NULL,
+            games INTEGER NOT NULL,
+            last_day TEXT,
+            half_life REAL NOT NULL,
+            minutes_total REAL NOT NULL,
+            minutes_ewma REAL NOT NULL,
+            {''.join(f"{stat}_total REAL NOT NULL, {stat}_ewma REAL NOT NULL, " for stat in stats)}
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (player_id, season)
+        ) WITHOUT ROWID
+    """)
+
+
+def _ingest_queue(conn: sqlite3.Connection):
+    """Refresh job queue consumed by ingest_worker.py, plus the shared upstream rate-limit slot"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS ingest_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            player_id TEXT NOT NULL,
+            seasons TEXT NOT NULL,
+            include_details INTEGER NOT NULL DEFAULT 1,
+            priority INTEGER NOT NULL DEFAULT 0,
+            status TEXT NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            worker TEXT,
+            enqueued_at REAL NOT NULL,
+            started_at REAL,
+            lease_until REAL,
+            finished_at REAL,
+            games INTEGER,
+            error TEXT
+        )
+    """)
+    # At most one queued or running job per player and season list
+    conn.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_ingest_jobs_active
+        ON ingest_jobs(player_id, seasons) WHERE status IN ('queued', 'running')
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_ingest_jobs_status ON ingest_jobs(status, priority DESC, id)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS upstream_rate (
+            name TEXT PRIMARY KEY,
+            next_slot REAL NOT NULL
+        )
+    """)
+
+
+def _sync_state(conn: sqlite3.Connection):
+    """Key/value progress markers, e.g. how far this replica has pulled from the shared store"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS sync_state (
+            key TEXT PRIMARY KEY,
+            value TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+def _schedule(conn: sqlite3.Connection):
+    """Cached league schedule, read by the freshness oracle"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schedule (
+            game_id TEXT PRIMARY KEY,
+            season TEXT NOT NULL,
+            starts_at REAL NOT NULL,
+            home_team TEXT NOT NULL,
+            away_team TEXT NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_schedule_season ON schedule(season)")
+
+
+def _fetch_misses(conn: sqlite3.Connection):
+    """Negative cache: player-seasons whose last fetch came back empty or failed, and when to retry"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS fetch_misses (
+            player_id TEXT NOT NULL,
+            season TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            misses INTEGER NOT NULL,
+            recorded_at REAL NOT NULL,
+            retry_at REAL NOT NULL,
+            error TEXT,
+            PRIMARY KEY (player_id, season)
+        )
+    """)
+
+
+def _game_day(conn: sqlite3.Connection):
+    """Sortable ISO game_day next to game_date ('APR 14, 2024' strings sort by month name)"""
+    if "game_day" not in [row[1] for row in conn.execute("PRAGMA table_xinfo(game_logs)")]:
+        conn.execute(f"ALTER TABLE game_logs ADD COLUMN game_day TEXT GENERATED ALWAYS AS ({GAME_DAY_SQL}) VIRTUAL")
+    conn.execute("DROP INDEX IF EXISTS idx_game_logs_player_date")
+    conn.execute(GAME_DAY_INDEX)
+
+
+def _unknown_teams(conn: sqlite3.Connection):
+    """NULL instead of the roster's 'FA' placeholder, which /admin/sync-players wrote over known teams"""
+    conn.execute("UPDATE players SET team_abbreviation = NULL WHERE team_abbreviation = 'FA'")
+
+
+# (version, name, step) - append only; never edit a migration that has shipped
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Connection], None]]] = [
+    (1, "unify_schemas", _unify_schemas),
+    (2, "opponent_defense", _opponent_defense),
+    (3, "player_projections", _player_projections),
+    (4, "ingest_queue", _ingest_queue),
+    (5, "sync_state", _sync_state),
+    (6, "schedule", _schedule),
+    (7, "fetch_misses", _fetch_misses),
+    (8, "game_day", _game_day),
+    (9, "unknown_teams", _unknown_teams),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(conn: sqlite3.Connection) -> int:
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+
+def migrate(db_path: str) -> int:
+    """Apply every pending migration; returns the resulting schema version"""
+    db.set_journal_mode(db_path)
+    conn = sqlite3.connect(db_path, isolation_level=None, timeout=60)
+    try:
+        for version, name, step in MIGRATIONS:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Re-read under the write lock: another worker may have just applied it
+                if current_version(conn) >= version:
+                    conn.execute("COMMIT")
+                    continue
+                started = time.perf_counter()
+                step(conn)
+                conn.execute("INSERT INTO schema_version (version, name) VALUES (?, ?)", (version, name))
+                conn.execute("COMMIT")
+                print(f"✅ Migrated {db_path} to schema v{version} ({name}, {time.perf_counter() - started:.2f}s)")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return current_version(conn)
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Upgrade a PropStats database to the latest schema")
+    parser.add_argument("--db", default=os.getenv("DATABASE_PATH", "nba_props.db"), help="SQLite database path")
+    parser.add_argument("--status", action="store_true", help="Show applied migrations and exit")
+    args = parser.parse_args()
+
+    if args.status:
+        conn = sqlite3.connect(args.db)
+        version = current_version(conn)
+        for row in conn.execute("SELECT version, name, applied_at FROM schema_version ORDER BY version"):
+            print(f"  v{row[0]} {row[1]} ({row[2]})")
+        conn.close()
+        print(f"{args.db}: schema v{version} (latest v{LATEST_VERSION})")
+        return
+
+    migrate(args.db)
+
+
+if __name__ == "__main__":
+    main()
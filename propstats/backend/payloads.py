@@ -0,0 +1,133 @@
+"""
+PropStats Response Payloads
+Fast JSON for the analysis responses, plus the optional columnar layout of the games list
+
+Handlers build payloads from plain dicts, lists, str, int, float, bool and None, so they
+return `json_response(payload)` directly: FastAPI then skips jsonable_encoder (which walks
+every value reflectively) and orjson serializes the payload in one C pass.
+
+Columnar games turn 30 dicts of ~15 keys into one list per key, so keys are written once:
+  {"games": {"date": ["APR 14, 2024", ...], "value": [27, ...], ...}}
+
+Usage:
+  python payloads.py [--games 30] [--iterations 2000]   # serialization micro-benchmark
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import time
+from typing import Any, Callable, Dict, List
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import ORJSONResponse
+
+
+def columnar(games: List[Dict[str, Any]]) -> Dict[str, List[Any]]:
+    """[{"date": d, "value": v}, ...] -> {"date": [d, ...], "value": [v, ...]}"""
+    if not games:
+        return {}
+    return {key: [game[key] for game in games] for key in games[0]}
+
+
+def json_response(payload: Dict[str, Any], columnar_games: bool = False) -> ORJSONResponse:
+    """Pre-validated payload straight to orjson, optionally with the games list columnar"""
+    if columnar_games and isinstance(payload.get("games"), list):
+        payload["games"] = columnar(payload["games"])
+    return ORJSONResponse(payload)
+
+
+def etag(body: bytes) -> str:
+    """Strong ETag for a serialized body"""
+    return '"' + hashlib.blake2b(body, digest_size=8).hexdigest() + '"'
+
+
+def dumps_line(row: Dict[str, Any]) -> bytes:
+    """One NDJSON line"""
+    return orjson.dumps(row, option=orjson.OPT_APPEND_NEWLINE)
+
+
+def sample_payload(n_games: int, rng: random.Random) -> Dict[str, Any]:
+    """Analysis-shaped payload (v2 layout) with synthetic games"""
+    teams = ["BOS", "NYK", "MIA", "DEN", "LAL", "GSW", "PHX", "MIL"]
+    games = []
+    for i in range(n_games):
+        value = rng.randint(8, 40)
+        games.append({
+            "date": f"MAR {i % 28 + 1:02d}, 2025",
+            "opponent": rng.choice(teams),
+            "value": value,
+            "hit": value > 24.5,
+            "is_home": rng.random() < 0.5,
+            "result": rng.choice("WL"),
+            "minutes": round(rng.uniform(24, 40), 1),
+            "pts": value,
+            "reb": rng.randint(0, 15),
+            "ast": rng.randint(0, 12),
+            "fg3m": rng.randint(0, 7),
+            "stl": rng.randint(0, 4),
+            "blk": rng.randint(0, 4),
+            "tov": rng.randint(0, 6),
+            "season": "2024-25",
+        })
+    rate = {"hits": 6, "total": 10, "pct": 60.0}
+    bucket = {"games": 12, "average": 24.8, "hits": 7, "pct": 58.3}
+    return {
+        "player": {"id": "2544", "name": "LeBron James", "team": "LAL", "team_name": "Lakers",
+                   "team_color": "#552583", "position": "F", "jersey": "23",
+                   "headshot": "https://cdn.nba.com/headshots/nba/latest/1040x760/2544.png",
+                   "team_logo": "https://cdn.nba.com/logos/nba/1610612747/global/L/logo.svg"},
+        "stat": "points",
+        "line": 24.5,
+        "season": "2024-25",
+        "averages": {"season": 25.1, "l5": 26.4, "l10": 24.9, "career": 25.3},
+        "games": games,
+        "hit_rates": {k: dict(rate) for k in ("season", "l5", "l10", "l20", "home", "away")},
+        "metrics": {"consistency": 71.2, "trend": "up", "games_played": 60},
+        "recommendation": {"verdict": "LEAN OVER", "confidence": "medium", "reasoning": "60% hit rate"},
+        "vs": None,
+        "splits": {"home_away": {"home": dict(bucket), "away": dict(bucket)},
+                   "opponent": {team: dict(bucket) for team in teams}},
+    }
+
+
+def _time(fn: Callable[[], bytes], iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analysis payload serialization micro-benchmark")
+    parser.add_argument("--games", type=int, default=30)
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    payload = sample_payload(args.games, random.Random(args.seed))
+    columnar_payload = dict(payload, games=columnar(payload["games"]))
+    cases = {
+        # What FastAPI does with a returned dict: jsonable_encoder, then JSONResponse's json.dumps
+        "jsonable_encoder + json": lambda: json.dumps(
+            jsonable_encoder(payload), ensure_ascii=False, allow_nan=False, separators=(",", ":")
+        ).encode(),
+        "json": lambda: json.dumps(payload, separators=(",", ":")).encode(),
+        "orjson": lambda: orjson.dumps(payload),
+        "orjson columnar": lambda: orjson.dumps(dict(payload, games=columnar(payload["games"]))),
+    }
+    assert orjson.loads(cases["orjson"]()) == json.loads(cases["jsonable_encoder + json"]())
+    assert orjson.loads(orjson.dumps(columnar_payload)) == json.loads(json.dumps(columnar_payload))
+
+    baseline = None
+    print(f"📦 Analysis payload, {args.games} games, {args.iterations} iterations")
+    for name, fn in cases.items():
+        micros = _time(fn, args.iterations)
+        baseline = baseline or micros
+        print(f"  {name:<26} {micros:8.1f} µs  {baseline / micros:5.1f}x  {len(fn()):6d} bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,93 +3,29 @@ PropStats Data Populator
 Run this to populate your database with NBA player data
 """
 
-import requests
-import time
 import sqlite3
-from datetime import datetime
+import time
 
-DB_PATH = "nba_props.db"
+import db
+import migrations
+import projections
+import upstream
+from colstore import export_snapshot
+from defense import rebuild_seasons as rebuild_defense
 
-NBA_HEADERS = {
-    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-    'Referer': 'https://www.nba.com/',
-    'Accept': 'application/json, text/plain, */*',
-    'Accept-Language': 'en-US,en;q=0.9',
-    'Origin': 'https://www.nba.com',
-    'Host': 'stats.nba.com',
-    'Connection': 'keep-alive',
-}
+DB_PATH = "nba_props.db"
 
 def init_database():
-    """Create database tables"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS players (
-            player_id TEXT PRIMARY KEY,
-            full_name TEXT NOT NULL,
-            team_abbreviation TEXT,
-            position TEXT,
-            is_active INTEGER DEFAULT 1
-        )
-    """)
-    
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS game_logs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            player_id TEXT NOT NULL,
-            game_id TEXT NOT NULL,
-            game_date DATE NOT NULL,
-            season TEXT NOT NULL,
-            team_abbreviation TEXT,
-            opponent_abbreviation TEXT,
-            is_home INTEGER,
-            game_result TEXT,
-            minutes_played REAL,
-            points INTEGER,
-            total_rebounds INTEGER,
-            assists INTEGER,
-            steals INTEGER,
-            blocks INTEGER,
-            fg3m INTEGER,
-            turnovers INTEGER DEFAULT 0,
-            UNIQUE(player_id, game_id)
-        )
-    """)
-    
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_player ON game_logs(player_id)")
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_date ON game_logs(game_date)")
-    
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS usage_tracking (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            ip_address TEXT NOT NULL,
-            player_id TEXT,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            action TEXT
-        )
-    """)
-    
-    conn.commit()
-    conn.close()
+    """Create or upgrade database tables"""
+    migrations.migrate(DB_PATH)
     print("✅ Database initialized")
 
 def fetch_all_players():
     """Fetch all NBA players"""
-    url = "https://stats.nba.com/stats/commonallplayers"
-    params = {
-        'LeagueID': '00',
-        'Season': '2024-25',
-        'IsOnlyCurrentSeason': '1'
-    }
-    
     print("🔄 Fetching all NBA players...")
     
     try:
-        response = requests.get(url, headers=NBA_HEADERS, params=params, timeout=15)
-        response.raise_for_status()
-        data = response.json()
+        data = upstream.all_players('2024-25')
         
         players = []
         for player in data['resultSets'][0]['rowSet']:
@@ -105,8 +41,12 @@ def fetch_all_players():
         
         for player in players:
             cursor.execute("""
-                INSERT OR REPLACE INTO players (player_id, full_name, team_abbreviation, position, is_active)
+                INSERT INTO players (player_id, full_name, team_abbreviation, position, is_active)
                 VALUES (?, ?, ?, ?, 1)
+                ON CONFLICT(player_id) DO UPDATE SET
+                    full_name = excluded.full_name,
+                    team_abbreviation = excluded.team_abbreviation,
+                    is_active = 1
             """, (player['id'], player['name'], player['team'], player['position']))
         
         conn.commit()
@@ -121,19 +61,8 @@ def fetch_all_players():
 
 def fetch_player_game_log(player_id: str, player_name: str):
     """Fetch game log for a player"""
-    url = "https://stats.nba.com/stats/playergamelog"
-    params = {
-        'PlayerID': player_id,
-        'Season': '2024-25',
-        'SeasonType': 'Regular Season'
-    }
-    
     try:
-        response = requests.get(url, headers=NBA_HEADERS, params=params, timeout=15)
-        time.sleep(0.7)  # Rate limiting - important!
-        
-        response.raise_for_status()
-        data = response.json()
+        data = upstream.player_game_log(player_id, '2024-25')  # Rate limited upstream
         
         if not data['resultSets'] or not data['resultSets'][0]['rowSet']:
             return 0
@@ -159,11 +88,11 @@ def fetch_player_game_log(player_id: str, player_name: str):
                 INSERT OR REPLACE INTO game_logs 
                 (player_id, game_id, game_date, season, team_abbreviation, 
                  opponent_abbreviation, is_home, game_result, minutes_played,
-                 points, total_rebounds, assists, steals, blocks, fg3m, turnovers)
+                 points, rebounds, assists, steals, blocks, fg3m, turnovers)
                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             """, (
                 player_id,
-                game[headers_list.index('GAME_ID')],
+                game[headers_list.index('Game_ID' if 'Game_ID' in headers_list else 'GAME_ID')],
                 game[headers_list.index('GAME_DATE')],
                 '2024-25',
                 matchup.split()[0],
@@ -180,6 +109,7 @@ def fetch_player_game_log(player_id: str, player_name: str):
                 game[headers_list.index('TOV')] if 'TOV' in headers_list else 0
             ))
         
+        projections.update(cursor, player_id, '2024-25')
         conn.commit()
         conn.close()
         
@@ -206,10 +136,18 @@ TOP_PLAYERS = [
     "Kyrie Irving", "James Harden"
 ]
 
+def print_throughput(started: float, player_count: int, game_count: int):
+    """Report populate throughput and which upstream backend served it"""
+    elapsed = time.perf_counter() - started
+    print(f"⏱️  {elapsed:.1f}s - {player_count / elapsed:.2f} players/s, "
+          f"{game_count / elapsed:.1f} games/s "
+          f"(upstream: {upstream.UPSTREAM_MODE} {upstream.NBA_STATS_BASE_URL or 'stats.nba.com'})")
+
 def quick_populate():
     """Quick populate - Top 50 players for fast testing"""
     print("🚀 Quick populate - Top 50 players")
     print("=" * 50)
+    started = time.perf_counter()
     
     init_database()
     players = fetch_all_players()
@@ -247,6 +185,10 @@ def quick_populate():
     print(f"✅ Quick populate complete!")
     print(f"📊 {len(players)} players in database")
     print(f"🏀 {total_games} game logs stored")
+    print_throughput(started, min(len(top_player_ids), 50), total_games)
+    export_snapshot(DB_PATH)
+    rebuild_defense(DB_PATH)
+    db.checkpoint(DB_PATH, truncate=True)
     print()
     print("Run 'python main.py' to start the API server!")
 
@@ -255,6 +197,7 @@ def full_populate():
     print("🚀 Full populate - All active players")
     print("⚠️  This will take 10-15 minutes!")
     print("=" * 50)
+    started = time.perf_counter()
     
     init_database()
     players = fetch_all_players()
@@ -280,6 +223,10 @@ def full_populate():
     print(f"✅ Full populate complete!")
     print(f"📊 {len(players)} players")
     print(f"🏀 {total_games} game logs")
+    print_throughput(started, len(players), total_games)
+    export_snapshot(DB_PATH)
+    rebuild_defense(DB_PATH)
+    db.checkpoint(DB_PATH, truncate=True)
 
 if __name__ == "__main__":
     import sys
@@ -0,0 +1,67 @@
+"""
+PropStats Presentation Metadata
+Team display fields and the /teams payload, derived once from an app's TEAM_INFO
+
+Search, player and analysis responses enrich every row with a team name, color and logo;
+TeamDirectory turns those into one dict lookup per row. The /teams body never changes
+while the process runs, so it is serialized once and served as bytes with a strong ETag
+(clients revalidate with If-None-Match and get a 304).
+"""
+
+from typing import Any, Dict, Optional
+
+import orjson
+from fastapi.responses import Response
+
+from payloads import etag
+
+HEADSHOT_URL = "https://cdn.nba.com/headshots/nba/latest/1040x760/{}.png"
+LOGO_URL = "https://cdn.nba.com/logos/nba/{}/primary/L/logo.svg"
+
+TEAMS_CACHE_CONTROL = "public, max-age=86400"
+
+FREE_AGENT_DISPLAY = {"team_name": "Free Agent", "team_color": "#666666", "team_logo": ""}
+
+
+def headshot_url(player_id: str) -> str:
+    return HEADSHOT_URL.format(player_id)
+
+
+class TeamDirectory:
+    """Immutable per-team display fields plus the serialized /teams body"""
+
+    __slots__ = ("display", "teams_body", "teams_etag")
+
+    def __init__(self, team_info: Dict[str, Dict[str, Any]]):
+        self.display: Dict[str, Dict[str, str]] = {
+            abbr: {
+                "team_name": info["name"],
+                "team_color": info["color"],
+                "team_logo": LOGO_URL.format(info["id"]) if "id" in info else "",
+            }
+            for abbr, info in team_info.items()
+        }
+        team_list = [
+            {
+                "abbreviation": abbr,
+                "id": info.get("id"),
+                "name": info["name"],
+                "city": info.get("city", ""),
+                "full_name": f"{info.get('city', '')} {info['name']}".strip(),
+                "color": info["color"],
+                "logo": self.display[abbr]["team_logo"],
+            }
+            for abbr, info in team_info.items()
+        ]
+        self.teams_body = orjson.dumps({"teams": sorted(team_list, key=lambda t: t["city"])})
+        self.teams_etag = etag(self.teams_body)
+
+    def get(self, team_abbr: Optional[str]) -> Dict[str, str]:
+        """team_name, team_color and team_logo; Free Agent fields for unknown teams"""
+        return self.display.get(team_abbr, FREE_AGENT_DISPLAY)
+
+    def teams_response(self, if_none_match: Optional[str]) -> Response:
+        headers = {"ETag": self.teams_etag, "Cache-Control": TEAMS_CACHE_CONTROL}
+        if if_none_match and self.teams_etag in [tag.strip() for tag in if_none_match.split(",")]:
+            return Response(status_code=304, headers=headers)
+        return Response(self.teams_body, media_type="application/json", headers=headers)
@@ -0,0 +1,353 @@
+"""
+PropStats Probability Engine
+P(over), P(under) and fair prices for any line, from a per-player, per-stat distribution
+
+A fit reads the player's last MAX_GAMES stored games (requested and previous season) and
+weights each game by recency (half-life PROB_HALF_LIFE_GAMES) and by minutes relative to
+the player's median, so blowouts and injury exits count less. Two models:
+  negbin     negative binomial from the weighted mean and variance (Poisson when the
+             stat is not over-dispersed); the default, suited to counting stats
+  empirical  weighted histogram of the games, smoothed with a discrete Gaussian kernel
+
+Each fit is a PMF/CDF vector over 0..K, so any number of lines is one NumPy indexing
+pass, and a slate stacks the CDFs so every line is priced in one pass. Fits are cached per
+(player, season, stat, model) against the player's data version (row count and highest
+id), so a refresh invalidates them implicitly; while nothing has been written to
+game_logs the versions are not even re-read.
+
+Usage:
+  python probability.py --db nba_props.db [--season 2024-25] [--lines 500]   # slate timing
+"""
+
+import argparse
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from pydantic import BaseModel, Field
+
+from defense import STATS
+
+MODELS = ("negbin", "empirical")
+MAX_GAMES = int(os.getenv("PROB_MAX_GAMES", "82"))
+HALF_LIFE_GAMES = float(os.getenv("PROB_HALF_LIFE_GAMES", "15"))
+CACHE_SIZE = int(os.getenv("PROB_CACHE_SIZE", "2048"))
+MAX_SLATE_LEGS = 2000
+
+# Minutes weight bounds, relative to the player's median minutes
+MIN_MINUTES_WEIGHT = 0.2
+MAX_MINUTES_WEIGHT = 1.2
+
+
+def previous_season(season: str) -> str:
+    start = int(season[:4]) - 1
+    return f"{start}-{(start + 1) % 100:02d}"
+
+
+def american_odds(p: float) -> Optional[int]:
+    """No-vig American price for probability p, at the 4 decimals probabilities are reported with.
+
+    A probability shown as 0 or 1 has no price (None) instead of one in the trillions.
+    """
+    p = round(p, 4)
+    if p <= 0 or p >= 1:
+        return None
+    return round(-100 * p / (1 - p)) if p >= 0.5 else round(100 * (1 - p) / p)
+
+
+class SlateLeg(BaseModel):
+    player_id: str
+    stat: str
+    line: float
+
+
+class SlateRequest(BaseModel):
+    legs: List[SlateLeg] = Field(..., max_length=MAX_SLATE_LEGS)
+    season: Optional[str] = None
+    model: str = "negbin"
+
+
+class Fit:
+    """Fitted distribution of one player's stat as a PMF over 0..K"""
+
+    __slots__ = ("model", "games", "mean", "stdev", "pmf", "cdf")
+
+    def __init__(self, model: str, games: int, mean: float, stdev: float, pmf: np.ndarray):
+        self.model = model
+        self.games = games
+        self.mean = mean
+        self.stdev = stdev
+        self.pmf = pmf / pmf.sum()
+        self.cdf = np.cumsum(self.pmf)
+
+    def evaluate(self, lines: Sequence[float]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(P(over), P(under), P(push)) for each line, vectorized"""
+        lines = np.asarray(lines, dtype=np.float64)
+        top = len(self.cdf) - 1
+        below = np.clip(np.floor(lines), -1, top).astype(np.int64)      # P(X <= floor(line))
+        under_idx = np.clip(np.ceil(lines) - 1, -1, top).astype(np.int64)  # P(X <= ceil(line) - 1)
+        cdf = np.concatenate(([0.0], self.cdf))                          # cdf[-1] -> 0
+        over = np.clip(1.0 - cdf[below + 1], 0.0, 1.0)
+        under = cdf[under_idx + 1]
+        push = np.clip(1.0 - over - under, 0.0, 1.0)
+        return over, under, push
+
+    def price(self, line: float) -> Dict[str, Any]:
+        over, under, push = (float(v[0]) for v in self.evaluate([line]))
+        decided = over + under
+        return {
+            "line": line,
+            "model": self.model,
+            "games": self.games,
+            "mean": round(self.mean, 2),
+            "stdev": round(self.stdev, 2),
+            "p_over": round(over, 4),
+            "p_under": round(under, 4),
+            "p_push": round(push, 4),
+            # Pushes refund, so the fair price is on the decided outcomes only
+            "fair_odds": {
+                "over": american_odds(over / decided) if decided else None,
+                "under": american_odds(under / decided) if decided else None,
+            },
+        }
+
+
+def game_weights(minutes: np.ndarray) -> np.ndarray:
+    """Recency decay (newest first) times a clipped minutes ratio"""
+    recency = 0.5 ** (np.arange(len(minutes)) / HALF_LIFE_GAMES)
+    played = minutes[minutes > 0]
+    median = float(np.median(played)) if len(played) else 0.0
+    if median <= 0:
+        return recency
+    return recency * np.clip(minutes / median, MIN_MINUTES_WEIGHT, MAX_MINUTES_WEIGHT)
+
+
+def _support(values: np.ndarray, mean: float, var: float) -> int:
+    return int(max(values.max(initial=0), mean + 10 * math.sqrt(var))) + 10
+
+
+def fit_distribution(values: np.ndarray, weights: np.ndarray, model: str = "negbin") -> Fit:
+    """Weighted fit of non-negative integer stat values"""
+    values = np.clip(np.rint(values), 0, None).astype(np.int64)
+    w = weights / weights.sum()
+    mean = float(np.dot(w, values))
+    n_eff = 1.0 / float(np.dot(w, w))
+    var = float(np.dot(w, (values - mean) ** 2)) * (n_eff / (n_eff - 1) if n_eff > 1 else 1.0)
+    k = np.arange(1, _support(values, mean, var) + 1)
+
+    if model == "empirical":
+        hist = np.bincount(values, weights=w, minlength=len(k) + 1).astype(np.float64)
+        bandwidth = max(0.5, 1.06 * math.sqrt(var) * n_eff ** -0.2)
+        offsets = np.arange(-math.ceil(3 * bandwidth), math.ceil(3 * bandwidth) + 1)
+        kernel = np.exp(-0.5 * (offsets / bandwidth) ** 2)
+        pmf = np.convolve(hist, kernel / kernel.sum(), mode="same")
+    elif mean <= 0:
+        pmf = np.zeros(len(k) + 1)
+        pmf[0] = 1.0
+    elif var <= mean * 1.0001:
+        # Poisson, by the recurrence p(k) = p(k-1) * mean / k
+        pmf = np.exp(-mean) * np.concatenate(([1.0], np.cumprod(mean / k)))
+    else:
+        # Negative binomial with r successes: p(k) = p(k-1) * (k-1+r)/k * mean/(r+mean)
+        r = mean * mean / (var - mean)
+        q = mean / (r + mean)
+        pmf = (1 - q) ** r * np.concatenate(([1.0], np.cumprod((k - 1 + r) / k * q)))
+    return Fit(model, len(values), mean, math.sqrt(var), pmf)
+
+
+class _FitCache:
+    """LRU of fits keyed by (player, season, stat, model).
+
+    Each entry remembers the player's data version it was fitted on and the game_logs
+    write sequence at which that version was last confirmed. While the sequence has not
+    moved nothing was written, so entries are served without asking for versions at all.
+    The sequence includes the table's generation, since /admin/clear-cache empties game_logs
+    (in any worker) without moving the AUTOINCREMENT id.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._items: "OrderedDict[tuple, list]" = OrderedDict()  # key -> [version, sequence, fit]
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple, sequence: tuple, version: tuple = None) -> Tuple[bool, Optional[Fit]]:
+        """Entry confirmed at `sequence`, or fitted on `version` (then re-confirmed)"""
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is None or (entry[1] != sequence and entry[0] != version):
+                return False, None
+            entry[1] = sequence
+            self._items.move_to_end(key)
+            return True, entry[2]
+
+    def put(self, key: tuple, version: tuple, sequence: tuple, fit: Optional[Fit]):
+        with self._lock:
+            self._items[key] = [version, sequence, fit]
+            self._items.move_to_end(key)
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+fit_cache = _FitCache(CACHE_SIZE)
+
+
+def write_sequence(cursor) -> Tuple[int, Optional[int]]:
+    """(generation, last AUTOINCREMENT id) of game_logs; moves on every insert, replace or swap_empty()"""
+    cursor.execute("""
+        SELECT (SELECT value FROM sync_state WHERE key = 'generation:game_logs'),
+               (SELECT seq FROM sqlite_sequence WHERE name = 'game_logs')
+    """)
+    generation, sequence = cursor.fetchone()
+    return int(generation or 0), sequence
+
+
+def data_versions(cursor, player_ids: Sequence[str]) -> Dict[str, tuple]:
+    """(row count, highest id) per player, in one indexed query per 500 players.
+
+    Every insert or replace takes a new AUTOINCREMENT id, and ids keep rising across
+    swap_empty(), so a re-fetch within the same second still changes the version.
+    """
+    versions = {player_id: (0, None) for player_id in player_ids}
+    ids = list(versions)
+    for start in range(0, len(ids), 500):
+        chunk = ids[start:start + 500]
+        cursor.execute(f"""
+            SELECT player_id, COUNT(*), MAX(id) FROM game_logs
+            WHERE player_id IN ({', '.join('?' * len(chunk))})
+            GROUP BY player_id
+        """, chunk)
+        for player_id, count, max_id in cursor.fetchall():
+            versions[player_id] = (count, max_id)
+    return versions
+
+
+def load_games(cursor, player_id: str, season: str, stat: str) -> Tuple[np.ndarray, np.ndarray]:
+    """(values, minutes) of the newest MAX_GAMES games in the season and the one before"""
+    cursor.execute(f"""
+        SELECT game_day, COALESCE({STATS[stat]}, 0), COALESCE(minutes_played, 0)
+        FROM game_logs
+        WHERE player_id = ? AND season IN (?, ?)
+        ORDER BY game_day DESC
+        LIMIT ?
+    """, (player_id, season, previous_season(season), MAX_GAMES))
+    rows = cursor.fetchall()
+    return (np.array([row[1] for row in rows], dtype=np.float64),
+            np.array([row[2] for row in rows], dtype=np.float64))
+
+
+def get_fits(cursor, season: str, pairs: Sequence[Tuple[str, str]],
+             model: str = "negbin") -> Dict[Tuple[str, str], Optional[Fit]]:
+    """Current fit (None without games) per (player_id, stat)"""
+    sequence = write_sequence(cursor)
+    fits: Dict[Tuple[str, str], Optional[Fit]] = {}
+    unconfirmed = []
+    for player_id, stat in dict.fromkeys(pairs):
+        found, fit = fit_cache.get((player_id, season, stat, model), sequence)
+        if found:
+            fits[(player_id, stat)] = fit
+        else:
+            unconfirmed.append((player_id, stat))
+    if not unconfirmed:
+        return fits
+
+    versions = data_versions(cursor, [player_id for player_id, _ in unconfirmed])
+    for player_id, stat in unconfirmed:
+        key = (player_id, season, stat, model)
+        found, fit = fit_cache.get(key, sequence, versions[player_id])
+        if not found:
+            values, minutes = load_games(cursor, player_id, season, stat)
+            fit = fit_distribution(values, game_weights(minutes), model) if len(values) else None
+            fit_cache.put(key, versions[player_id], sequence, fit)
+        fits[(player_id, stat)] = fit
+    return fits
+
+
+def price_line(cursor, player_id: str, season: str, stat: str, line: float,
+               model: str = "negbin") -> Optional[Dict[str, Any]]:
+    """`probability` block of the analysis response"""
+    if stat not in STATS:
+        return None
+    fit = get_fits(cursor, season, [(player_id, stat)], model)[(player_id, stat)]
+    return fit.price(line) if fit else None
+
+
+def validate_slate(slate: SlateRequest):
+    """Raises ValueError on unknown models or stats"""
+    if slate.model not in MODELS:
+        raise ValueError(f"Unknown model: {slate.model}. Choose from {', '.join(MODELS)}")
+    unknown = sorted({leg.stat for leg in slate.legs} - set(STATS))
+    if unknown:
+        raise ValueError(f"Unknown stat(s): {', '.join(unknown)}. Choose from {', '.join(STATS)}")
+
+
+def price_slate(cursor, season: str, legs: List[Dict[str, Any]], model: str = "negbin") -> List[Dict[str, Any]]:
+    """Price many {player_id, stat, line} legs in one vectorized pass over the stacked CDFs"""
+    fits = get_fits(cursor, season, [(leg["player_id"], leg["stat"]) for leg in legs], model)
+    fitted = [fit for fit in dict.fromkeys(fits.values()) if fit is not None]
+    row_of = {id(fit): i for i, fit in enumerate(fitted)}
+
+    # One row per fit: cdf[-1] = 0 in column 0, then the CDF, padded with 1 past its support
+    width = max((len(fit.cdf) for fit in fitted), default=0) + 1
+    cdfs = np.ones((len(fitted), width))
+    cdfs[:, 0] = 0.0
+    for i, fit in enumerate(fitted):
+        cdfs[i, 1:len(fit.cdf) + 1] = fit.cdf
+
+    priced = [i for i, leg in enumerate(legs) if fits[(leg["player_id"], leg["stat"])] is not None]
+    rows = np.array([row_of[id(fits[(legs[i]["player_id"], legs[i]["stat"])])] for i in priced], dtype=np.int64)
+    lines = np.array([legs[i]["line"] for i in priced], dtype=np.float64)
+    over = 1.0 - cdfs[rows, np.clip(np.floor(lines) + 1, 0, width - 1).astype(np.int64)]
+    under = cdfs[rows, np.clip(np.ceil(lines), 0, width - 1).astype(np.int64)]
+    push = np.clip(1.0 - over - under, 0.0, 1.0)
+
+    results = [
+        {"player_id": leg["player_id"], "stat": leg["stat"], "line": leg["line"],
+         "p_over": None, "p_under": None, "p_push": None, "games": 0}
+        for leg in legs
+    ]
+    for j, i in enumerate(priced):
+        result = results[i]
+        result["p_over"] = round(float(over[j]), 4)
+        result["p_under"] = round(float(under[j]), 4)
+        result["p_push"] = round(float(push[j]), 4)
+        result["games"] = fits[(legs[i]["player_id"], legs[i]["stat"])].games
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time slate pricing against a database")
+    parser.add_argument("--db", default=os.getenv("DATABASE_PATH", "nba_props.db"), help="SQLite database path")
+    parser.add_argument("--season", default="2024-25")
+    parser.add_argument("--lines", type=int, default=500)
+    parser.add_argument("--model", choices=MODELS, default="negbin")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    cursor = conn.cursor()
+    cursor.execute("SELECT DISTINCT player_id FROM game_logs WHERE season = ?", (args.season,))
+    players = [row[0] for row in cursor.fetchall()]
+    if not players:
+        raise SystemExit(f"No games for {args.season} in {args.db}")
+    rng = np.random.default_rng(42)
+    stats = list(STATS)
+    legs = [{"player_id": players[i % len(players)], "stat": stats[i % len(stats)],
+             "line": float(rng.integers(0, 30)) + 0.5} for i in range(args.lines)]
+
+    for label in ("cold", "warm"):
+        started = time.perf_counter()
+        price_slate(cursor, args.season, legs, args.model)
+        print(f"  {label}: {args.lines} lines in {(time.perf_counter() - started) * 1000:.1f} ms")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
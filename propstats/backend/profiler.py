@@ -0,0 +1,168 @@
+"""
+PropStats Profiler
+Low-overhead sampling profiler with collapsed-stack output
+
+Output is one line per distinct stack, root first, frames separated by ';' and followed
+by the sample count - the format flamegraph.pl, speedscope and inferno read directly:
+
+  curl "localhost:8000/admin/profile?secret=...&seconds=15" > api.folded
+  flamegraph.pl api.folded > api.svg
+
+Slow-request log: handlers wrapped with `watch_slow` have their thread sampled while they
+run, and any call slower than SLOW_REQUEST_MS keeps its stacks in a small in-memory log.
+"""
+
+import functools
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+INTERVAL = float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000
+MAX_SECONDS = 60
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "500"))  # 0 disables the slow-request log
+SLOW_LOG_SIZE = int(os.getenv("SLOW_REQUEST_LOG_SIZE", "50"))
+
+# Leaf frames of threads parked waiting for work; dropped unless idle stacks are requested
+IDLE_LEAVES = {
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("selectors.py", "select"),
+    ("thread.py", "_worker"),
+}
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def collapse(frame) -> str:
+    """Root-first ';'-joined stack for one frame"""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    return ";".join(labels)
+
+
+def is_idle(frame) -> bool:
+    return (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in IDLE_LEAVES
+
+
+def render_collapsed(counts: Counter) -> str:
+    return "".join(f"{stack} {n}\n" for stack, n in counts.most_common())
+
+
+_profile_lock = threading.Lock()
+
+
+def profile(seconds: float, interval: float = INTERVAL, idle: bool = False) -> Tuple[Counter, int]:
+    """Sample every thread's stack for `seconds`.
+
+    Returns collapsed stack counts, each prefixed with the thread name, and the number
+    of sampling rounds. Only one profile runs at a time; a second caller gets RuntimeError.
+    """
+    if not _profile_lock.acquire(blocking=False):
+        raise RuntimeError("A profile is already running")
+    try:
+        me = threading.get_ident()
+        names: Dict[int, str] = {}
+        counts: Counter = Counter()
+        rounds = 0
+        deadline = time.monotonic() + min(seconds, MAX_SECONDS)
+        while time.monotonic() < deadline:
+            for ident, frame in sys._current_frames().items():
+                if ident == me or (not idle and is_idle(frame)):
+                    continue
+                if ident not in names:
+                    names.update((t.ident, t.name) for t in threading.enumerate())
+                counts[f"{names.get(ident, ident)};{collapse(frame)}"] += 1
+            rounds += 1
+            time.sleep(interval)
+        return counts, rounds
+    finally:
+        _profile_lock.release()
+
+
+class SlowRequestLog:
+    """Samples the threads of watched calls and keeps stacks of the slow ones"""
+
+    def __init__(self, threshold_ms: float = SLOW_REQUEST_MS, interval: float = INTERVAL, size: int = SLOW_LOG_SIZE):
+        self.threshold_ms = threshold_ms
+        self.interval = interval
+        self.entries = deque(maxlen=size)
+        self._active: Dict[int, Counter] = {}
+        self._lock = threading.Lock()
+        self._sampler: Optional[threading.Thread] = None
+
+    def _run(self):
+        # Sampler only lives while at least one watched call is in flight
+        while True:
+            with self._lock:
+                if not self._active:
+                    self._sampler = None
+                    return
+                watched = list(self._active.items())
+            frames = sys._current_frames()
+            for ident, counts in watched:
+                frame = frames.get(ident)
+                if frame is not None:
+                    counts[collapse(frame)] += 1
+            time.sleep(self.interval)
+
+    def _begin(self, ident: int) -> Counter:
+        counts: Counter = Counter()
+        with self._lock:
+            self._active[ident] = counts
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._run, name="slow-request-sampler", daemon=True)
+                self._sampler.start()
+        return counts
+
+    def _end(self, ident: int):
+        with self._lock:
+            self._active.pop(ident, None)
+
+    def watch(self, fn):
+        """Decorator for sync handlers; keeps the signature FastAPI inspects"""
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if self.threshold_ms <= 0:
+                return fn(*args, **kwargs)
+            ident = threading.get_ident()
+            counts = self._begin(ident)
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                self._end(ident)
+                if elapsed_ms >= self.threshold_ms:
+                    self.record(fn.__name__, kwargs, elapsed_ms, counts)
+        return wrapper
+
+    def record(self, handler: str, kwargs: Dict, elapsed_ms: float, counts: Counter):
+        params = {k: v for k, v in kwargs.items() if isinstance(v, (str, int, float, bool)) and k != "secret"}
+        self.entries.append({
+            "handler": handler,
+            "params": params,
+            "duration_ms": round(elapsed_ms, 1),
+            "at": datetime.now().isoformat(timespec="seconds"),
+            "samples": sum(counts.values()),
+            "stacks": render_collapsed(counts),
+        })
+        print(f"🐢 Slow request {handler} {params}: {elapsed_ms:.0f} ms")
+
+    def recent(self, limit: int = None) -> List[Dict]:
+        entries = list(self.entries)
+        entries.reverse()
+        return entries[:limit] if limit else entries
+
+
+slow_requests = SlowRequestLog()
+watch_slow = slow_requests.watch
@@ -0,0 +1,223 @@
+"""
+PropStats Projections
+EWMA, per-36 and expected-minutes projections kept as running state per player-season
+
+player_projections holds, per player and season, the running totals and exponentially
+weighted averages of minutes and each base stat. Ingest paths call update() after writing
+game logs: only games dated after the stored last_day are folded in, each as an O(1)
+update, so analysis requests read one row by primary key instead of walking history.
+Combined stats (pra, pr, pa, ra) are sums of base-stat states, since both running totals
+and EWMAs are linear.
+
+The state is replayed from scratch when it is missing, when the season's game count no
+longer matches (a back-dated or deleted game), or when PROJECTION_HALF_LIFE_GAMES changes.
+project() never writes: a missing state (games stored before projections existed) is
+replayed in memory until ingest_worker.py's backfill() stores it.
+
+Usage:
+  python projections.py [--db nba_props.db]   # rebuild every player-season
+"""
+
+import argparse
+import os
+import sqlite3
+import time
+from typing import Any, Dict, List, Optional
+
+import migrations
+
+HALF_LIFE_GAMES = float(os.getenv("PROJECTION_HALF_LIFE_GAMES", "10"))
+
+# Projected base stat -> game_logs column, in player_projections column order
+BASE_STATS = {
+    "points": "points",
+    "rebounds": "rebounds",
+    "assists": "assists",
+    "threes": "fg3m",
+    "steals": "steals",
+    "blocks": "blocks",
+    "turnovers": "turnovers",
+}
+
+COMBOS = {
+    "pra": ("points", "rebounds", "assists"),
+    "pr": ("points", "rebounds"),
+    "pa": ("points", "assists"),
+    "ra": ("rebounds", "assists"),
+}
+
+STATE_COLUMNS = ["games", "last_day", "half_life", "minutes_total", "minutes_ewma"] + [
+    f"{stat}_{kind}" for stat in BASE_STATS for kind in ("total", "ewma")
+]
+
+
+def alpha(half_life: float) -> float:
+    """EWMA smoothing factor whose weights halve every `half_life` games"""
+    return 1 - 0.5 ** (1 / half_life)
+
+
+def apply_games(state: Dict[str, Any], games: List[tuple]):
+    """Fold (day, minutes, *base stats) games, oldest first, into the state in place.
+
+    Works a column at a time so a full replay stays a tight loop per stat; each game is
+    still folded in order, exactly as if it had been ingested on its own.
+    """
+    if not games:
+        return
+    a = alpha(state["half_life"])
+    days, *columns = zip(*games)
+    first = state["games"] == 0
+    state["games"] += len(games)
+    state["last_day"] = days[-1]
+    for key, values in zip(["minutes", *BASE_STATS], columns):
+        total, ewma = state[f"{key}_total"], state[f"{key}_ewma"]
+        for i, value in enumerate(values):
+            total += value
+            ewma = value if first and i == 0 else ewma + a * (value - ewma)
+        state[f"{key}_total"], state[f"{key}_ewma"] = total, ewma
+
+
+def empty_state() -> Dict[str, Any]:
+    state = dict.fromkeys(STATE_COLUMNS, 0.0)
+    state.update(games=0, last_day=None, half_life=HALF_LIFE_GAMES)
+    return state
+
+
+def _load_state(cursor, player_id: str, season: str) -> Optional[Dict[str, Any]]:
+    cursor.execute(f"""
+        SELECT {', '.join(STATE_COLUMNS)} FROM player_projections
+        WHERE player_id = ? AND season = ?
+    """, (player_id, season))
+    row = cursor.fetchone()
+    return dict(zip(STATE_COLUMNS, row)) if row else None
+
+
+def _games_after(cursor, player_id: str, season: str, day: Optional[str]) -> List[tuple]:
+    """(day, minutes, *base stats) of the season's games after `day`, oldest first"""
+    # A replay from scratch takes every game
+    after = "AND game_day > ?" if day else ""
+    cursor.execute(f"""
+        SELECT game_day, COALESCE(minutes_played, 0),
+               {', '.join(f'COALESCE({column}, 0)' for column in BASE_STATS.values())}
+        FROM game_logs
+        WHERE player_id = ? AND season = ? {after}
+    """, (player_id, season, *([day] if day else [])))
+    # Only the newly ingested games come back, so sorting them here is cheaper than an ORDER BY
+    return sorted(cursor.fetchall(), key=lambda row: row[0])
+
+
+def update(cursor, player_id: str, season: str) -> Dict[str, Any]:
+    """Fold newly ingested games into the player-season state (call inside the ingest transaction)"""
+    state = _load_state(cursor, player_id, season)
+    cursor.execute("SELECT COUNT(*) FROM game_logs WHERE player_id = ? AND season = ?", (player_id, season))
+    stored = cursor.fetchone()[0]
+
+    new_games = None
+    if state is not None and state["half_life"] == HALF_LIFE_GAMES:
+        new_games = _games_after(cursor, player_id, season, state["last_day"])
+        if state["games"] + len(new_games) != stored:
+            new_games = None
+    if new_games is None:
+        state = empty_state()
+        new_games = _games_after(cursor, player_id, season, None)
+    apply_games(state, new_games)
+
+    cursor.execute(f"""
+        INSERT OR REPLACE INTO player_projections (player_id, season, {', '.join(STATE_COLUMNS)})
+        VALUES (?, ?, {', '.join('?' * len(STATE_COLUMNS))})
+    """, (player_id, season, *(state[c] for c in STATE_COLUMNS)))
+    return state
+
+
+def update_rows(cursor, rows: List[tuple]):
+    """update() for every (player_id, season) in game_logs rows shaped (player_id, game_id, game_date, season, ...)"""
+    for player_id, season in dict.fromkeys((row[0], row[3]) for row in rows):
+        update(cursor, player_id, season)
+
+
+def _stat_value(state: Dict[str, Any], stat: str, kind: str) -> float:
+    return sum(state[f"{base}_{kind}"] for base in COMBOS.get(stat, (stat,)))
+
+
+def project(cursor, player_id: str, season: str, stat: str,
+            expected_minutes: Optional[float] = None) -> Optional[Dict[str, Any]]:
+    """`projection` block of the analysis response, from the stored state"""
+    if stat not in BASE_STATS and stat not in COMBOS:
+        return None
+    state = _load_state(cursor, player_id, season)
+    if state is None:
+        # Games stored before projections existed: replay them here, backfill() stores the state
+        state = empty_state()
+        apply_games(state, _games_after(cursor, player_id, season, None))
+    if not state["games"]:
+        return None
+
+    total = _stat_value(state, stat, "total")
+    ewma = _stat_value(state, stat, "ewma")
+    minutes = expected_minutes if expected_minutes is not None else state["minutes_ewma"]
+    recent_rate = ewma / state["minutes_ewma"] if state["minutes_ewma"] else 0.0
+    return {
+        "games": state["games"],
+        "half_life": state["half_life"],
+        "average": round(total / state["games"], 1),
+        "ewma": round(ewma, 1),
+        "per_36": round(36 * total / state["minutes_total"], 1) if state["minutes_total"] else 0.0,
+        "per_36_recent": round(36 * recent_rate, 1),
+        "expected_minutes": round(minutes, 1),
+        "projected": round(recent_rate * minutes, 1),
+    }
+
+
+def backfill(conn: sqlite3.Connection, since_id: int = 0) -> int:
+    """Store the missing state of player-seasons with game logs above `since_id`; returns how many"""
+    cursor = conn.cursor()
+    with conn:
+        pairs = conn.execute("""
+            SELECT DISTINCT g.player_id, g.season FROM game_logs g
+            WHERE g.id > ? AND NOT EXISTS (
+                SELECT 1 FROM player_projections p WHERE p.player_id = g.player_id AND p.season = g.season
+            )
+        """, (since_id,)).fetchall()
+        for player_id, season in pairs:
+            update(cursor, player_id, season)
+    return len(pairs)
+
+
+def reconcile(conn: sqlite3.Connection) -> int:
+    """Drop states that no longer match their games (count or half-life), then backfill(); returns states written"""
+    with conn:
+        conn.execute("""
+            DELETE FROM player_projections
+            WHERE half_life != ? OR games != (
+                SELECT COUNT(*) FROM game_logs g
+                WHERE g.player_id = player_projections.player_id AND g.season = player_projections.season
+            )
+        """, (HALF_LIFE_GAMES,))
+    return backfill(conn)
+
+
+def rebuild_all(db_path: str) -> int:
+    """Replay every player-season in game_logs; returns the number of states written"""
+    started = time.perf_counter()
+    migrations.migrate(db_path)
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    with conn:
+        cursor.execute("DELETE FROM player_projections")
+        pairs = conn.execute("SELECT DISTINCT player_id, season FROM game_logs").fetchall()
+        for player_id, season in pairs:
+            update(cursor, player_id, season)
+    conn.close()
+    print(f"✅ Projections rebuilt for {len(pairs)} player-seasons ({time.perf_counter() - started:.2f}s)")
+    return len(pairs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild EWMA / per-36 projection state")
+    parser.add_argument("--db", default=os.getenv("DATABASE_PATH", "nba_props.db"), help="SQLite database path")
+    args = parser.parse_args()
+    rebuild_all(args.db)
+
+
+if __name__ == "__main__":
+    main()
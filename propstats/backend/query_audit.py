@@ -0,0 +1,317 @@
+"""
+PropStats Query Audit
+Runs EXPLAIN QUERY PLAN on every hot-path statement and fails on full scans or temp B-tree sorts,
+and on statements that order, compare or take MIN/MAX over a text date column
+
+Keep HOT_QUERIES in step with the SQL in the apps; each entry names the function it mirrors. The
+text date check also sweeps every backend module's source, so unmirrored SQL is covered too.
+
+Usage:
+  python query_audit.py                                  # fresh schema from each app's init_db
+  python query_audit.py --apps main_v2 --db nba_props.db # audit an existing database
+Exits with status 1 if any statement scans a table or sorts through a temp B-tree, unless ALLOWED
+names that plan line for the statement along with the reason it is acceptable, or if any SQL orders
+by game_date instead of game_day.
+"""
+
+import argparse
+import importlib
+import glob
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+from typing import Dict, List, Tuple
+
+import splits
+import storage
+
+PLAYER_ID = "2544"
+
+
+def _splits_sql() -> Tuple[str, tuple]:
+    """The split engine's statement, captured from a throwaway cursor"""
+    class Capture:
+        def execute(self, sql, params):
+            self.statement = (sql, params)
+
+        def fetchall(self):
+            return []
+
+    capture = Capture()
+    splits.compute_splits(capture, PLAYER_ID, "2024-25", "points", 20.5)
+    return capture.statement
+
+
+HOT_QUERIES: Dict[str, List[Tuple[str, str, tuple]]] = {
+    "main": [
+        ("freshness.player_state (team)", """
+            SELECT COUNT(*), MAX(game_id), team_abbreviation FROM game_logs
+            WHERE player_id = ? AND season = ?
+        """, (PLAYER_ID, "2025-26")),
+        ("freshness.player_state (last sync)", """
+            SELECT MAX(fetched_at) FROM game_logs
+            WHERE player_id = ? AND season = ?
+        """, (PLAYER_ID, "2025-26")),
+        ("freshness.load_miss", """
+            SELECT kind, misses, recorded_at, retry_at FROM fetch_misses
+            WHERE player_id = ? AND season = ?
+        """, (PLAYER_ID, "2025-26")),
+        ("get_analysis", """
+            SELECT game_date, opponent_abbreviation, points as value, is_home, game_result, minutes_played,
+                   points, rebounds, assists, fg3m, steals, blocks
+            FROM game_logs
+            WHERE player_id = ? AND season = ?
+            ORDER BY game_day DESC
+            LIMIT 30
+        """, (PLAYER_ID, "2025-26")),
+        ("defense.opponent_history", """
+            SELECT game_date, season, points AS value, is_home, game_result, minutes_played
+            FROM game_logs
+            WHERE player_id = ? AND opponent_abbreviation = ?
+            ORDER BY game_day DESC
+            LIMIT ?
+        """, (PLAYER_ID, "BOS", 20)),
+        ("defense.lookup", """
+            SELECT position, games, opponents, points, points_rank FROM opponent_defense
+            WHERE season = ? AND opponent = ? AND position = ?
+        """, ("2025-26", "BOS", "G")),
+        ("exports.stream_games (player)", """
+            SELECT player_id, game_date, season, points FROM game_logs
+            WHERE player_id = ? AND season = ?
+            ORDER BY player_id, game_id
+        """, (PLAYER_ID, "2025-26")),
+        ("fetch_player_games", """
+            DELETE FROM game_logs WHERE player_id = ? AND season = ?
+        """, (PLAYER_ID, "2025-26")),
+    ],
+    "main_v2": [
+        ("hydrate_player", """
+            SELECT player_id, full_name, team_abbreviation, team_name, position,
+                   height, weight, jersey_number
+            FROM players WHERE player_id = ?
+        """, (PLAYER_ID,)),
+        ("get_player_analysis (freshness)", """
+            SELECT COUNT(*), MAX(game_day) FROM game_logs
+            WHERE player_id = ? AND season = ?
+        """, (PLAYER_ID, "2024-25")),
+        ("freshness.player_state (team)", """
+            SELECT COUNT(*), MAX(game_id), team_abbreviation FROM game_logs
+            WHERE player_id = ? AND season = ?
+        """, (PLAYER_ID, "2024-25")),
+        ("freshness.player_state (last sync)", """
+            SELECT MAX(fetched_at) FROM game_logs
+            WHERE player_id = ? AND season = ?
+        """, (PLAYER_ID, "2024-25")),
+        ("freshness.load_miss", """
+            SELECT kind, misses, recorded_at, retry_at FROM fetch_misses
+            WHERE player_id = ? AND season = ?
+        """, (PLAYER_ID, "2024-25")),
+        ("get_player_analysis (player)", """
+            SELECT full_name, team_abbreviation, position, jersey_number
+            FROM players WHERE player_id = ?
+        """, (PLAYER_ID,)),
+        ("get_player_analysis (snapshot check)", """
+            SELECT COUNT(*), MAX(id) FROM game_logs WHERE player_id = ?
+        """, (PLAYER_ID,)),
+        ("get_player_analysis (games)", """
+            SELECT game_date, opponent_abbreviation, points as stat_value, is_home, game_result,
+                   minutes_played, points, rebounds, assists, fg3m, steals, blocks, turnovers, season
+            FROM game_logs
+            WHERE player_id = ?
+            ORDER BY game_day DESC
+            LIMIT 50
+        """, (PLAYER_ID,)),
+        ("get_usage_count", """
+            SELECT COUNT(DISTINCT player_id) FROM usage_tracking
+            WHERE ip_address = ?
+            AND timestamp > datetime('now', '-' || ? || ' hours')
+            AND action = 'analysis'
+        """, ("127.0.0.1", 24)),
+        ("splits.compute_splits", *_splits_sql()),
+        ("projections.project", """
+            SELECT games, last_day, half_life, minutes_total, minutes_ewma, points_total, points_ewma
+            FROM player_projections
+            WHERE player_id = ? AND season = ?
+        """, (PLAYER_ID, "2024-25")),
+        ("projections._games_after", """
+            SELECT game_day, COALESCE(minutes_played, 0), COALESCE(points, 0)
+            FROM game_logs
+            WHERE player_id = ? AND season = ? AND game_day > ?
+        """, (PLAYER_ID, "2024-25", "2025-01-05")),
+        ("projections.update (count)", """
+            SELECT COUNT(*) FROM game_logs WHERE player_id = ? AND season = ?
+        """, (PLAYER_ID, "2024-25")),
+        ("probability.write_sequence", """
+            SELECT (SELECT value FROM sync_state WHERE key = 'generation:game_logs'),
+                   (SELECT seq FROM sqlite_sequence WHERE name = 'game_logs')
+        """, ()),
+        ("probability.data_versions", """
+            SELECT player_id, COUNT(*), MAX(id) FROM game_logs
+            WHERE player_id IN (?, ?)
+            GROUP BY player_id
+        """, (PLAYER_ID, "201939")),
+        ("probability.load_games", """
+            SELECT game_day, COALESCE(points, 0), COALESCE(minutes_played, 0)
+            FROM game_logs
+            WHERE player_id = ? AND season IN (?, ?)
+            ORDER BY game_day DESC
+            LIMIT ?
+        """, (PLAYER_ID, "2024-25", "2023-24", 82)),
+        ("lineups.refresh", """
+            SELECT player_id FROM game_logs WHERE id > ?
+        """, (0,)),
+        ("lineups.teammate_split", """
+            SELECT game_id, COALESCE(points, 0) FROM game_logs
+            WHERE player_id = ? AND season = ?
+        """, (PLAYER_ID, "2024-25")),
+        ("ingest.enqueue", """
+            SELECT id FROM ingest_jobs
+            WHERE player_id = ? AND seasons = ? AND status IN ('queued', 'running')
+        """, (PLAYER_ID, "2024-25,2023-24")),
+        ("ingest.wait_for", """
+            SELECT status FROM ingest_jobs WHERE id = ?
+        """, (1,)),
+        ("ingest.claim", """
+            SELECT id FROM ingest_jobs WHERE status = 'queued'
+            ORDER BY priority DESC, id
+            LIMIT 1
+        """, ()),
+        ("storage.game_logs_since", f"""
+            SELECT id, {', '.join(storage.GAME_LOG_COLUMNS)} FROM game_logs
+            WHERE id > ? ORDER BY id
+        """, (0,)),
+        ("search_players", """
+            SELECT player_id, full_name, team_abbreviation, position, jersey_number
+            FROM players
+            WHERE full_name LIKE ? AND is_active = 1
+            ORDER BY full_name
+            LIMIT 15
+        """, ("%james%",)),
+    ],
+}
+
+
+# Plan lines accepted for one named statement, and why; anything else in its plan still fails
+ALLOWED: Dict[str, Tuple[Tuple[str, ...], str]] = {
+    "splits.compute_splits": (
+        ("SCAN season_games", "SCAN per_game", "SCAN (subquery-",
+         "USE TEMP B-TREE FOR ORDER BY", "USE TEMP B-TREE FOR GROUP BY"),
+        "sorts and groups only the one player-season the indexed SEARCH read (at most ~100 rows); "
+        "the rest-day window orders that handful by game_day",
+    ),
+    "probability.write_sequence": (
+        ("SCAN sqlite_sequence",),
+        "sqlite_sequence holds one row per AUTOINCREMENT table",
+    ),
+}
+
+
+# Columns holding 'APR 14, 2024' strings, which sort by month name; game_day is the sortable form
+TEXT_DATE_COLUMNS = ("game_date",)
+ORDER_BY_RE = re.compile(r"ORDER\s+BY\s+(.+?)(?:\bLIMIT\b|\)|$)", re.IGNORECASE | re.DOTALL)
+MIN_MAX_RE = re.compile(r"\b(?:MIN|MAX)\s*\(([^)]*)\)", re.IGNORECASE)
+COMPARE_RE = re.compile(r"\b(\w+)\s*(?:<|>|BETWEEN\b)", re.IGNORECASE)
+
+
+def ordering_problems(sql: str) -> List[str]:
+    """ORDER BY, MIN/MAX and range comparisons over a text date column in one statement"""
+    problems = []
+    for clause, pattern in (("ORDER BY", ORDER_BY_RE), ("MIN/MAX", MIN_MAX_RE)):
+        for terms in pattern.findall(sql):
+            for column in TEXT_DATE_COLUMNS:
+                if re.search(rf"\b{column}\b", terms):
+                    problems.append(f"{clause} on text {column}")
+    for column in COMPARE_RE.findall(sql):
+        if column in TEXT_DATE_COLUMNS:
+            problems.append(f"range comparison on text {column}")
+    return problems
+
+
+def source_problems(directory: str) -> List[Tuple[str, str]]:
+    """(module:line, problem) for text date ordering anywhere in the backend's Python sources"""
+    found = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.py"))):
+        if os.path.basename(path) == os.path.basename(__file__):
+            continue
+        with open(path, encoding="utf-8") as f:
+            for number, line in enumerate(f, 1):
+                for problem in ordering_problems(line):
+                    found.append((f"{os.path.basename(path)}:{number}", problem))
+    return found
+
+
+def plan_problems(detail: str) -> List[str]:
+    """Full table/index scans and temp B-tree sorts in one EXPLAIN QUERY PLAN line"""
+    problems = []
+    if detail.startswith("SCAN ") and "CONSTANT ROW" not in detail:
+        problems.append("full scan")
+    # count(DISTINCT ...) dedupes through a temp B-tree but does not sort the result
+    if "USE TEMP B-TREE" in detail and not detail.endswith("(DISTINCT)"):
+        problems.append("temp B-tree sort")
+    return problems
+
+
+def audit(conn: sqlite3.Connection, queries: List[Tuple[str, str, tuple]]) -> int:
+    failures = 0
+    for name, sql, params in queries:
+        plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+        accepted, reason = ALLOWED.get(name, ((), ""))
+        problems = [p for detail in plan if not detail.startswith(accepted) for p in plan_problems(detail)]
+        problems += ordering_problems(sql)
+        allowed = any(plan_problems(detail) for detail in plan if detail.startswith(accepted))
+        failures += bool(problems)
+        print(f"  {'❌' if problems else '⚠️ ' if allowed else '✅'} {name}")
+        if allowed:
+            print(f"       allowed: {reason}")
+        for problem in ordering_problems(sql):
+            print(f"       {problem}")
+        for detail in plan:
+            print(f"       {detail}")
+    return failures
+
+
+def app_database(app: str, workdir: str) -> str:
+    """Fresh database with the app's schema, created by importing it"""
+    db_path = os.path.join(workdir, f"{app}.db")
+    os.environ["DATABASE_PATH"] = db_path
+    module = importlib.import_module(app)
+    if module.DB_PATH != db_path:
+        module.DB_PATH = db_path
+        module.init_db()
+    return db_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EXPLAIN QUERY PLAN audit of the hot SQL")
+    parser.add_argument("--apps", default="main,main_v2", help="Comma-separated app modules")
+    parser.add_argument("--db", help="Audit this database instead of a fresh schema (one app only)")
+    args = parser.parse_args()
+
+    apps = [a.strip() for a in args.apps.split(",")]
+    if args.db and len(apps) != 1:
+        parser.error("--db needs exactly one app in --apps")
+
+    failures = 0
+    with tempfile.TemporaryDirectory(prefix="propstats-audit-") as workdir:
+        for app in apps:
+            db_path = args.db or app_database(app, workdir)
+            print(f"🔎 {app} ({db_path})")
+            conn = sqlite3.connect(db_path)
+            failures += audit(conn, HOT_QUERIES[app])
+            conn.close()
+
+    print("🔎 text date ordering in the backend sources")
+    for where, problem in source_problems(os.path.dirname(os.path.abspath(__file__))):
+        print(f"  ❌ {where}: {problem}")
+        failures += 1
+
+    if failures:
+        print(f"❌ {failures} statement(s) scan a table, sort through a temp B-tree or order by a text date")
+        sys.exit(1)
+    print("✅ Every hot statement is served by an index")
+
+
+if __name__ == "__main__":
+    main()
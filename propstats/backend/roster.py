@@ -0,0 +1,152 @@
+"""
+PropStats Roster Snapshot
+In-memory index of active NBA players, built once and refreshed on sync
+"""
+
+import sys
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from nba_api.stats.static import players
+
+FREE_AGENT = "FA"
+
+
+class PlayerRecord:
+    """Compact roster entry for one active player"""
+
+    __slots__ = ("id", "full_name", "first_name", "last_name", "team", "name_key")
+
+    def __init__(self, player_id: str, full_name: str, first_name: str = "",
+                 last_name: str = "", team: str = FREE_AGENT):
+        self.id = player_id
+        self.full_name = full_name
+        self.first_name = first_name
+        self.last_name = last_name
+        self.team = team or FREE_AGENT
+        self.name_key = full_name.lower()
+
+    def to_dict(self) -> Dict[str, str]:
+        return {
+            "id": self.id,
+            "full_name": self.full_name,
+            "first_name": self.first_name,
+            "last_name": self.last_name,
+            "team": self.team,
+        }
+
+
+class RosterSnapshot:
+    """Player records indexed by id and by team"""
+
+    __slots__ = ("records", "by_id", "by_team", "built_at")
+
+    def __init__(self, records: Iterable[PlayerRecord]):
+        self.records = tuple(records)
+        self.by_id = {r.id: r for r in self.records}
+        self.by_team: Dict[str, List[PlayerRecord]] = {}
+        for r in self.records:
+            self.by_team.setdefault(r.team, []).append(r)
+        self.built_at = datetime.now()
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def get(self, player_id) -> Optional[PlayerRecord]:
+        return self.by_id.get(str(player_id))
+
+    def team(self, team_abbr: str) -> List[PlayerRecord]:
+        return self.by_team.get(team_abbr, [])
+
+    def search(self, q: str, limit: int = 15) -> List[PlayerRecord]:
+        """Substring match on full name, in roster order"""
+        q = q.lower()
+        matches = []
+        for r in self.records:
+            if q in r.name_key:
+                matches.append(r)
+                if len(matches) >= limit:
+                    break
+        return matches
+
+    def set_team(self, player_id, team_abbr: str):
+        """Move a player to a new team (after a details fetch)"""
+        record = self.get(player_id)
+        team_abbr = team_abbr or FREE_AGENT
+        if record is None or record.team == team_abbr:
+            return
+        with _lock:
+            old = self.by_team.get(record.team)
+            if old and record in old:
+                old.remove(record)
+                if not old:
+                    del self.by_team[record.team]
+            record.team = team_abbr
+            self.by_team.setdefault(team_abbr, []).append(record)
+
+    def memory_footprint(self) -> int:
+        """Approximate bytes held by records, strings and indexes"""
+        seen = set()
+
+        def size(obj) -> int:
+            if id(obj) in seen:
+                return 0
+            seen.add(id(obj))
+            return sys.getsizeof(obj)
+
+        total = size(self.records) + size(self.by_id) + size(self.by_team)
+        for r in self.records:
+            total += size(r)
+            for attr in PlayerRecord.__slots__:
+                total += size(getattr(r, attr))
+        for team, members in self.by_team.items():
+            total += size(team) + size(members)
+        return total
+
+    def stats(self) -> Dict:
+        return {
+            "players": len(self.records),
+            "teams": len(self.by_team),
+            "bytes": self.memory_footprint(),
+            "built_at": self.built_at.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+
+
+_snapshot: Optional[RosterSnapshot] = None
+_lock = threading.Lock()
+
+
+def build_roster(teams: Optional[Dict[str, str]] = None) -> RosterSnapshot:
+    """Build a snapshot from nba_api's static active player list"""
+    teams = teams or {}
+    records = []
+    for p in players.get_active_players():
+        player_id = str(p["id"])
+        records.append(PlayerRecord(
+            player_id,
+            p["full_name"],
+            p.get("first_name", ""),
+            p.get("last_name", ""),
+            teams.get(player_id, FREE_AGENT),
+        ))
+    return RosterSnapshot(records)
+
+
+def refresh_roster(teams: Optional[Dict[str, str]] = None) -> RosterSnapshot:
+    """Rebuild the shared snapshot and swap it in"""
+    global _snapshot
+    snapshot = build_roster(teams)
+    with _lock:
+        _snapshot = snapshot
+    stats = snapshot.stats()
+    print(f"✅ Roster snapshot: {stats['players']} players, {stats['teams']} teams "
+          f"({stats['bytes'] / 1024:.1f} KB)")
+    return snapshot
+
+
+def get_roster() -> RosterSnapshot:
+    """Shared snapshot, built on first use"""
+    if _snapshot is None:
+        refresh_roster()
+    return _snapshot
@@ -0,0 +1,85 @@
+"""
+PropStats Split Engine
+Home/away, opponent, rest, result and minutes splits for one stat in a single SQL statement
+
+The player's season is read once through the (player_id, season, fetched_at) index into a
+CTE; every requested dimension is a GROUP BY over that CTE joined with UNION ALL, so the
+cost is one query no matter how many dimensions are asked for.
+"""
+
+from typing import Any, Dict, List, Optional
+
+# 'APR 14, 2024' (stats.nba.com) or ISO 'YYYY-MM-DD' -> 'YYYY-MM-DD'
+GAME_DATE_ISO_SQL = """
+    CASE WHEN game_date GLOB '[0-9][0-9][0-9][0-9]-*' THEN SUBSTR(game_date, 1, 10)
+    ELSE printf('%s-%02d-%02d',
+        SUBSTR(game_date, -4),
+        (INSTR('JANFEBMARAPRMAYJUNJULAUGSEPOCTNOVDEC', UPPER(SUBSTR(game_date, 1, 3))) + 2) / 3,
+        CAST(TRIM(SUBSTR(game_date, 5, INSTR(game_date, ',') - 5)) AS INTEGER))
+    END
+"""
+
+# Dimension -> bucket expression over the per-game CTE
+DIMENSIONS = {
+    "home_away": "CASE WHEN is_home = 1 THEN 'home' ELSE 'away' END",
+    "opponent": "opponent_abbreviation",
+    "rest": """
+        CASE WHEN gap IS NULL THEN 'first_game'
+             WHEN gap <= 1 THEN 'back_to_back'
+             WHEN gap = 2 THEN 'one_day'
+             ELSE 'two_plus_days' END
+    """,
+    "result": "CASE game_result WHEN 'W' THEN 'win' WHEN 'L' THEN 'loss' END",
+    "minutes": """
+        CASE WHEN minutes_played < 20 THEN 'under_20'
+             WHEN minutes_played < 30 THEN '20_to_29'
+             WHEN minutes_played < 36 THEN '30_to_35'
+             ELSE '36_plus' END
+    """,
+}
+
+
+def parse_dimensions(requested: Optional[str]) -> List[str]:
+    """Comma-separated dimension names (default all); raises ValueError on unknown ones"""
+    if not requested:
+        return list(DIMENSIONS)
+    names = [name.strip() for name in requested.split(",") if name.strip()]
+    unknown = [name for name in names if name not in DIMENSIONS]
+    if unknown:
+        raise ValueError(f"Unknown split(s): {', '.join(unknown)}. Choose from {', '.join(DIMENSIONS)}")
+    return names
+
+
+def compute_splits(cursor, player_id: str, season: str, stat_expr: str, line: float,
+                   dimensions: List[str] = None) -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """{dimension: {bucket: {games, average, hits, pct}}} for one player-season"""
+    dimensions = dimensions or list(DIMENSIONS)
+    groups = "\nUNION ALL\n".join(
+        f"SELECT '{name}', {DIMENSIONS[name]} AS bucket, COUNT(*), AVG(value), SUM(value > ?) "
+        f"FROM per_game GROUP BY bucket"
+        for name in dimensions
+    )
+    cursor.execute(f"""
+        WITH season_games AS (
+            SELECT julianday(game_day) AS day, COALESCE({stat_expr}, 0) AS value,
+                   is_home, opponent_abbreviation, game_result, minutes_played
+            FROM game_logs
+            WHERE player_id = ? AND season = ?
+        ),
+        per_game AS (
+            SELECT *, day - LAG(day) OVER (ORDER BY day) AS gap FROM season_games
+        )
+        {groups}
+    """, (player_id, season, *([line] * len(dimensions))))
+
+    splits: Dict[str, Dict[str, Dict[str, Any]]] = {name: {} for name in dimensions}
+    for name, bucket, games, average, hits in cursor.fetchall():
+        if bucket is None:
+            continue
+        splits[name][bucket] = {
+            "games": games,
+            "average": round(average, 1),
+            "hits": hits,
+            "pct": round(hits / games * 100, 1),
+        }
+    return splits
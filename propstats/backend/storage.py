@@ -0,0 +1,526 @@
+"""
+PropStats Storage
+Players, game logs, usage and sync state behind one interface, on SQLite or PostgreSQL
+
+The analytics (splits, defense, probabilities, projections, lineups, snapshots) query each
+replica's local SQLite file. STORAGE_URL picks the store that file is kept in step with:
+  unset                  the local file is the only store (a single replica, as before)
+  postgresql://...       one PostgreSQL database shared by every replica
+  sqlite:///shared.db    another SQLite file, mostly for trying the replica flow locally
+
+With a shared store, ingests write through to it, usage is counted there (so free-tier
+limits hold across replicas), and each replica pulls the game logs it has not seen yet into
+its own file (sync_replica), tracking the last shared id in sync_state. The shared store
+gives a row a new id whenever it is upserted, so a re-fetched game is pulled again.
+Deletes are not pulled: when a re-fetch drops games from a player-season they leave the
+fetching replica and the shared store, but other replicas keep their copies until they
+re-fetch that player-season themselves.
+
+PostgreSQL uses a psycopg connection pool, COPY into a staging table for bulk ingest, and
+named (server-side) cursors for pulls, so neither side loads a whole table into memory.
+It needs psycopg[binary,pool] (requirements.txt).
+
+Usage:
+  python storage.py init --url postgresql://localhost/propstats                    # create the schema
+  python storage.py push --db nba_props.db --url postgresql://localhost/propstats  # seed from SQLite
+  python storage.py sync --db replica.db --url postgresql://localhost/propstats    # pull once
+  python storage.py check --url postgresql://localhost/propstats                   # round-trip every method in a scratch schema
+"""
+
+import argparse
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import db
+import metrics
+import migrations
+import projections
+
+try:
+    import psycopg
+    from psycopg_pool import ConnectionPool
+except ImportError:
+    psycopg = None
+
+SYNC_SECONDS = float(os.getenv("STORAGE_SYNC_SECONDS", "60"))
+SYNC_BATCH_ROWS = int(os.getenv("STORAGE_SYNC_BATCH_ROWS", "5000"))
+POOL_MIN_SIZE = int(os.getenv("STORAGE_POOL_MIN", "1"))
+POOL_MAX_SIZE = int(os.getenv("STORAGE_POOL_MAX", "10"))
+
+# Canonical column order (migrations.TABLE_DDL), minus what the store fills in itself
+GAME_LOG_COLUMNS = [name for name, _ in migrations.canonical_columns("game_logs") if name not in ("id", "fetched_at")]
+PLAYER_COLUMNS = [name for name, _ in migrations.canonical_columns("players") if name != "updated_at"]
+
+WATERMARK_KEY = "shared_game_logs_id"
+
+SYNC_ROWS = metrics.register(metrics.Counter(
+    "propstats_storage_sync_rows_total", "Rows pulled from the shared store into this replica", ("table",)
+))
+SYNC_DURATION = metrics.register(metrics.Histogram(
+    "propstats_storage_sync_seconds", "Time per replica pull from the shared store"
+))
+
+
+class Storage(ABC):
+    """Data access shared by every backend; each method is its own short transaction"""
+
+    # True when this store is not the replica's own SQLite file
+    shared = False
+
+    @abstractmethod
+    def upsert_players(self, columns: Sequence[str], rows: Iterable[Sequence]) -> int:
+        """Insert or update players by player_id; `columns` must include player_id"""
+
+    @abstractmethod
+    def players(self) -> List[tuple]:
+        """Every player, as PLAYER_COLUMNS tuples"""
+
+    @abstractmethod
+    def store_game_logs(self, columns: Sequence[str], rows: Iterable[Sequence],
+                        replace: Optional[Tuple[str, str]] = None) -> int:
+        """Upsert game logs on (player_id, game_id); returns the number of rows written
+
+        `replace` is a (player_id, season) whose stored games are deleted first, in the
+        same transaction, so games the source no longer lists go away too.
+        """
+
+    @abstractmethod
+    def game_logs_since(self, after_id: int, batch_rows: int = SYNC_BATCH_ROWS) -> Iterator[List[tuple]]:
+        """Batches of (id, *GAME_LOG_COLUMNS) with id > after_id, in id order"""
+
+    @abstractmethod
+    def track_usage(self, ip: str, player_id: str, action: str):
+        """Record one `action` on a player from `ip`"""
+
+    @abstractmethod
+    def usage_count(self, ip: str, hours: int) -> int:
+        """Distinct players analysed from `ip` in the last `hours`"""
+
+    @abstractmethod
+    def get_state(self, key: str) -> Optional[str]:
+        """sync_state value for `key`, or None"""
+
+    @abstractmethod
+    def set_state(self, key: str, value: str):
+        """Insert or replace the sync_state value for `key`"""
+
+    def close(self):
+        pass
+
+
+def _upsert_sql(table: str, columns: Sequence[str], key: str, placeholder: str, now: str) -> str:
+    updates = ", ".join(f"{c} = excluded.{c}" for c in columns if c != key)
+    return f"""
+        INSERT INTO {table} ({', '.join(columns)}, updated_at)
+        VALUES ({', '.join([placeholder] * len(columns))}, {now})
+        ON CONFLICT ({key}) DO UPDATE SET {updates}, updated_at = excluded.updated_at
+    """
+
+
+class SQLiteStorage(Storage):
+    """A local SQLite file in the canonical schema (migrations.py)"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        migrations.migrate(db_path)
+
+    def upsert_players(self, columns, rows) -> int:
+        conn = db.connect(self.db_path)
+        try:
+            with conn:
+                return conn.executemany(
+                    _upsert_sql("players", columns, "player_id", "?", "datetime('now')"), rows
+                ).rowcount
+        finally:
+            conn.close()
+
+    def players(self) -> List[tuple]:
+        conn = db.connect(self.db_path)
+        try:
+            return conn.execute(f"SELECT {', '.join(PLAYER_COLUMNS)} FROM players").fetchall()
+        finally:
+            conn.close()
+
+    def store_game_logs(self, columns, rows, replace=None) -> int:
+        """INSERT OR REPLACE, then fold the touched player-seasons into their projections"""
+        rows = list(rows)
+        player, season = columns.index("player_id"), columns.index("season")
+        conn = db.connect(self.db_path)
+        try:
+            with conn:
+                cursor = conn.cursor()
+                if replace:
+                    cursor.execute("DELETE FROM game_logs WHERE player_id = ? AND season = ?", replace)
+                cursor.executemany(f"""
+                    INSERT OR REPLACE INTO game_logs ({', '.join(columns)}, fetched_at)
+                    VALUES ({', '.join('?' * len(columns))}, datetime('now'))
+                """, rows)
+                for player_id, row_season in dict.fromkeys((row[player], row[season]) for row in rows):
+                    projections.update(cursor, player_id, row_season)
+        finally:
+            conn.close()
+        return len(rows)
+
+    def game_logs_since(self, after_id, batch_rows=SYNC_BATCH_ROWS):
+        conn = db.connect(self.db_path)
+        try:
+            cursor = conn.execute(f"""
+                SELECT id, {', '.join(GAME_LOG_COLUMNS)} FROM game_logs
+                WHERE id > ? ORDER BY id
+            """, (after_id,))
+            while True:
+                batch = cursor.fetchmany(batch_rows)
+                if not batch:
+                    return
+                yield batch
+        finally:
+            conn.close()
+
+    def track_usage(self, ip, player_id, action):
+        conn = db.connect(self.db_path)
+        try:
+            with conn:
+                conn.execute("""
+                    INSERT INTO usage_tracking (ip_address, player_id, action)
+                    VALUES (?, ?, ?)
+                """, (ip, player_id, action))
+        finally:
+            conn.close()
+
+    def usage_count(self, ip, hours) -> int:
+        conn = db.connect(self.db_path)
+        try:
+            return conn.execute("""
+                SELECT COUNT(DISTINCT player_id) FROM usage_tracking
+                WHERE ip_address = ?
+                AND timestamp > datetime('now', '-' || ? || ' hours')
+                AND action = 'analysis'
+            """, (ip, hours)).fetchone()[0]
+        finally:
+            conn.close()
+
+    def get_state(self, key) -> Optional[str]:
+        conn = db.connect(self.db_path)
+        try:
+            row = conn.execute("SELECT value FROM sync_state WHERE key = ?", (key,)).fetchone()
+            return row[0] if row else None
+        finally:
+            conn.close()
+
+    def set_state(self, key, value):
+        conn = db.connect(self.db_path)
+        try:
+            with conn:
+                conn.execute(_upsert_sql("sync_state", ("key", "value"), "key", "?", "datetime('now')"), (key, value))
+        finally:
+            conn.close()
+
+
+# SQLite declared type -> PostgreSQL type (game_date holds "APR 14, 2024" strings, not dates)
+PG_TYPES = {"TEXT": "TEXT", "INTEGER": "BIGINT", "REAL": "DOUBLE PRECISION", "DATE": "TEXT", "TIMESTAMP": "TIMESTAMPTZ"}
+
+PG_TABLE_CONSTRAINTS = {"game_logs": ["UNIQUE (player_id, game_id)"]}
+
+PG_EXTRA_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS sync_state (
+        key TEXT PRIMARY KEY,
+        value TEXT,
+        updated_at TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_game_logs_player_season ON game_logs (player_id, season)",
+    "CREATE INDEX IF NOT EXISTS idx_usage_ip_action_time ON usage_tracking (ip_address, action, timestamp, player_id)",
+]
+
+# Serializes id assignment so ids become visible in order and a pull never skips one
+PG_PUBLISH_LOCK = 0x70726F70  # "prop"
+
+
+def postgres_table_ddl(table: str) -> str:
+    """CREATE TABLE for PostgreSQL, translated from the canonical SQLite layout"""
+    probe = sqlite3.connect(":memory:")
+    probe.execute(migrations.TABLE_DDL[table])
+    columns = []
+    for _, name, decl, notnull, default, pk in probe.execute(f"PRAGMA table_info({table})"):
+        if pk and decl == "INTEGER":
+            columns.append(f"{name} BIGSERIAL PRIMARY KEY")
+            continue
+        column = f"{name} {PG_TYPES[decl]}"
+        if pk:
+            column += " PRIMARY KEY"
+        elif notnull:
+            column += " NOT NULL"
+        if default is not None:
+            column += f" DEFAULT {default}"
+        columns.append(column)
+    probe.close()
+    body = ",\n        ".join(columns + PG_TABLE_CONSTRAINTS.get(table, []))
+    return f"CREATE TABLE IF NOT EXISTS {table} (\n        {body}\n    )"
+
+
+class PostgresStorage(Storage):
+    """One PostgreSQL database shared by every replica"""
+
+    shared = True
+
+    def __init__(self, url: str, schema: Optional[str] = None):
+        if psycopg is None:
+            raise RuntimeError('PostgreSQL storage needs psycopg: pip install "psycopg[binary,pool]"')
+        self.url = url
+        self.schema = schema
+        kwargs = {}
+        if schema:
+            with psycopg.connect(url, autocommit=True) as conn:
+                conn.execute(f"CREATE SCHEMA IF NOT EXISTS {schema}")
+            kwargs["options"] = f"-c search_path={schema}"
+        self.pool = ConnectionPool(url, kwargs=kwargs, min_size=POOL_MIN_SIZE, max_size=POOL_MAX_SIZE, open=True)
+        self.init_schema()
+
+    def init_schema(self):
+        with self.pool.connection() as conn:
+            for table in ("players", "game_logs", "usage_tracking"):
+                conn.execute(postgres_table_ddl(table))
+            for sql in PG_EXTRA_DDL:
+                conn.execute(sql)
+
+    def upsert_players(self, columns, rows) -> int:
+        rows = list(rows)
+        with self.pool.connection() as conn, conn.cursor() as cur:
+            cur.executemany(_upsert_sql("players", columns, "player_id", "%s", "now()"), rows)
+        return len(rows)
+
+    def players(self) -> List[tuple]:
+        with self.pool.connection() as conn:
+            return conn.execute(f"SELECT {', '.join(PLAYER_COLUMNS)} FROM players").fetchall()
+
+    def store_game_logs(self, columns, rows, replace=None) -> int:
+        """COPY into a session-local staging table, then one INSERT ... ON CONFLICT into game_logs"""
+        column_list = ", ".join(columns)
+        updates = ", ".join(f"{c} = EXCLUDED.{c}" for c in columns if c not in ("player_id", "game_id"))
+        with self.pool.connection() as conn, conn.cursor() as cur:
+            cur.execute(f"""
+                CREATE TEMP TABLE IF NOT EXISTS game_logs_stage ON COMMIT DELETE ROWS AS
+                SELECT {', '.join(GAME_LOG_COLUMNS)} FROM game_logs WITH NO DATA
+            """)
+            with cur.copy(f"COPY game_logs_stage ({column_list}) FROM STDIN") as copy:
+                for row in rows:
+                    copy.write_row(row)
+            cur.execute("SELECT pg_advisory_xact_lock(%s)", (PG_PUBLISH_LOCK,))
+            if replace:
+                cur.execute("DELETE FROM game_logs WHERE player_id = %s AND season = %s", replace)
+            # A changed row gets a fresh id, so replicas pulling by id see the update
+            cur.execute(f"""
+                INSERT INTO game_logs ({column_list}, fetched_at)
+                SELECT DISTINCT ON (player_id, game_id) {column_list}, now()
+                FROM game_logs_stage
+                ORDER BY player_id, game_id
+                ON CONFLICT (player_id, game_id) DO UPDATE SET
+                    id = nextval(pg_get_serial_sequence('game_logs', 'id')),
+                    {updates}, fetched_at = EXCLUDED.fetched_at
+            """)
+            return cur.rowcount
+
+    def game_logs_since(self, after_id, batch_rows=SYNC_BATCH_ROWS):
+        with self.pool.connection() as conn:
+            with conn.cursor(name=f"game_logs_since_{uuid.uuid4().hex[:8]}") as cur:
+                cur.itersize = batch_rows
+                cur.execute(f"""
+                    SELECT id, {', '.join(GAME_LOG_COLUMNS)} FROM game_logs
+                    WHERE id > %s ORDER BY id
+                """, (after_id,))
+                while True:
+                    batch = cur.fetchmany(batch_rows)
+                    if not batch:
+                        return
+                    yield batch
+
+    def track_usage(self, ip, player_id, action):
+        with self.pool.connection() as conn:
+            conn.execute("""
+                INSERT INTO usage_tracking (ip_address, player_id, action)
+                VALUES (%s, %s, %s)
+            """, (ip, player_id, action))
+
+    def usage_count(self, ip, hours) -> int:
+        with self.pool.connection() as conn:
+            return conn.execute("""
+                SELECT COUNT(DISTINCT player_id) FROM usage_tracking
+                WHERE ip_address = %s
+                AND timestamp > now() - make_interval(hours => %s)
+                AND action = 'analysis'
+            """, (ip, hours)).fetchone()[0]
+
+    def get_state(self, key) -> Optional[str]:
+        with self.pool.connection() as conn:
+            row = conn.execute("SELECT value FROM sync_state WHERE key = %s", (key,)).fetchone()
+            return row[0] if row else None
+
+    def set_state(self, key, value):
+        with self.pool.connection() as conn:
+            conn.execute(_upsert_sql("sync_state", ("key", "value"), "key", "%s", "now()"), (key, value))
+
+    def close(self):
+        self.pool.close()
+
+    def drop_schema(self):
+        """Close the pool and drop this store's schema (scratch stores only)"""
+        self.close()
+        with psycopg.connect(self.url, autocommit=True) as conn:
+            conn.execute(f"DROP SCHEMA IF EXISTS {self.schema} CASCADE")
+
+
+def open_storage(url: Optional[str], db_path: str) -> Storage:
+    """Store for STORAGE_URL; without one, the replica's own SQLite file"""
+    if not url:
+        return SQLiteStorage(db_path)
+    if url.startswith("sqlite:///"):
+        store = SQLiteStorage(url[len("sqlite:///"):])
+        store.shared = os.path.realpath(store.db_path) != os.path.realpath(db_path)
+        return store
+    if url.startswith(("postgres://", "postgresql://")):
+        return PostgresStorage(url)
+    raise ValueError(f"Unsupported STORAGE_URL: {url}")
+
+
+def from_env(db_path: str) -> Storage:
+    return open_storage(os.getenv("STORAGE_URL"), db_path)
+
+
+def sync_replica(shared: Storage, db_path: str, batch_rows: int = SYNC_BATCH_ROWS) -> Dict[str, int]:
+    """Pull players and unseen game logs from the shared store into a local SQLite file"""
+    started = time.perf_counter()
+    local = SQLiteStorage(db_path)
+    players = local.upsert_players(PLAYER_COLUMNS, shared.players())
+    watermark = int(local.get_state(WATERMARK_KEY) or 0)
+    pulled = 0
+    for batch in shared.game_logs_since(watermark, batch_rows):
+        local.store_game_logs(GAME_LOG_COLUMNS, [row[1:] for row in batch])
+        watermark = batch[-1][0]
+        # Recorded after each batch: a crash re-pulls at most one batch, and upserts are idempotent
+        local.set_state(WATERMARK_KEY, str(watermark))
+        pulled += len(batch)
+    SYNC_ROWS.inc("players", amount=players)
+    SYNC_ROWS.inc("game_logs", amount=pulled)
+    SYNC_DURATION.observe(time.perf_counter() - started)
+    return {"players": players, "game_logs": pulled, "watermark": watermark}
+
+
+def start_sync(shared: Storage, db_path: str, interval: float = SYNC_SECONDS) -> threading.Thread:
+    """Pull from the shared store every `interval` seconds on a daemon thread"""
+    def loop():
+        while True:
+            try:
+                result = sync_replica(shared, db_path)
+                if result["game_logs"]:
+                    print(f"🔄 Pulled {result['game_logs']} game logs from the shared store")
+            except Exception as e:
+                print(f"❌ Shared store sync failed: {e}")
+            time.sleep(interval)
+
+    thread = threading.Thread(target=loop, name="storage-sync", daemon=True)
+    thread.start()
+    return thread
+
+
+def push(source_db: str, target: Storage, batch_rows: int = SYNC_BATCH_ROWS) -> Dict[str, int]:
+    """Copy every player and game log from a SQLite file into another store"""
+    source = SQLiteStorage(source_db)
+    players = target.upsert_players(PLAYER_COLUMNS, source.players())
+    games = 0
+    for batch in source.game_logs_since(0, batch_rows):
+        games += target.store_game_logs(GAME_LOG_COLUMNS, [row[1:] for row in batch])
+    return {"players": players, "game_logs": games}
+
+
+def check(store: Storage) -> Dict[str, bool]:
+    """Round-trip every Storage method against an empty store"""
+    tag = f"check-{uuid.uuid4().hex[:8]}"
+    results = {}
+    store.upsert_players(("player_id", "full_name"), [(tag, "Check Player")])
+    store.upsert_players(("player_id", "full_name", "team_abbreviation"), [(tag, "Check Player", "BOS")])
+    team = PLAYER_COLUMNS.index("team_abbreviation")
+    results["players"] = [(row[0], row[team]) for row in store.players()] == [(tag, "BOS")]
+
+    row = dict.fromkeys(GAME_LOG_COLUMNS, 0)
+    row.update(player_id=tag, game_id="1", game_date="APR 14, 2024", season="2023-24", points=30)
+    store.store_game_logs(GAME_LOG_COLUMNS, [tuple(row.values())])
+    first = [r for batch in store.game_logs_since(0) for r in batch]
+    row["points"] = 31
+    store.store_game_logs(GAME_LOG_COLUMNS, [tuple(row.values())])
+    # The update must come back under a new id, or replicas pulling by id would miss it
+    second = [r for batch in store.game_logs_since(first[-1][0]) for r in batch]
+    points = 1 + GAME_LOG_COLUMNS.index("points")
+    results["game_logs"] = len(first) == len(second) == 1 and second[0][points] == 31
+
+    # Replacing the player-season drops the games the new rows no longer include
+    row.update(game_id="2", game_date="APR 16, 2024")
+    store.store_game_logs(GAME_LOG_COLUMNS, [tuple(row.values())], replace=(tag, "2023-24"))
+    player, game = 1 + GAME_LOG_COLUMNS.index("player_id"), 1 + GAME_LOG_COLUMNS.index("game_id")
+    remaining = [r[game] for batch in store.game_logs_since(0) for r in batch if r[player] == tag]
+    results["game_logs"] = results["game_logs"] and remaining == ["2"]
+
+    store.track_usage(tag, tag, "analysis")
+    store.track_usage(tag, tag, "analysis")
+    results["usage"] = store.usage_count(tag, 1) == 1
+
+    store.set_state(tag, "1")
+    store.set_state(tag, "2")
+    results["sync_state"] = store.get_state(tag) == "2"
+    return results
+
+
+def scratch_check(url: Optional[str]) -> Dict[str, bool]:
+    """check() in a throwaway schema (PostgreSQL) or temporary file (SQLite), never in live tables"""
+    if url and url.startswith(("postgres://", "postgresql://")):
+        store = PostgresStorage(url, schema=f"propstats_check_{uuid.uuid4().hex[:8]}")
+        try:
+            return check(store)
+        finally:
+            store.drop_schema()
+    with tempfile.TemporaryDirectory() as scratch:
+        store = SQLiteStorage(os.path.join(scratch, "check.db"))
+        try:
+            return check(store)
+        finally:
+            store.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared storage: schema, seeding, replica pulls and checks")
+    parser.add_argument("command", choices=["init", "push", "sync", "check"])
+    parser.add_argument("--url", default=os.getenv("STORAGE_URL"), help="postgresql://... or sqlite:///path")
+    parser.add_argument("--db", default=os.getenv("DATABASE_PATH", "nba_props.db"), help="Local SQLite database path")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    if args.command == "check":
+        result = scratch_check(args.url)
+        print(f"{'✅' if all(result.values()) else '❌'} check: {result} ({time.perf_counter() - started:.2f}s)")
+        if not all(result.values()):
+            raise SystemExit(1)
+        return
+
+    if not args.url:
+        parser.error("--url (or STORAGE_URL) is required")
+    store = open_storage(args.url, args.db)
+    try:
+        if args.command == "init":
+            result = {"url": args.url, "schema": "ready"}
+        elif args.command == "push":
+            result = push(args.db, store)
+        else:
+            result = sync_replica(store, args.db)
+        print(f"✅ {args.command}: {result} ({time.perf_counter() - started:.2f}s)")
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
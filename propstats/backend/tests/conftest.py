@@ -0,0 +1,35 @@
+import os
+import sqlite3
+import sys
+
+import pytest
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+
+import migrations  # noqa: E402
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """A migrated, empty database"""
+    path = str(tmp_path / "nba_props.db")
+    migrations.migrate(path)
+    return path
+
+
+@pytest.fixture
+def conn(db_path):
+    conn = sqlite3.connect(db_path)
+    yield conn
+    conn.close()
+
+
+def insert_game(conn, player_id="201939", game_id="1", game_date="OCT 22, 2025", season="2025-26", **stats):
+    """Write one game_logs row the way the ingest does (INSERT OR REPLACE on player_id, game_id)"""
+    row = dict(player_id=player_id, game_id=game_id, game_date=game_date, season=season, **stats)
+    with conn:
+        conn.execute(f"""
+            INSERT OR REPLACE INTO game_logs ({', '.join(row)}, fetched_at)
+            VALUES ({', '.join('?' * len(row))}, datetime('now'))
+        """, tuple(row.values()))
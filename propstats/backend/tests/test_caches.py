@@ -0,0 +1,61 @@
+"""In-process caches notice writes and clear-cache swaps made by other connections"""
+
+import sqlite3
+
+import pytest
+
+import lineups
+import migrations
+import probability
+from conftest import insert_game
+
+
+def test_write_sequence_moves_on_insert_replace_and_swap(db_path, conn):
+    sequences = [probability.write_sequence(conn.cursor())]
+    insert_game(conn, points=20)
+    sequences.append(probability.write_sequence(conn.cursor()))
+    insert_game(conn, points=21)
+    sequences.append(probability.write_sequence(conn.cursor()))
+    other = sqlite3.connect(db_path)
+    with other:
+        migrations.swap_empty(other, "game_logs")
+    sequences.append(probability.write_sequence(conn.cursor()))
+    assert len(set(sequences)) == len(sequences)
+    assert sequences[-1] == (1, sequences[-2][1])
+
+
+def test_fit_is_refit_after_another_connection_swaps_and_refills(db_path, conn):
+    probability.fit_cache.clear()
+    for i in range(5):
+        insert_game(conn, game_id=str(i + 1), points=20, minutes_played=30)
+    fit = probability.get_fits(conn.cursor(), "2025-26", [("201939", "points")])[("201939", "points")]
+    assert probability.get_fits(conn.cursor(), "2025-26", [("201939", "points")])[("201939", "points")] is fit
+
+    # Same row count and fetched_at second, new values
+    other = sqlite3.connect(db_path)
+    with other:
+        migrations.swap_empty(other, "game_logs")
+    for i in range(5):
+        insert_game(other, game_id=str(i + 1), points=30, minutes_played=30)
+    with other:
+        other.execute("UPDATE game_logs SET fetched_at = (SELECT MAX(fetched_at) FROM game_logs)")
+    refit = probability.get_fits(conn.cursor(), "2025-26", [("201939", "points")])[("201939", "points")]
+    assert refit is not fit
+    assert refit.mean == pytest.approx(30)
+
+
+def test_lineup_index_starts_over_after_swap(db_path, conn):
+    for i in range(3):
+        insert_game(conn, player_id="1", game_id=str(i + 1), team_abbreviation="BOS")
+    index = lineups.LineupIndex()
+    assert index.refresh(conn.cursor()) == 1
+    assert index.games("1", "2025-26")[0].tolist() == [1, 2, 3]
+    assert index.refresh(conn.cursor()) == 0
+
+    other = sqlite3.connect(db_path)
+    with other:
+        migrations.swap_empty(other, "game_logs")
+    insert_game(other, player_id="2", game_id="9", team_abbreviation="LAL")
+    assert index.refresh(conn.cursor()) == 1
+    assert index.games("1", "2025-26")[0].tolist() == []
+    assert index.games("2", "2025-26")[0].tolist() == [9]
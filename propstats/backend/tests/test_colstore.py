@@ -0,0 +1,41 @@
+"""A snapshot is only trusted while game_logs has not been written since it was exported"""
+
+import colstore
+from conftest import insert_game
+
+
+def _stored(conn, player_id):
+    return conn.execute("SELECT COUNT(*), MAX(id) FROM game_logs WHERE player_id = ?", (player_id,)).fetchone()
+
+
+def test_snapshot_matches_until_a_row_is_corrected(db_path, conn, tmp_path):
+    insert_game(conn, game_id="1", game_date="OCT 22, 2025", points=20)
+    insert_game(conn, game_id="2", game_date="OCT 24, 2025", points=25)
+    out = str(tmp_path / "game_logs.col")
+    exported = colstore.export_snapshot(db_path, out)
+    assert exported["max_id"] == colstore.source_version(conn)[0]
+
+    snapshot = colstore.ColumnarSnapshot(out)
+    games = snapshot.player_games("201939")
+    assert games["points"].tolist() == [25, 20]
+    assert snapshot.is_current(games, *_stored(conn, "201939"))
+
+    # Same row count, corrected value: only the new id gives it away
+    insert_game(conn, game_id="1", game_date="OCT 22, 2025", points=21)
+    assert _stored(conn, "201939")[0] == 2
+    assert not snapshot.is_current(games, *_stored(conn, "201939"))
+
+    colstore.export_snapshot(db_path, out)
+    snapshot = colstore.ColumnarSnapshot(out)
+    games = snapshot.player_games("201939")
+    assert games["points"].tolist() == [25, 21]
+    assert snapshot.is_current(games, *_stored(conn, "201939"))
+
+
+def test_snapshot_without_max_id_is_never_current(db_path, conn, tmp_path):
+    insert_game(conn)
+    out = str(tmp_path / "game_logs.col")
+    colstore.export_snapshot(db_path, out)
+    snapshot = colstore.ColumnarSnapshot(out)
+    del snapshot.header["max_id"]
+    assert not snapshot.is_current(snapshot.player_games("201939"), *_stored(conn, "201939"))
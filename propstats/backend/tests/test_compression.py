@@ -0,0 +1,31 @@
+"""Accept-Encoding negotiation"""
+
+import pytest
+
+import compression
+
+
+@pytest.mark.parametrize("header, supported, expected", [
+    ("gzip", ("gzip",), "gzip"),
+    ("GZIP, deflate", ("gzip",), "gzip"),
+    ("gzip;q=0", ("gzip",), None),
+    ("gzip; q=0.0, identity", ("gzip",), None),
+    ("gzip;q=0.5", ("gzip",), "gzip"),
+    ("gzip;q=nope", ("gzip",), None),
+    ("*", ("gzip",), "gzip"),
+    ("*;q=0", ("gzip",), None),
+    ("gzip;q=0, *", ("gzip",), None),
+    ("br;q=0, gzip", ("br", "gzip"), "gzip"),
+    ("br, gzip", ("br", "gzip"), "br"),
+    ("", ("gzip",), None),
+])
+def test_negotiate(header, supported, expected):
+    assert compression.negotiate(header, supported) == expected
+
+
+def test_compressed_bodies_are_cached_per_encoding_and_etag():
+    body = b"x" * 4096
+    first = compression.compress(body, "gzip", etag='"a"')
+    assert compression.compressed_cache.get(("gzip", '"a"')) is first
+    assert compression.compress(body, "gzip", etag='"a"') is first
+    assert compression.compressed_cache.get(("gzip", '"b"')) is None
@@ -0,0 +1,43 @@
+"""Queue order, merging, retries and lease expiry"""
+
+import sqlite3
+
+import ingest
+
+
+def test_waiting_jobs_first_then_oldest(db_path):
+    first = ingest.enqueue(db_path, "1", ["2025-26"])
+    second = ingest.enqueue(db_path, "2", ["2025-26"])
+    waiting = ingest.enqueue(db_path, "3", ["2025-26"], priority=ingest.PRIORITY_WAITING)
+    conn = sqlite3.connect(db_path)
+    assert [ingest.claim(conn, "w")["id"] for _ in range(3)] == [waiting, first, second]
+    assert ingest.claim(conn, "w") is None
+
+
+def test_waiting_request_merges_into_and_promotes_a_queued_job(db_path):
+    job_id = ingest.enqueue(db_path, "1", ["2025-26"], include_details=False)
+    assert ingest.enqueue(db_path, "1", ["2025-26"], priority=ingest.PRIORITY_WAITING) == job_id
+    job = ingest.claim(sqlite3.connect(db_path), "w")
+    assert (job["id"], job["priority"], job["include_details"]) == (job_id, ingest.PRIORITY_WAITING, True)
+
+
+def test_failed_job_is_retried_until_max_attempts(db_path):
+    ingest.enqueue(db_path, "1", ["2025-26"])
+    conn = sqlite3.connect(db_path)
+    statuses = [ingest.finish(conn, ingest.claim(conn, "w"), error="boom") for _ in range(ingest.MAX_ATTEMPTS)]
+    assert statuses == ["queued"] * (ingest.MAX_ATTEMPTS - 1) + ["failed"]
+    assert ingest.claim(conn, "w") is None
+
+
+def test_expired_lease_is_requeued(db_path):
+    job_id = ingest.enqueue(db_path, "1", ["2025-26"])
+    conn = sqlite3.connect(db_path)
+    ingest.claim(conn, "crashed")
+    assert ingest.housekeeping(conn)["expired"] == 0
+    with conn:
+        conn.execute("UPDATE ingest_jobs SET lease_until = 0 WHERE id = ?", (job_id,))
+    assert ingest.housekeeping(conn)["expired"] == 1
+
+    job = ingest.claim(conn, "w")
+    assert (job["id"], job["attempts"]) == (job_id, 2)
+    assert ingest.finish(conn, job, games=10) == "done"
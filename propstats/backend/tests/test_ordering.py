@@ -0,0 +1,34 @@
+"""Games come back in calendar order, not in the order of their 'APR 14, 2024' text"""
+
+import defense
+import probability
+import query_audit
+from conftest import BACKEND, insert_game
+
+# Alphabetical by month name this would be APR, DEC, JAN, OCT
+DATES = ["OCT 22, 2025", "DEC 30, 2025", "JAN 05, 2026", "APR 12, 2026"]
+
+
+def test_game_day_is_iso(conn):
+    insert_game(conn, game_date="APR 14, 2024")
+    insert_game(conn, game_id="2", game_date="2024-04-16")
+    assert [row[0] for row in conn.execute("SELECT game_day FROM game_logs ORDER BY id")] == ["2024-04-14", "2024-04-16"]
+
+
+def test_newest_first_across_months(conn):
+    for i, game_date in enumerate(DATES):
+        insert_game(conn, game_id=str(i + 1), game_date=game_date, points=i, opponent_abbreviation="BOS")
+    ordered = [row[0] for row in conn.execute("SELECT game_date FROM game_logs ORDER BY game_day DESC")]
+    assert ordered == DATES[::-1]
+
+    values, _ = probability.load_games(conn.cursor(), "201939", "2025-26", "points")
+    assert values.tolist() == [3.0, 2.0, 1.0, 0.0]
+
+    history = defense.opponent_history(conn.cursor(), "201939", "BOS", "points", 0.5)
+    assert [game["date"] for game in history] == DATES[::-1]
+
+
+def test_no_text_date_ordering_in_sources():
+    assert query_audit.source_problems(BACKEND) == []
+    assert query_audit.ordering_problems("SELECT * FROM game_logs ORDER BY game_date DESC")
+    assert not query_audit.ordering_problems("SELECT * FROM game_logs ORDER BY game_day DESC")
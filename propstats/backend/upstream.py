@@ -0,0 +1,435 @@
+"""
+PropStats Upstream Client
+Rate-limited access to stats.nba.com through nba_api, with record/replay backends
+
+Modes (UPSTREAM_MODE):
+  live    - call stats.nba.com (or NBA_STATS_BASE_URL, e.g. the local stand-in server)
+  record  - call live and save every raw JSON payload under UPSTREAM_FIXTURES
+  replay  - serve payloads from UPSTREAM_FIXTURES only, never touching the network
+
+Every call goes through a circuit breaker. It opens after UPSTREAM_BREAKER_FAILURES
+consecutive failures, or once UPSTREAM_BREAKER_FAILURE_RATE of the last
+UPSTREAM_BREAKER_WINDOW calls failed. Failures are timeouts, connection errors, 5xx and
+403/429 blocks. While open, calls fail at once with CircuitOpen. After the cooldown, the
+breaker goes half-open and lets UPSTREAM_BREAKER_PROBES calls through: a success closes it,
+a failure reopens it with the cooldown doubled, up to UPSTREAM_BREAKER_MAX_COOLDOWN.
+
+Requests bound their upstream work with `with upstream.deadline():` (UPSTREAM_DEADLINE
+seconds). Rate-limit waits and HTTP timeouts are cut to what is left, a call that cannot
+start in time fails with DeadlineExceeded, and the budget collects every error its calls
+hit, so the request can tell a failed refresh from an empty one.
+"""
+
+import contextvars
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+from nba_api.stats.endpoints import playergamelog, commonplayerinfo, commonallplayers
+from nba_api.stats.library.http import NBAStatsHTTP
+
+import metrics
+from metrics import UPSTREAM_REQUESTS, span
+
+MIN_INTERVAL = float(os.getenv("UPSTREAM_MIN_INTERVAL", "0.6"))  # Seconds between upstream calls, shared by all threads
+TIMEOUT = float(os.getenv("UPSTREAM_TIMEOUT", "30"))
+UPSTREAM_MODE = os.getenv("UPSTREAM_MODE", "live")
+FIXTURES_DIR = os.getenv("UPSTREAM_FIXTURES", "fixtures")
+NBA_STATS_BASE_URL = os.getenv("NBA_STATS_BASE_URL", "")  # e.g. http://127.0.0.1:8765/stats/{endpoint}
+DEADLINE = float(os.getenv("UPSTREAM_DEADLINE", "8"))  # Upstream budget of one request, across all its calls
+BREAKER_FAILURES = int(os.getenv("UPSTREAM_BREAKER_FAILURES", "5"))  # Consecutive failures that open the breaker
+BREAKER_WINDOW = int(os.getenv("UPSTREAM_BREAKER_WINDOW", "20"))  # Recent calls the failure rate is taken over
+BREAKER_FAILURE_RATE = float(os.getenv("UPSTREAM_BREAKER_FAILURE_RATE", "0.5"))  # Opens once the window is this bad
+BREAKER_COOLDOWN = float(os.getenv("UPSTREAM_BREAKER_COOLDOWN", "30"))  # Seconds open before the first probe
+BREAKER_MAX_COOLDOWN = float(os.getenv("UPSTREAM_BREAKER_MAX_COOLDOWN", "300"))
+BREAKER_PROBES = int(os.getenv("UPSTREAM_BREAKER_PROBES", "1"))  # Concurrent calls allowed while half-open
+
+BREAKER_STATES = ("closed", "half_open", "open")
+
+BREAKER_OPEN = metrics.register(metrics.Gauge(
+    "propstats_upstream_breaker_open", "1 while the stats.nba.com circuit breaker refuses calls"
+))
+BREAKER_STATE = metrics.register(metrics.Gauge(
+    "propstats_upstream_breaker_state", "Circuit breaker state: 0 closed, 1 half-open, 2 open"
+))
+BREAKER_TRANSITIONS = metrics.register(metrics.Counter(
+    "propstats_upstream_breaker_transitions_total", "Circuit breaker state changes", ("state",)
+))
+BREAKER_REJECTED = metrics.register(metrics.Counter(
+    "propstats_upstream_breaker_rejected_total", "Upstream calls refused by the open circuit breaker", ("endpoint",)
+))
+STALE_SERVED = metrics.register(metrics.Counter(
+    "propstats_stale_responses_total", "Responses served from stored data because a refresh failed", ("reason",)
+))
+DEADLINES_EXCEEDED = metrics.register(metrics.Counter(
+    "propstats_upstream_deadline_exceeded_total", "Upstream calls not started because the request's budget ran out", ("endpoint",)
+))
+
+
+class UpstreamError(Exception):
+    """Non-2xx or unusable response from stats.nba.com"""
+
+    def __init__(self, message: str, status_code: int = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class CircuitOpen(UpstreamError):
+    """Call refused by the circuit breaker without reaching stats.nba.com"""
+
+    def __init__(self, endpoint: str, retry_in: float):
+        super().__init__(f"{endpoint} not called: stats.nba.com circuit open for {retry_in:.0f}s", 503)
+        self.retry_in = retry_in
+
+
+class DeadlineExceeded(UpstreamError):
+    """Call not started because the request's upstream budget is spent"""
+
+    def __init__(self, endpoint: str):
+        super().__init__(f"{endpoint} not called: upstream deadline exceeded", 504)
+
+
+# Calls that never reached stats.nba.com: they say nothing about the upstream or the player
+NOT_SENT = (CircuitOpen, DeadlineExceeded)
+
+
+def is_outage(error: Exception) -> bool:
+    """Failures that say stats.nba.com is down or blocking us, as opposed to a bad request"""
+    if isinstance(error, NOT_SENT):
+        return False
+    if isinstance(error, UpstreamError):
+        return error.status_code is None or error.status_code >= 500 or error.status_code in (403, 429)
+    return True
+
+
+class CircuitBreaker:
+    """closed -> open on too many failures -> half-open after the cooldown -> closed on a good probe"""
+
+    def __init__(self, failures: int = BREAKER_FAILURES, window: int = BREAKER_WINDOW,
+                 failure_rate: float = BREAKER_FAILURE_RATE, cooldown: float = BREAKER_COOLDOWN,
+                 max_cooldown: float = BREAKER_MAX_COOLDOWN, probes: int = BREAKER_PROBES):
+        self.failures = failures
+        self.failure_rate = failure_rate
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.probes = probes
+        self._lock = threading.Lock()
+        self._outcomes = deque(maxlen=window)  # True for a failure
+        self._consecutive = 0
+        self._cooldown = cooldown
+        self._open_until = 0.0
+        self._probing = 0
+        self.state = "closed"
+        self.opened_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    def _set_state(self, state: str):
+        if state != self.state:
+            self.state = state
+            BREAKER_TRANSITIONS.inc(state)
+        BREAKER_STATE.set(BREAKER_STATES.index(state))
+        BREAKER_OPEN.set(1 if state == "open" else 0)
+
+    def acquire(self, endpoint: str) -> bool:
+        """Admit a call or raise CircuitOpen; True if the call is a half-open probe"""
+        with self._lock:
+            now = time.monotonic()
+            if self.state == "open" and now >= self._open_until:
+                self._set_state("half_open")
+            if self.state == "closed":
+                return False
+            if self.state == "half_open" and self._probing < self.probes:
+                self._probing += 1
+                return True
+            retry_in = max(self._open_until - now, 0.0)
+        BREAKER_REJECTED.inc(endpoint)
+        raise CircuitOpen(endpoint, retry_in)
+
+    def record(self, error: Exception = None, probe: bool = False):
+        """Outcome of an admitted call; errors that are not outages count as successes"""
+        failed = error is not None and is_outage(error)
+        with self._lock:
+            if probe:
+                self._probing -= 1
+            if failed:
+                self.last_error = f"{type(error).__name__}: {error}"
+            if self.state == "half_open" and probe:
+                if failed:
+                    self._open(min(self._cooldown * 2, self.max_cooldown))
+                else:
+                    self._outcomes.clear()
+                    self._consecutive = 0
+                    self._cooldown = self.base_cooldown
+                    self._set_state("closed")
+                    print("✅ stats.nba.com circuit closed")
+                return
+            if self.state != "closed":
+                return
+            self._outcomes.append(failed)
+            self._consecutive = self._consecutive + 1 if failed else 0
+            window_failures = sum(self._outcomes)
+            if self._consecutive >= self.failures or (
+                len(self._outcomes) == self._outcomes.maxlen and window_failures >= self.failure_rate * len(self._outcomes)
+            ):
+                self._open(self.base_cooldown)
+
+    def _open(self, cooldown: float):
+        self._cooldown = cooldown
+        self._open_until = time.monotonic() + cooldown
+        self.opened_at = time.time()
+        self._set_state("open")
+        print(f"⚠️  stats.nba.com circuit open for {cooldown:.0f}s ({self.last_error})")
+
+    def is_open(self) -> bool:
+        """True while calls are being refused (open and not yet due for a probe)"""
+        return self.state == "open" and time.monotonic() < self._open_until
+
+    def status(self) -> Dict:
+        with self._lock:
+            failures = sum(self._outcomes)
+            return {
+                "state": "half_open" if self.state == "open" and time.monotonic() >= self._open_until else self.state,
+                "retry_in": round(max(self._open_until - time.monotonic(), 0.0), 1) if self.state == "open" else 0.0,
+                "cooldown": self._cooldown,
+                "recent_calls": len(self._outcomes),
+                "recent_failures": failures,
+                "consecutive_failures": self._consecutive,
+                "opened_at": self.opened_at,
+                "last_error": self.last_error,
+            }
+
+
+class Budget:
+    """Upstream deadline shared by every call of one request, and the (endpoint, error) pairs they ran into"""
+
+    def __init__(self, seconds: float):
+        self.deadline = time.monotonic() + seconds
+        self.errors: List[Tuple[str, Exception]] = []
+
+    def remaining(self) -> float:
+        return self.deadline - time.monotonic()
+
+    @property
+    def failed(self) -> bool:
+        return bool(self.errors)
+
+
+def served_stale(budget: Budget, endpoint: str = "playergamelog") -> Optional[str]:
+    """Why the `endpoint` calls under `budget` fell back to stored data, or None if they did not; counted per reason
+
+    Only the game log fetch decides: a failed player-details call leaves the games current.
+    """
+    errors = [error for name, error in budget.errors if name.lower() == endpoint]
+    if not errors:
+        return None
+    error = errors[-1]
+    if isinstance(error, CircuitOpen):
+        reason = "circuit_open"
+    elif isinstance(error, DeadlineExceeded):
+        reason = "deadline"
+    else:
+        reason = "upstream_error"
+    STALE_SERVED.inc(reason)
+    return reason
+
+
+def retry_after() -> int:
+    """Seconds a client should wait before retrying a request that needed stats.nba.com"""
+    return max(1, int(breaker.status()["retry_in"]) or int(BREAKER_COOLDOWN))
+
+
+_budget: contextvars.ContextVar = contextvars.ContextVar("upstream_budget", default=None)
+
+
+@contextmanager
+def deadline(seconds: float = DEADLINE):
+    """Bound the upstream calls made inside the block (including copied contexts) to `seconds` in total"""
+    budget = Budget(seconds)
+    token = _budget.set(budget)
+    try:
+        yield budget
+    finally:
+        _budget.reset(token)
+
+
+class RateLimiter:
+    """Spaces call start times at least `interval` seconds apart across threads"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def wait(self, max_wait: float = None) -> bool:
+        """Sleep until this call's slot; False, without taking a slot, if that is more than `max_wait` away"""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            if max_wait is not None and slot - now > max_wait:
+                return False
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+        return True
+
+
+limiter = RateLimiter(MIN_INTERVAL)
+
+
+def fixture_path(endpoint: str, params: Dict, fixtures_dir: str = None) -> str:
+    """Stable file name for one request; empty parameters are ignored"""
+    key = "_".join(f"{k}={v}" for k, v in sorted(params.items()) if v not in (None, ""))
+    key = re.sub(r"[^A-Za-z0-9=.-]+", "_", key) or "default"
+    return os.path.join(fixtures_dir or FIXTURES_DIR, endpoint.lower(), f"{key}.json")
+
+
+class LiveBackend:
+    """Real HTTP calls through nba_api, spaced by the shared rate limiter"""
+
+    def __init__(self, base_url: str = ""):
+        self.http = NBAStatsHTTP()
+        if base_url:
+            self.http.base_url = base_url
+
+    def fetch(self, endpoint: str, params: Dict, timeout: float = TIMEOUT) -> dict:
+        started = time.monotonic()
+        with span("rate_limit_wait"):
+            if not limiter.wait(max_wait=timeout if timeout < TIMEOUT else None):
+                DEADLINES_EXCEEDED.inc(endpoint)
+                raise DeadlineExceeded(endpoint)
+        timeout -= time.monotonic() - started
+        if timeout <= 0:
+            DEADLINES_EXCEEDED.inc(endpoint)
+            raise DeadlineExceeded(endpoint)
+        try:
+            with span("upstream"):
+                response = self.http.send_api_request(endpoint=endpoint, parameters=params, timeout=timeout)
+        except Exception:
+            UPSTREAM_REQUESTS.inc(endpoint, "error")
+            raise
+        status = response._status_code
+        UPSTREAM_REQUESTS.inc(endpoint, status)
+        if status is not None and status >= 400:
+            raise UpstreamError(f"{endpoint} returned HTTP {status}", status)
+        try:
+            return response.get_dict()
+        except ValueError:
+            raise UpstreamError(f"{endpoint} returned invalid JSON", status)
+
+
+class RecordBackend(LiveBackend):
+    """Live calls whose raw payloads are saved as replay fixtures"""
+
+    def __init__(self, fixtures_dir: str, base_url: str = ""):
+        super().__init__(base_url)
+        self.fixtures_dir = fixtures_dir
+
+    def fetch(self, endpoint: str, params: Dict, timeout: float = TIMEOUT) -> dict:
+        data = super().fetch(endpoint, params, timeout)
+        path = fixture_path(endpoint, params, self.fixtures_dir)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(data, f)
+        return data
+
+
+class ReplayBackend:
+    """Serves recorded fixtures; a missing fixture is an upstream error"""
+
+    def __init__(self, fixtures_dir: str):
+        self.fixtures_dir = fixtures_dir
+
+    def fetch(self, endpoint: str, params: Dict, timeout: float = TIMEOUT) -> dict:
+        path = fixture_path(endpoint, params, self.fixtures_dir)
+        try:
+            with open(path) as f:
+                data = json.load(f)
+            UPSTREAM_REQUESTS.inc(endpoint, "replay")
+            return data
+        except FileNotFoundError:
+            UPSTREAM_REQUESTS.inc(endpoint, "replay_miss")
+            raise UpstreamError(f"No fixture for {endpoint}: {path}", 404)
+
+
+def make_backend(mode: str = UPSTREAM_MODE, fixtures_dir: str = FIXTURES_DIR, base_url: str = NBA_STATS_BASE_URL):
+    if mode == "replay":
+        return ReplayBackend(fixtures_dir)
+    if mode == "record":
+        return RecordBackend(fixtures_dir, base_url)
+    if mode == "live":
+        return LiveBackend(base_url)
+    raise ValueError(f"Unknown UPSTREAM_MODE: {mode}")
+
+
+backend = make_backend()
+
+
+breaker = CircuitBreaker()
+
+
+def set_backend(new_backend):
+    """Swap the process-wide backend (benchmarks, scripts)"""
+    global backend
+    backend = new_backend
+
+
+def set_limiter(new_limiter):
+    """Swap the process-wide rate limiter (ingest workers share one across processes)"""
+    global limiter
+    limiter = new_limiter
+
+
+def fetch(endpoint: str, params: Dict) -> dict:
+    """Raw stats.nba.com payload for an endpoint and its query parameters"""
+    budget = _budget.get()
+    try:
+        timeout = TIMEOUT
+        if budget is not None:
+            timeout = min(TIMEOUT, budget.remaining())
+            if timeout <= 0:
+                DEADLINES_EXCEEDED.inc(endpoint)
+                raise DeadlineExceeded(endpoint)
+        probe = breaker.acquire(endpoint)
+        try:
+            data = backend.fetch(endpoint, params, timeout)
+        except Exception as e:
+            breaker.record(e, probe)
+            raise
+        breaker.record(None, probe)
+        return data
+    except Exception as e:
+        if budget is not None:
+            budget.errors.append((endpoint, e))
+        raise
+
+
+def player_game_log(player_id: str, season: str) -> dict:
+    """Raw playergamelog payload for one regular season"""
+    request = playergamelog.PlayerGameLog(
+        player_id=player_id,
+        season=season,
+        season_type_all_star='Regular Season',
+        get_request=False
+    )
+    return fetch(request.endpoint, request.parameters)
+
+
+def player_info(player_id: str) -> dict:
+    """Raw commonplayerinfo payload"""
+    request = commonplayerinfo.CommonPlayerInfo(player_id=player_id, get_request=False)
+    return fetch(request.endpoint, request.parameters)
+
+
+def all_players(season: str, current_only: bool = True) -> dict:
+    """Raw commonallplayers payload"""
+    request = commonallplayers.CommonAllPlayers(
+        season=season,
+        is_only_current_season=1 if current_only else 0,
+        get_request=False
+    )
+    return fetch(request.endpoint, request.parameters)
@@ -0,0 +1,281 @@
+"""
+PropStats Upstream Stand-in
+Local HTTP server that impersonates stats.nba.com for benchmarks, load tests and CI
+
+Serves recorded fixtures (see upstream.py record mode) at /stats/{endpoint}, optionally
+falling back to deterministic synthetic payloads, and can inject latency, 429s and timeouts.
+
+Usage:
+  python upstream_server.py --port 8765 --latency 0.25 --rate-429 0.05 --timeout-rate 0.01 --synthetic
+  NBA_STATS_BASE_URL=http://127.0.0.1:8765/stats/{endpoint} uvicorn main:app
+"""
+
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+from urllib.parse import parse_qsl, urlparse
+
+from upstream import FIXTURES_DIR, fixture_path
+
+TEAMS = [
+    "ATL", "BOS", "BKN", "CHA", "CHI", "CLE", "DAL", "DEN", "DET", "GSW",
+    "HOU", "IND", "LAC", "LAL", "MEM", "MIA", "MIL", "MIN", "NOP", "NYK",
+    "OKC", "ORL", "PHI", "PHX", "POR", "SAC", "SAS", "TOR", "UTA", "WAS",
+]
+
+GAMELOG_HEADERS = [
+    "SEASON_ID", "Player_ID", "Game_ID", "GAME_DATE", "MATCHUP", "WL", "MIN",
+    "FGM", "FGA", "FG_PCT", "FG3M", "FG3A", "FG3_PCT", "FTM", "FTA", "FT_PCT",
+    "OREB", "DREB", "REB", "AST", "STL", "BLK", "TOV", "PF", "PTS", "PLUS_MINUS",
+    "VIDEO_AVAILABLE",
+]
+
+
+def player_team(player_id: int) -> str:
+    return TEAMS[player_id % len(TEAMS)]
+
+
+def synthetic_game_log(player_id: int, season: str, games: int = 82) -> dict:
+    """Deterministic 82-game regular season for any player id"""
+    rng = random.Random(f"{player_id}-{season}")
+    start_year = int(season[:4])
+    team = player_team(player_id)
+    opponents = [t for t in TEAMS if t != team]
+    scale = rng.uniform(0.4, 1.6)
+    first_game = date(start_year, 10, 22)
+
+    rows = []
+    for g in range(games):
+        day = first_game + timedelta(days=g * 2 + rng.randint(0, 1))
+        home = rng.random() < 0.5
+        opponent = rng.choice(opponents)
+        minutes = max(0, int(rng.gauss(28 * min(scale, 1.2), 6)))
+        fga = int(minutes * 0.45 * scale)
+        fgm = int(fga * rng.uniform(0.35, 0.6))
+        fg3a = int(fga * 0.35)
+        fg3m = int(fg3a * rng.uniform(0.2, 0.45))
+        fta = int(rng.uniform(0, 8) * scale)
+        ftm = int(fta * rng.uniform(0.6, 0.9))
+        oreb = int(rng.uniform(0, 3) * scale)
+        dreb = int(rng.uniform(1, 8) * scale)
+        rows.append([
+            f"2{start_year}", player_id, f"002{start_year % 100:02d}{g + 1:05d}",
+            day.strftime("%b %d, %Y").upper(),
+            f"{team} vs. {opponent}" if home else f"{team} @ {opponent}",
+            rng.choice("WL"), minutes,
+            fgm, fga, round(fgm / fga, 3) if fga else 0, fg3m, fg3a,
+            round(fg3m / fg3a, 3) if fg3a else 0, ftm, fta, round(ftm / fta, 3) if fta else 0,
+            oreb, dreb, oreb + dreb, int(rng.uniform(0, 8) * scale), rng.randint(0, 3),
+            rng.randint(0, 2), rng.randint(0, 4), rng.randint(0, 5),
+            2 * fgm + fg3m + ftm, rng.randint(-20, 20), 1,
+        ])
+    rows.reverse()  # stats.nba.com returns newest first
+    return {
+        "resource": "playergamelog",
+        "parameters": {"PlayerID": player_id, "Season": season, "SeasonType": "Regular Season"},
+        "resultSets": [{"name": "PlayerGameLog", "headers": GAMELOG_HEADERS, "rowSet": rows}],
+    }
+
+
+def synthetic_player_info(player_id: int) -> dict:
+    team = player_team(player_id)
+    rng = random.Random(player_id)
+    return {
+        "resource": "commonplayerinfo",
+        "parameters": {"PlayerID": player_id},
+        "resultSets": [{
+            "name": "CommonPlayerInfo",
+            "headers": ["PERSON_ID", "DISPLAY_FIRST_LAST", "TEAM_ID", "TEAM_ABBREVIATION",
+                        "TEAM_NAME", "POSITION", "HEIGHT", "WEIGHT", "JERSEY"],
+            "rowSet": [[player_id, f"Player {player_id}", 1610612700 + TEAMS.index(team), team,
+                        team, rng.choice(["Guard", "Forward", "Center", "Guard-Forward"]),
+                        f"6-{rng.randint(0, 11)}", str(rng.randint(180, 260)), str(rng.randint(0, 99))]],
+        }],
+    }
+
+
+def synthetic_all_players(season: str) -> dict:
+    from nba_api.stats.static import players
+    rows = []
+    for p in players.get_active_players():
+        rows.append([p["id"], f"{p['last_name']}, {p['first_name']}", p["full_name"], 1,
+                     season[:4], season[:4], "", 0, player_team(p["id"])])
+    return {
+        "resource": "commonallplayers",
+        "resultSets": [{
+            "name": "CommonAllPlayers",
+            "headers": ["PERSON_ID", "DISPLAY_LAST_COMMA_FIRST", "DISPLAY_FIRST_LAST", "ROSTERSTATUS",
+                        "FROM_YEAR", "TO_YEAR", "PLAYERCODE", "TEAM_ID", "TEAM_ABBREVIATION"],
+            "rowSet": rows,
+        }],
+    }
+
+
+def synthetic_schedule(season: str) -> dict:
+    """scheduleleaguev2-shaped regular season: every team plays roughly every other night, 7:30 pm ET"""
+    rng = random.Random(f"schedule-{season}")
+    start_year = int(season[:4])
+    first_day = date(start_year, 10, 22)
+    game_dates = []
+    number = 0
+    for d in range(165):
+        day = first_day + timedelta(days=d)
+        teams = TEAMS[:]
+        rng.shuffle(teams)
+        games = []
+        for home, away in zip(teams[0:14:2], teams[1:14:2]):
+            number += 1
+            games.append({
+                "gameId": f"002{start_year % 100:02d}{number:05d}",
+                "gameDateTimeUTC": (day + timedelta(days=1)).strftime("%Y-%m-%dT00:30:00Z"),
+                "homeTeam": {"teamTricode": home},
+                "awayTeam": {"teamTricode": away},
+            })
+        game_dates.append({"gameDate": day.strftime("%m/%d/%Y 00:00:00"), "games": games})
+    return {"leagueSchedule": {"seasonYear": season, "leagueId": "00", "gameDates": game_dates}}
+
+
+def synthetic_payload(endpoint: str, params: Dict[str, str]) -> Optional[dict]:
+    try:
+        if endpoint == "playergamelog":
+            return synthetic_game_log(int(params["PlayerID"]), params.get("Season", "2024-25"))
+        if endpoint == "commonplayerinfo":
+            return synthetic_player_info(int(params["PlayerID"]))
+        if endpoint == "commonallplayers":
+            return synthetic_all_players(params.get("Season", "2024-25"))
+        if endpoint == "scheduleleaguev2":
+            return synthetic_schedule(params.get("Season", "2024-25"))
+    except (KeyError, ValueError):
+        pass
+    return None
+
+
+class StandInConfig:
+    """Fault-injection settings and counters shared by all handler threads"""
+
+    def __init__(self, fixtures_dir=FIXTURES_DIR, latency=0.0, jitter=0.0, rate_429=0.0,
+                 timeout_rate=0.0, hang_seconds=60.0, synthetic=False, seed=None):
+        self.fixtures_dir = fixtures_dir
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_429 = rate_429
+        self.timeout_rate = timeout_rate
+        self.hang_seconds = hang_seconds
+        self.synthetic = synthetic
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = {"requests": 0, "ok": 0, "429": 0, "timeouts": 0, "404": 0}
+
+    def count(self, key: str):
+        with self.lock:
+            self.counts[key] += 1
+
+    def roll(self) -> float:
+        with self.lock:
+            return self.rng.random()
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    config: StandInConfig = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status: int, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        config = self.config
+        url = urlparse(self.path)
+        if url.path == "/_stats":
+            return self.send_json(200, config.counts)
+        if not url.path.startswith("/stats/"):
+            return self.send_json(404, {"error": "unknown path"})
+
+        config.count("requests")
+        endpoint = url.path[len("/stats/"):].strip("/").lower()
+        params = dict(parse_qsl(url.query, keep_blank_values=True))
+
+        delay = config.latency + (config.roll() * config.jitter if config.jitter else 0)
+        if delay > 0:
+            time.sleep(delay)
+
+        roll = config.roll()
+        if roll < config.timeout_rate:
+            config.count("timeouts")
+            time.sleep(config.hang_seconds)
+            return self.send_json(504, {"error": "timeout"})
+        if roll < config.timeout_rate + config.rate_429:
+            config.count("429")
+            return self.send_json(429, {"error": "rate limited"})
+
+        payload = None
+        path = fixture_path(endpoint, params, config.fixtures_dir)
+        if os.path.exists(path):
+            with open(path) as f:
+                payload = json.load(f)
+        elif config.synthetic:
+            payload = synthetic_payload(endpoint, params)
+
+        if payload is None:
+            config.count("404")
+            return self.send_json(404, {"error": f"no fixture for {endpoint}"})
+        config.count("ok")
+        self.send_json(200, payload)
+
+
+def make_server(host: str = "127.0.0.1", port: int = 8765, **settings) -> ThreadingHTTPServer:
+    """Build (but don't start) a stand-in server; port 0 picks a free port"""
+    handler = type("ConfiguredStandInHandler", (StandInHandler,), {"config": StandInConfig(**settings)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def start_in_background(**settings) -> ThreadingHTTPServer:
+    """Run a stand-in server on a daemon thread; returns it with base_url set"""
+    server = make_server(**settings)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address[:2]
+    server.base_url = f"http://{host}:{port}/stats/{{endpoint}}"
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stats.nba.com stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--fixtures", default=FIXTURES_DIR, help="Recorded fixture directory")
+    parser.add_argument("--latency", type=float, default=0.0, help="Base seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random seconds, uniform [0, jitter)")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="Fraction of requests that hang")
+    parser.add_argument("--hang", type=float, default=60.0, help="Seconds a hanging request stalls")
+    parser.add_argument("--synthetic", action="store_true", help="Generate payloads when no fixture exists")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    server = make_server(
+        args.host, args.port,
+        fixtures_dir=args.fixtures, latency=args.latency, jitter=args.jitter,
+        rate_429=args.rate_429, timeout_rate=args.timeout_rate, hang_seconds=args.hang,
+        synthetic=args.synthetic, seed=args.seed,
+    )
+    print(f"🏀 stats.nba.com stand-in on http://{args.host}:{args.port}/stats/{{endpoint}}")
+    print(f"   fixtures={args.fixtures} latency={args.latency}s 429={args.rate_429} timeouts={args.timeout_rate}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()